@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import TokenUsage
+
+
+@admin.register(TokenUsage)
+class TokenUsageAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'purpose', 'model_name', 'input_tokens', 'output_tokens', 'cached_tokens', 'estimated', 'latency_ms')
+    list_filter = ('purpose', 'model_name', 'estimated')
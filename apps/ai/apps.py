@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class AiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ai'
+
+    def ready(self):
+        # Store the token usage of every Gemini call. Importing the service
+        # module is cheap: the SDK itself is only loaded on first use.
+        from services import ai_google
+        from .models import TokenUsage
+
+        if TokenUsage.record not in ai_google.USAGE_RECORDERS:
+            ai_google.USAGE_RECORDERS.append(TokenUsage.record)
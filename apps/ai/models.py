@@ -1,3 +1,32 @@
 from django.db import models
 
-# Create your models here.
+
+class TokenUsage(models.Model):
+    """
+    Token counts and latency of a single Gemini call, for tracking cost and
+    latency together.
+    """
+    purpose = models.CharField(max_length=50)
+    model_name = models.CharField(max_length=100)
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    cached_tokens = models.PositiveIntegerField(default=0)
+    # True when the response had no usage metadata and the counts were
+    # estimated locally from the text length.
+    estimated = models.BooleanField(default=False)
+    history_turns = models.PositiveIntegerField(default=0)
+    latency_ms = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.purpose}: {self.input_tokens} in / {self.output_tokens} out ({self.latency_ms:.0f} ms)"
+
+    @classmethod
+    def record(cls, usage: dict):
+        """
+        Stores a usage record produced by AIGoogleService.
+        """
+        cls.objects.create(**usage)
@@ -1,3 +1,239 @@
-from django.test import TestCase
+import json
+import math
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from movies import recommender
+from services import ai_google
+from movies.models import TasteProfile, Watchlist
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-l1'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-l2'},
+}
+
+
+def features(genres, recommendations=()):
+    return {
+        'genres': genres,
+        'keywords': [],
+        'cast': [],
+        'recommendations': [{'id': movie_id, 'title': f'Movie {movie_id}', 'genre_ids': genres} for movie_id in recommendations],
+    }
+
+
+class SparseVectorTests(SimpleTestCase):
+    def test_feature_vector_is_normalized(self):
+        vector = recommender.feature_vector(genres=[1, 2], keywords=[3], cast=[4])
+        self.assertAlmostEqual(math.sqrt(sum(w * w for w in vector.values())), 1.0)
+        self.assertGreater(vector['g1'], vector['k3'])
+
+    def test_empty_vector(self):
+        self.assertEqual(recommender.feature_vector(), {})
+
+    def test_dot(self):
+        a = recommender.feature_vector(genres=[1, 2])
+        self.assertAlmostEqual(recommender.dot(a, a), 1.0)
+        self.assertEqual(recommender.dot(a, recommender.feature_vector(genres=[3])), 0.0)
+        self.assertAlmostEqual(recommender.dot(a, recommender.feature_vector(genres=[1])), 1 / math.sqrt(2))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TasteProfileTests(TestCase):
+    FEATURES = {
+        1: features([28], recommendations=[10, 11]),
+        2: features([28, 12], recommendations=[11, 12]),
+        3: features([35], recommendations=[13]),
+    }
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        self.user = User.objects.create_user('viewer')
+        tmdb = mock.Mock()
+        tmdb.get_movie_features.side_effect = self.FEATURES.get
+        tmdb.peek_movie_features.return_value = None
+        patcher = mock.patch.object(recommender, 'get_tmdb_service', return_value=tmdb)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add(self, *movie_ids):
+        for movie_id in movie_ids:
+            Watchlist.objects.create(user=self.user, movie_id=movie_id, title=f'Movie {movie_id}')
+
+    def test_incremental_updates_match_a_rebuild(self):
+        self.add(1)
+        recommender.rebuild_profile(self.user)
+        self.add(2, 3)
+        recommender.on_watchlist_added(self.user, 2)
+        recommender.on_watchlist_added(self.user, 3)
+        Watchlist.objects.filter(movie_id=3).delete()
+        recommender.on_watchlist_removed(self.user, 3)
+        incremental = TasteProfile.objects.get(user=self.user)
+
+        rebuilt = recommender.rebuild_profile(self.user)
+        self.assertEqual(sorted(incremental.item_ids), sorted(rebuilt.item_ids))
+        self.assertEqual(set(incremental.candidates), set(rebuilt.candidates))
+        self.assertEqual(set(incremental.vector), set(rebuilt.vector))
+        for feature, weight in rebuilt.vector.items():
+            self.assertAlmostEqual(incremental.vector[feature], weight)
+
+    def test_removing_an_item_drops_its_candidates(self):
+        self.add(1, 3)
+        profile = recommender.rebuild_profile(self.user)
+        self.assertIn('13', profile.candidates)
+
+        recommender.on_watchlist_removed(self.user, 3)
+        profile.refresh_from_db()
+        self.assertNotIn('13', profile.candidates)
+        self.assertNotIn('g35', profile.vector)
+
+    def test_failed_features_are_kept_pending(self):
+        self.add(1, 99)
+        profile = recommender.rebuild_profile(self.user)
+        self.assertEqual(profile.item_ids, [1])
+        self.assertEqual(profile.pending_ids, [99])
+
+    def test_candidates_agreed_on_by_more_items_rank_first(self):
+        self.add(1, 2)
+        recommender.rebuild_profile(self.user)
+        ranked = recommender.recommend_for_user(self.user, limit=3)
+        self.assertEqual(ranked[0]['id'], 11)
+        self.assertEqual({card['id'] for card in ranked}, {10, 11, 12})
+
+    def test_watchlisted_movies_are_not_recommended(self):
+        self.add(1, 11)
+        recommender.rebuild_profile(self.user)
+        self.assertNotIn(11, [card['id'] for card in recommender.recommend_for_user(self.user)])
+
+    @mock.patch.object(recommender, 'schedule_profile_build')
+    def test_cold_start_builds_in_the_background(self, schedule):
+        self.add(1)
+        self.assertEqual(recommender.recommend_for_user(self.user), [])
+        schedule.assert_called_once_with(self.user)
+        self.assertFalse(TasteProfile.objects.filter(user=self.user).exists())
+
+    @mock.patch.object(recommender, 'schedule_profile_build')
+    def test_empty_watchlist_schedules_nothing(self, schedule):
+        self.assertEqual(recommender.recommend_for_user(self.user), [])
+        schedule.assert_not_called()
+
+
+def turn(role, text):
+    return {'role': role, 'parts': [{'text': text}]}
+
+
+class ChatContextTests(SimpleTestCase):
+    HISTORY = [
+        turn('user', 'I want a long science fiction movie with lots of space battles and a great soundtrack'),
+        turn('model', 'Do you have a favourite actor or director in mind for this one?'),
+        turn('user', 'Something directed by Denis Villeneuve'),
+        turn('model', '{"recommendations": [{"title": "Dune", "year": 2021, "tmdb_id": 438631}]}'),
+        turn('user', 'More like that'),
+    ]
+
+    def tokens(self, context, turns):
+        return sum(context.count_tokens(context.turn_text(t)) for t in turns)
+
+    def test_history_within_budget_is_kept(self):
+        context = ai_google.ChatContext(token_budget=2000)
+        compacted = context.compact(self.HISTORY)
+        self.assertEqual(len(compacted), len(self.HISTORY))
+        self.assertEqual(context.turn_text(compacted[3]), '[Recommended tmdb_ids: 438631]')
+
+    def test_summary_counts_against_the_budget(self):
+        for budget in (20, 40, 60):
+            context = ai_google.ChatContext(token_budget=budget, summary_budget=300)
+            compacted = context.compact(self.HISTORY)
+            self.assertLessEqual(self.tokens(context, compacted), budget)
+            self.assertEqual(compacted[0]['role'], 'user')
+            self.assertEqual(context.turn_text(compacted[-1]), 'More like that')
+
+    def test_summary_keeps_earlier_recommendations(self):
+        history = self.HISTORY[2:4] + [
+            turn('user', 'Now something much lighter, a feel-good comedy I can watch with my parents this weekend'),
+            turn('model', 'Do you prefer a recent release or an older classic for that evening?'),
+            turn('user', 'A recent one'),
+        ]
+        context = ai_google.ChatContext(token_budget=45, summary_budget=300)
+        compacted = context.compact(history)
+        self.assertLess(len(compacted), len(history))
+        self.assertLessEqual(self.tokens(context, compacted), 45)
+        self.assertTrue(context.turn_text(compacted[0]).startswith(ai_google.SUMMARY_PREFIX))
+        self.assertIn('438631', context.turn_text(compacted[0]))
+
+
+class UsageRecordTests(SimpleTestCase):
+    def record(self, response):
+        service = ai_google.AIGoogleService.__new__(ai_google.AIGoogleService)
+        with ai_google.collecting_usage() as records:
+            service._record_usage('chat', 'model', response, 12.0, [turn('user', 'hi')], 'a movie')
+        return records[0]
+
+    def test_usage_metadata_is_recorded(self):
+        usage = mock.Mock(prompt_token_count=120, candidates_token_count=30, cached_content_token_count=0)
+        record = self.record(mock.Mock(usage_metadata=usage, text='ok'))
+        self.assertEqual((record['input_tokens'], record['output_tokens'], record['estimated']), (120, 30, False))
+
+    def test_missing_metadata_is_estimated(self):
+        record = self.record(mock.Mock(usage_metadata=None, text='x' * 40))
+        self.assertTrue(record['estimated'])
+        self.assertEqual(record['output_tokens'], 10)
+        self.assertGreater(record['input_tokens'], ai_google.ChatContext.count_tokens(ai_google.SYSTEM_INSTRUCTION))
+
+
+class TurnRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ai_google.TurnRouter()
+
+    def assertRoute(self, prompt, route, history=()):
+        self.assertEqual(self.router.route(list(history), prompt)[0], route, prompt)
+
+    def test_greetings_get_a_canned_reply(self):
+        self.assertRoute('hi there!', ai_google.ROUTE_CANNED)
+        self.assertRoute('makasih ya', ai_google.ROUTE_CANNED)
+        # The same word answers a question the model asked.
+        self.assertRoute('yes', ai_google.ROUTE_LIGHT, [turn('user', 'a movie'), turn('model', 'Any genre?')])
+
+    def test_only_vague_requests_go_to_the_light_model(self):
+        for prompt in ('find me a movie', 'rekomendasikan film', 'seperti apa film yang bagus?', 'a horror movie',
+                       'a comedy with my parents', 'I like Inception but want something lighter'):
+            self.assertRoute(prompt, ai_google.ROUTE_LIGHT)
+
+    def test_people_are_detected_in_lowercase(self):
+        self.assertEqual(self.router.route([], 'a comedy with jim carrey'), (ai_google.ROUTE_FULL, 'genre+person'))
+        self.assertRoute('anything starring tom hanks', ai_google.ROUTE_FULL)
+        self.assertRoute('film horor dari sutradara joko anwar', ai_google.ROUTE_FULL)
+
+    def test_similar_requests(self):
+        for prompt in ('Sudah nonton Parasite, mau yang mirip', 'film kayak Parasite', 'movies like Inception',
+                       'something similar please', 'more like that'):
+            self.assertEqual(self.router.route([], prompt), (ai_google.ROUTE_FULL, 'similar_to'), prompt)
+
+    def test_details_are_gathered_since_the_last_recommendation(self):
+        history = [turn('user', 'a horror movie'), turn('model', 'Any particular era?')]
+        self.assertRoute('from the 80s', ai_google.ROUTE_FULL, history)
+
+        recommended = history + [turn('model', '{"recommendations": [{"tmdb_id": 1}]}')]
+        self.assertRoute('from the 80s', ai_google.ROUTE_LIGHT, recommended)
+
+    def test_malformed_history_turns_are_skipped(self):
+        self.assertRoute('a movie', ai_google.ROUTE_LIGHT, ['hello', None, 42])
+        self.assertRoute('from the 80s', ai_google.ROUTE_FULL, ['hello', turn('user', 'a horror movie')])
+
+
+class ChatEndpointTests(SimpleTestCase):
+    def post(self, payload):
+        with mock.patch('apps.ai.views.get_ai_service'), mock.patch('apps.ai.views.get_tmdb_service'):
+            return self.client.post(reverse('chat:api'), json.dumps(payload), content_type='application/json')
+
+    def test_history_must_be_a_list(self):
+        response = self.post({'prompt': 'a movie', 'history': {'role': 'user'}})
+        self.assertEqual(response.status_code, 400)
+
+    def test_prompt_is_required(self):
+        self.assertEqual(self.post({'history': []}).status_code, 400)
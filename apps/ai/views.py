@@ -5,12 +5,22 @@ from django.views.generic import TemplateView
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 
-from services.ai_google import AIGoogleService
-from services.tmdb import TMDBService
+from movies.models import SimilarMovies
+from services import prefetch
+from services.registry import get_ai_service, get_tmdb_service
 
-# An instance of our services
-ai_service = AIGoogleService()
-tmdb_service = TMDBService()
+# Matches explicit "movies like X" requests in English and Indonesian, e.g.
+# "find me movies similar to Inception" or "rekomendasi film mirip Parasite".
+# A bare "like" is left out: "I like Inception but want something lighter"
+# needs the model and the conversation history.
+SIMILAR_TO_PATTERN = re.compile(
+    r"(?:\b(?:movies?|films?|something|anything)\s+like"
+    r"|\bsimilar\s+to"
+    r"|\bfilm\s+(?:yang\s+)?(?:mirip|seperti|kayak)(?:\s+dengan)?"
+    r"|\bmirip\s+dengan)"
+    r"\s+[\"']?(?P<title>[^\"'?!.]+?)[\"']?\s*[?!.]*$",
+    re.IGNORECASE,
+)
 
 class ChatPageView(TemplateView):
     """
@@ -27,12 +37,27 @@ def chat_endpoint(request):
     structured data (JSON) for recommendations.
     """
     try:
+        ai_service = get_ai_service()
+        tmdb_service = get_tmdb_service()
+
         data = json.loads(request.body)
         history = data.get('history', [])
         prompt = data.get('prompt')
 
-        if not prompt:
+        if not prompt or not isinstance(prompt, str):
             return JsonResponse({'error': 'Prompt is required.'}, status=400)
+        if not isinstance(history, list):
+            return JsonResponse({'error': 'History must be a list of chat turns.'}, status=400)
+
+        # Answer "movies like X" from the precomputed table without calling Gemini
+        match = SIMILAR_TO_PATTERN.search(prompt.strip())
+        if match:
+            similar = SimilarMovies.similar_for_title(match.group('title'))
+            if similar:
+                recommendations = tmdb_service.localize_cards(similar[:5])
+                # The user is likely to open one of these next
+                prefetch.prefetch_movie_details(movie['id'] for movie in recommendations)
+                return JsonResponse({'recommendations': recommendations})
 
         # Get the raw response from the AI (could be text or a JSON string)
         ai_response_text = ai_service.get_conversational_response(history, prompt)
@@ -50,19 +75,26 @@ def chat_endpoint(request):
             parsed_json = json.loads(cleaned_json_str)
             
             # If it's JSON and contains recommendations, enrich them
-            if isinstance(parsed_json, dict) and 'recommendations' in parsed_json:
+            if isinstance(parsed_json, dict) and parsed_json.get('recommendations'):
                 enriched_movies = []
                 for movie_suggestion in parsed_json['recommendations']:
                     if 'tmdb_id' in movie_suggestion:
-                        movie_details = tmdb_service.get_movie_details(movie_suggestion['tmdb_id'])
+                        movie_details = tmdb_service.get_movie_core(movie_suggestion['tmdb_id'])
                         if movie_details:
                             enriched_movies.append(movie_details)
                 
+                # The user is likely to open one of these next
+                prefetch.prefetch_movie_details(movie['id'] for movie in enriched_movies)
+
                 # Return the final, enriched data
                 return JsonResponse({'recommendations': enriched_movies})
             
-            # If it's valid JSON but not the format we want, return it directly
-            return JsonResponse(parsed_json)
+            # The full model answers in JSON mode; a question or chat message
+            # without recommendations comes back in its 'response' field.
+            message = parsed_json.get('response') if isinstance(parsed_json, dict) else None
+            if isinstance(message, str) and message.strip():
+                return JsonResponse({'response': message})
+            return JsonResponse({'response': ai_response_text})
 
         except json.JSONDecodeError:
             # If cleaning fails or it was never JSON, it's a regular text response
@@ -0,0 +1,76 @@
+import base64
+import binascii
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.db.models import Q, QuerySet
+
+
+@dataclass
+class KeysetPage:
+    """
+    One page of a keyset-paginated queryset, with opaque cursors for the
+    neighbouring pages (None when there is no such page).
+    """
+    items: List
+    next_cursor: Optional[str]
+    previous_cursor: Optional[str]
+
+
+def encode_cursor(added_at: datetime, pk: int) -> str:
+    """
+    Encodes an (added_at, id) position as an opaque URL-safe cursor.
+    """
+    return base64.urlsafe_b64encode(f"{added_at.isoformat()}|{pk}".encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """
+    Decodes a cursor, returning None for a missing or malformed one.
+    """
+    if not cursor:
+        return None
+    try:
+        added_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(added_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def keyset_page(queryset: QuerySet, after: Optional[str] = None, before: Optional[str] = None, size: int = 24) -> KeysetPage:
+    """
+    Returns a page of `queryset`, newest first, ordered by (added_at, id).
+
+    Instead of OFFSET, each page continues from the position of the last
+    row shown, which the (user, -added_at, -id) index serves directly no
+    matter how deep the page is. Pass `after` to go to older items and
+    `before` to go back to newer ones.
+    """
+    after_position, before_position = decode_cursor(after), decode_cursor(before)
+
+    if before_position:
+        added_at, pk = before_position
+        rows = list(
+            queryset.filter(Q(added_at__gt=added_at) | Q(added_at=added_at, id__gt=pk))
+            .order_by('added_at', 'id')[:size + 1]
+        )
+        has_newer = len(rows) > size
+        items = rows[:size][::-1]
+        return KeysetPage(
+            items=items,
+            next_cursor=encode_cursor(items[-1].added_at, items[-1].pk) if items else None,
+            previous_cursor=encode_cursor(items[0].added_at, items[0].pk) if has_newer else None,
+        )
+
+    if after_position:
+        added_at, pk = after_position
+        queryset = queryset.filter(Q(added_at__lt=added_at) | Q(added_at=added_at, id__lt=pk))
+    rows = list(queryset.order_by('-added_at', '-id')[:size + 1])
+    has_older = len(rows) > size
+    items = rows[:size]
+    return KeysetPage(
+        items=items,
+        next_cursor=encode_cursor(items[-1].added_at, items[-1].pk) if has_older else None,
+        previous_cursor=encode_cursor(items[0].added_at, items[0].pk) if after_position and items else None,
+    )
@@ -1,3 +1,59 @@
+import base64
+import datetime
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+
+from movies.models import Watchlist
+
+from .pagination import decode_cursor, encode_cursor, keyset_page
+
+
+class KeysetPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('viewer')
+        start = timezone.now()
+        # Seven items, added in pairs at the same instant so pages split ties.
+        for index in range(7):
+            item = Watchlist.objects.create(user=self.user, movie_id=index, title=f'Movie {index}')
+            Watchlist.objects.filter(pk=item.pk).update(added_at=start + datetime.timedelta(seconds=index // 2))
+        self.queryset = Watchlist.objects.filter(user=self.user)
+        self.newest_first = list(self.queryset.order_by('-added_at', '-id').values_list('movie_id', flat=True))
+
+    def ids(self, page):
+        return [item.movie_id for item in page.items]
+
+    def test_cursor_round_trip(self):
+        added_at = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(added_at, 42)), (added_at, 42))
+
+    def test_pages_forward_and_back_across_ties(self):
+        pages, cursor = [], None
+        while True:
+            page = keyset_page(self.queryset, after=cursor, size=2)
+            pages.append(page)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual([movie_id for page in pages for movie_id in self.ids(page)], self.newest_first)
+        self.assertEqual(len(pages), 4)
+        self.assertIsNone(pages[0].previous_cursor)
+
+        # Walking back from the last page revisits the same pages.
+        back = keyset_page(self.queryset, before=pages[-1].previous_cursor, size=2)
+        self.assertEqual(self.ids(back), self.ids(pages[-2]))
+        first = keyset_page(self.queryset, before=pages[1].previous_cursor, size=2)
+        self.assertEqual(self.ids(first), self.ids(pages[0]))
+        self.assertIsNone(first.previous_cursor)
 
-# Create your tests here.
+    def test_tampered_cursors_fall_back_to_the_first_page(self):
+        first = self.ids(keyset_page(self.queryset, size=3))
+        for cursor in (
+            'not a cursor',
+            base64.urlsafe_b64encode(b'yesterday|1').decode(),
+            base64.urlsafe_b64encode(b'2024-01-01T00:00:00+00:00|1|2').decode(),
+            base64.urlsafe_b64encode(b'2024-01-01T00:00:00+00:00|one').decode(),
+        ):
+            self.assertEqual(self.ids(keyset_page(self.queryset, after=cursor, size=3)), first, cursor)
+            self.assertEqual(self.ids(keyset_page(self.queryset, before=cursor, size=3)), first, cursor)
@@ -1,14 +1,12 @@
-import json
-import re
 from django.shortcuts import render
-from django.views.generic import TemplateView, ListView
+from django.views.generic import ListView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from services.tmdb import TMDBService
-from services.ai_google import AIGoogleService
-from movies.models import Watchlist
-
-tmdb_service = TMDBService()
-ai_service = AIGoogleService()
+from services import cache, prefetch
+from services.registry import get_tmdb_service
+from movies.counters import get_leaderboard
+from movies.models import Favorite, Leaderboard, Watchlist
+from movies.recommender import PICKS_CACHE_TTL, picks_cache_key, recommend_for_user
+from .pagination import keyset_page
 
 def home(request):
     """
@@ -18,33 +16,17 @@ def home(request):
     """
     if request.user.is_authenticated:
         # Logic for the authenticated user's dashboard
+        tmdb_service = get_tmdb_service()
         trending_data = tmdb_service.get_trending_movies()
-        ai_recommendations = []
-        
-        # Get AI recommendations based on the latest watchlist item
-        latest_watchlist_item = Watchlist.objects.filter(user=request.user).first()
-        if latest_watchlist_item:
-            prompt = f"Based on the movie '{latest_watchlist_item.title}', suggest 5 similar movies. You must respond with only a JSON object."
-            ai_response_text = ai_service.get_conversational_response(history=[], new_prompt=prompt)
-            
-            # Clean and parse the response
-            cleaned_json_str = ai_response_text
-            if '```json' in ai_response_text:
-                match = re.search(r"```json\s*(\{.*?\})\s*```", ai_response_text, re.DOTALL)
-                if match:
-                    cleaned_json_str = match.group(1)
-
-            try:
-                parsed_json = json.loads(cleaned_json_str)
-                if isinstance(parsed_json, dict) and 'recommendations' in parsed_json:
-                    for movie_suggestion in parsed_json['recommendations'][:5]:
-                        if 'tmdb_id' in movie_suggestion:
-                            details = tmdb_service.get_movie_details(movie_suggestion['tmdb_id'])
-                            if details:
-                                ai_recommendations.append(details)
-            except json.JSONDecodeError:
-                # AI didn't return valid JSON, so we'll fall back gracefully
-                pass
+        # Rank recommendations locally from the user's whole watchlist. Picks
+        # are shared by all nodes until the watchlist changes. The cards come
+        # from cached features, so localize them for this request.
+        picks = cache.get_or_set(
+            picks_cache_key(request.user.pk),
+            lambda: recommend_for_user(request.user, limit=5) or None,
+            PICKS_CACHE_TTL,
+        )
+        ai_recommendations = tmdb_service.localize_cards(picks or [])
 
         # If no AI recommendations could be generated, show popular movies instead.
         if not ai_recommendations:
@@ -52,10 +34,20 @@ def home(request):
             if popular_data and 'results' in popular_data:
                 ai_recommendations = popular_data['results'][:5]
 
+        # The user is likely to open one of their picks next
+        prefetch.prefetch_movie_details(movie['id'] for movie in ai_recommendations)
+
+        # Materialized by `materialize_leaderboards`; a single row lookup
+        popular_on_mirai, popular_on_mirai_period = get_leaderboard(Leaderboard.WEEKLY), 'this week'
+        if not popular_on_mirai:
+            popular_on_mirai, popular_on_mirai_period = get_leaderboard(Leaderboard.ALL_TIME), 'all time'
+
         context = {
             'page_title': 'Dashboard',
             'trending_movies': trending_data.get('results', [])[:10] if trending_data else [],
             'ai_recommendations': ai_recommendations,
+            'popular_on_mirai': popular_on_mirai[:10],
+            'popular_on_mirai_period': popular_on_mirai_period,
         }
         return render(request, 'pages/dashboard.html', context)
     else:
@@ -65,30 +57,55 @@ def home(request):
 
 class WatchlistPageView(LoginRequiredMixin, ListView):
     """
-    Displays the movies in the currently logged-in user's watchlist.
+    Displays the movies in the currently logged-in user's watchlist, one
+    keyset-paginated page at a time.
     """
     model = Watchlist
     template_name = 'dashboard/watchlist.html'
     context_object_name = 'watchlist_items'
+    page_size = 24
 
     def get_queryset(self):
-        # Return the watchlist items for the current user
-        return Watchlist.objects.filter(user=self.request.user)
+        # Return one page of watchlist items for the current user
+        self.page = keyset_page(
+            Watchlist.objects.filter(user=self.request.user),
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+            size=self.page_size,
+        )
+        return self.page.items
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['page_title'] = 'My Watchlist'
+        context['next_cursor'] = self.page.next_cursor
+        context['previous_cursor'] = self.page.previous_cursor
         return context
 
 
-class FavoritesPageView(TemplateView):
+class FavoritesPageView(LoginRequiredMixin, ListView):
     """
-    Serves the user's favorites page. (Placeholder)
+    Displays the movies the currently logged-in user marked as favorites,
+    one keyset-paginated page at a time.
     """
-    template_name = "dashboard/favorites.html"
+    model = Favorite
+    template_name = 'dashboard/favorites.html'
+    context_object_name = 'favorite_items'
+    page_size = 24
+
+    def get_queryset(self):
+        # Return one page of favorites for the current user
+        self.page = keyset_page(
+            Favorite.objects.filter(user=self.request.user),
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+            size=self.page_size,
+        )
+        return self.page.items
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['page_title'] = 'My Favorites'
-        context['favorite_items'] = [] # Placeholder
-        return context
\ No newline at end of file
+        context['next_cursor'] = self.page.next_cursor
+        context['previous_cursor'] = self.page.previous_cursor
+        return context
@@ -1,3 +1,22 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Favorite, Leaderboard, MovieCounter
+
+
+@admin.register(Favorite)
+class FavoriteAdmin(admin.ModelAdmin):
+    list_display = ('title', 'user', 'movie_id', 'added_at')
+    search_fields = ('title', 'user__username')
+
+
+@admin.register(MovieCounter)
+class MovieCounterAdmin(admin.ModelAdmin):
+    list_display = ('title', 'movie_id', 'watchlist_count', 'favorite_count', 'updated_at')
+    search_fields = ('title',)
+    ordering = ('-watchlist_count',)
+
+
+@admin.register(Leaderboard)
+class LeaderboardAdmin(admin.ModelAdmin):
+    list_display = ('period', 'generated_at')
+    readonly_fields = ('entries', 'generated_at')
@@ -0,0 +1,197 @@
+import logging
+from datetime import timedelta
+from typing import Dict, Iterable, List
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from movies.models import Favorite, Leaderboard, MovieCounter, MovieDailyCount, Watchlist, release_date_of_year
+from services import cache
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+WATCHLIST = 'watchlist'
+FAVORITE = 'favorite'
+
+# Movies kept per materialized leaderboard.
+LEADERBOARD_SIZE = 20
+
+# Days of daily counts summed into each windowed leaderboard.
+LEADERBOARD_WINDOWS = {Leaderboard.DAILY: 1, Leaderboard.WEEKLY: 7}
+
+# How long a materialized leaderboard is cached, in seconds. Rebuilding the
+# leaderboards invalidates it on every node.
+LEADERBOARD_CACHE_TTL = 60 * 60
+
+
+# --- Counter Updates ---
+
+def _increment(model, lookup: Dict, field: str, amount: int, defaults: Dict) -> None:
+    """
+    Adds `amount` to one counter column with a single UPDATE ... SET f = f + n,
+    creating the row on first use. A concurrent create is retried as an update.
+    """
+    if model.objects.filter(**lookup).update(**{field: F(field) + amount}):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **defaults, **{field: amount})
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**{field: F(field) + amount})
+
+
+def record_added(kind: str, items: Iterable, trending: bool = True) -> None:
+    """
+    Counts newly created Watchlist or Favorite rows (`kind` is WATCHLIST or
+    FAVORITE) in the all-time counters and, unless `trending` is False,
+    today's daily counts. Bulk imports pass False: they move existing lists
+    over rather than show new interest, and would swamp the daily and weekly
+    leaderboards.
+    """
+    today = timezone.localdate()
+    for item in items:
+        _increment(
+            MovieCounter, {'movie_id': item.movie_id}, f'{kind}_count', 1,
+            {'title': item.title, 'poster_path': item.poster_path, 'release_year': item.release_year},
+        )
+        if trending:
+            _increment(MovieDailyCount, {'movie_id': item.movie_id, 'day': today}, f'{kind}_adds', 1, {})
+
+
+def record_removed(kind: str, movie_id: int) -> None:
+    """
+    Removes a deleted Watchlist or Favorite row from the all-time counter.
+    Daily counts track additions only, so they are left as they are.
+    """
+    field = f'{kind}_count'
+    MovieCounter.objects.filter(movie_id=movie_id, **{f'{field}__gt': 0}).update(**{field: F(field) - 1})
+
+
+# --- Leaderboards ---
+
+def _card(counter: MovieCounter, **counts) -> Dict:
+    # Stored as JSON, so the year is kept as is; get_leaderboard() adds the
+    # release_date movie_card.html formats.
+    return {
+        'id': counter.movie_id,
+        'title': counter.title,
+        'poster_path': counter.poster_path,
+        'release_year': counter.release_year,
+        **counts,
+    }
+
+
+def _all_time_entries(size: int) -> List[Dict]:
+    counters = (
+        MovieCounter.objects.annotate(score=F('watchlist_count') + F('favorite_count'))
+        .filter(score__gt=0)
+        .order_by('-score', '-favorite_count', 'movie_id')[:size]
+    )
+    return [
+        _card(counter, watchlist_count=counter.watchlist_count, favorite_count=counter.favorite_count)
+        for counter in counters
+    ]
+
+
+def _window_entries(days: int, size: int) -> List[Dict]:
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = list(
+        MovieDailyCount.objects.filter(day__gte=since)
+        .values('movie_id')
+        .annotate(watchlist_adds=Sum('watchlist_adds'), favorite_adds=Sum('favorite_adds'))
+        .annotate(score=F('watchlist_adds') + F('favorite_adds'))
+        .filter(score__gt=0)
+        .order_by('-score', '-favorite_adds', 'movie_id')[:size]
+    )
+    counters = MovieCounter.objects.in_bulk([row['movie_id'] for row in rows], field_name='movie_id')
+    return [
+        _card(counters[row['movie_id']], watchlist_count=row['watchlist_adds'], favorite_count=row['favorite_adds'])
+        for row in rows if row['movie_id'] in counters
+    ]
+
+
+def materialize_leaderboards(size: int = LEADERBOARD_SIZE) -> Dict[str, int]:
+    """
+    Rebuilds every leaderboard from the counter tables and returns the number
+    of entries written per period. The daily and weekly boards rank by
+    additions within the window, the all-time board by current counts.
+    """
+    boards = {period: _window_entries(days, size) for period, days in LEADERBOARD_WINDOWS.items()}
+    boards[Leaderboard.ALL_TIME] = _all_time_entries(size)
+
+    with transaction.atomic():
+        for period, entries in boards.items():
+            Leaderboard.objects.update_or_create(period=period, defaults={'entries': entries})
+    cache.invalidate(*(f"leaderboard:{period}" for period in boards))
+    logger.info(f"Materialized leaderboards: {', '.join(f'{p}={len(e)}' for p, e in boards.items())}")
+    return {period: len(entries) for period, entries in boards.items()}
+
+
+def get_leaderboard(period: str) -> List[Dict]:
+    """
+    Returns the materialized entries of one leaderboard as movie cards, or
+    an empty list if it has not been built yet.
+    """
+    def load():
+        entries = Leaderboard.objects.filter(period=period).values_list('entries', flat=True).first() or []
+        return [dict(entry, release_date=release_date_of_year(entry.get('release_year'))) for entry in entries]
+
+    return cache.get_or_set(f"leaderboard:{period}", load, LEADERBOARD_CACHE_TTL)
+
+
+# --- Reconciliation ---
+
+def reconcile_counters(dry_run: bool = False, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Recomputes every all-time counter from the Watchlist and Favorite tables
+    with one GROUP BY each and writes back only the counters that drifted.
+    Returns how many counters were checked, fixed and created.
+    """
+    actual = {}
+    for kind, model in ((WATCHLIST, Watchlist), (FAVORITE, Favorite)):
+        for row in model.objects.values('movie_id').annotate(total=Count('id')).order_by():
+            actual.setdefault(row['movie_id'], {WATCHLIST: 0, FAVORITE: 0})[kind] = row['total']
+
+    stats = {'checked': 0, 'fixed': 0, 'created': 0}
+    drifted = []
+    for counter in MovieCounter.objects.iterator(chunk_size=batch_size):
+        stats['checked'] += 1
+        counts = actual.pop(counter.movie_id, {WATCHLIST: 0, FAVORITE: 0})
+        if (counter.watchlist_count, counter.favorite_count) != (counts[WATCHLIST], counts[FAVORITE]):
+            logger.info(
+                f"Counter drift for movie {counter.movie_id}: "
+                f"watchlist {counter.watchlist_count} -> {counts[WATCHLIST]}, "
+                f"favorite {counter.favorite_count} -> {counts[FAVORITE]}"
+            )
+            counter.watchlist_count, counter.favorite_count = counts[WATCHLIST], counts[FAVORITE]
+            drifted.append(counter)
+    stats['fixed'] = len(drifted)
+
+    # Movies that have rows but no counter yet, e.g. from before counters existed.
+    missing = []
+    if actual:
+        details = {}
+        for model in (Watchlist, Favorite):
+            for row in model.objects.filter(movie_id__in=actual).values('movie_id', 'title', 'poster_path', 'release_year'):
+                details.setdefault(row['movie_id'], row)
+        missing = [
+            MovieCounter(
+                movie_id=movie_id,
+                title=details[movie_id]['title'],
+                poster_path=details[movie_id]['poster_path'],
+                release_year=details[movie_id]['release_year'],
+                watchlist_count=counts[WATCHLIST],
+                favorite_count=counts[FAVORITE],
+            )
+            for movie_id, counts in actual.items()
+        ]
+    stats['created'] = len(missing)
+
+    if not dry_run:
+        with transaction.atomic():
+            MovieCounter.objects.bulk_update(drifted, ['watchlist_count', 'favorite_count'], batch_size=batch_size)
+            MovieCounter.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+    return stats
@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from movies import recommender
+from movies.models import TasteProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the missing taste profiles of users with a watchlist and retries "
+        "items whose features failed to load. Meant to run periodically (e.g. every few minutes from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=0, help='Process at most this many users (0 means all).')
+
+    def handle(self, *args, **options):
+        missing = User.objects.filter(watchlist__isnull=False, taste_profile__isnull=True).distinct()
+        pending = User.objects.filter(taste_profile__isnull=False).exclude(taste_profile__pending_ids=[])
+        users = list(missing.union(pending).order_by('pk'))
+        if options['limit']:
+            users = users[:options['limit']]
+
+        for user in users:
+            profile = recommender.build_profile(user)
+            self.stdout.write(
+                f"  {user.username:<20} {len(profile.item_ids)} items, {len(profile.pending_ids)} still pending"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Built {len(users)} taste profiles."))
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from movies import counters
+from movies.models import MovieDailyCount
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the daily, weekly and all-time leaderboards of the most "
+        "watchlisted and favorited movies. Meant to run periodically (e.g. every few minutes from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=counters.LEADERBOARD_SIZE, help='Number of movies per leaderboard.')
+        parser.add_argument(
+            '--keep-days', type=int, default=30,
+            help='Delete daily counts older than this many days (0 keeps everything).',
+        )
+
+    def handle(self, *args, **options):
+        written = counters.materialize_leaderboards(size=options['size'])
+        for period, count in written.items():
+            self.stdout.write(f"  {period:<10} {count} movies")
+
+        if options['keep_days']:
+            cutoff = timezone.localdate() - timedelta(days=options['keep_days'])
+            deleted, _ = MovieDailyCount.objects.filter(day__lt=cutoff).delete()
+            if deleted:
+                self.stdout.write(f"Deleted {deleted} daily counts older than {cutoff}.")
+        self.stdout.write(self.style.SUCCESS("Leaderboards materialized."))
@@ -0,0 +1,186 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.models import SimilarMovies
+from services import ai_google, ratelimit
+from services.registry import get_ai_service, get_tmdb_service
+
+# TMDB list endpoints the seed titles are drawn from, merged round-robin.
+SEED_SOURCES = ('get_trending_movies', 'get_popular_movies', 'get_top_rated_movies')
+
+# TMDB never serves list pages beyond this.
+MAX_LIST_PAGES = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Precomputes 'movies like X' recommendations with Gemini for the top-N "
+        "trending/popular/top-rated titles and stores them in SimilarMovies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=2000, help='Number of seed titles to cover.')
+        parser.add_argument('--per-seed', type=int, default=10, help='Number of similar movies to ask for per seed.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Maximum number of Gemini calls in flight.')
+        parser.add_argument(
+            '--checkpoint', default=os.path.join(settings.BASE_DIR, '.precompute_similar.json'),
+            help='File recording finished and failed seeds, used to resume an interrupted run.',
+        )
+        parser.add_argument('--refresh', action='store_true', help='Regenerate seeds that already have an entry.')
+        parser.add_argument('--retry-failed', action='store_true', help='Retry seeds that failed in a previous run.')
+
+    def handle(self, *args, **options):
+        # A batch job: give way to interactive page requests on the TMDB rate limiter.
+        ratelimit.set_default_priority(ratelimit.BACKGROUND)
+
+        start = time.perf_counter()
+        # A refresh must ask Gemini again rather than reuse the last hour's cached answers.
+        self.use_cache = not options['refresh']
+        checkpoint = self._load_checkpoint(options['checkpoint'])
+
+        seeds = self._collect_seeds(options['top'])
+        existing = set() if options['refresh'] else set(SimilarMovies.objects.values_list('movie_id', flat=True))
+        done = set() if options['refresh'] else set(checkpoint['done'])
+        failed = {} if options['retry_failed'] else checkpoint['failed']
+
+        pending = [
+            seed for seed in seeds
+            if seed['id'] not in existing and seed['id'] not in done and str(seed['id']) not in failed
+        ]
+        self.stdout.write(f"{len(seeds)} seeds, {len(seeds) - len(pending)} skipped, {len(pending)} to generate.")
+
+        stats = {'succeeded': 0, 'llm_failed': 0, 'unresolved': 0, 'resolved_movies': 0}
+        # Workers only talk to the APIs and hand back the token usage of their
+        # Gemini calls; all database and checkpoint writes (usage records
+        # included) stay on this thread, which keeps SQLite free of concurrent writers.
+        with ThreadPoolExecutor(max_workers=max(options['concurrency'], 1)) as executor:
+            futures = {executor.submit(self._generate, seed, options['per_seed']): seed for seed in pending}
+            for count, future in enumerate(as_completed(futures), start=1):
+                seed = futures[future]
+                similar, error, usage = future.result()
+                for record in usage:
+                    ai_google.record_usage(record)
+
+                if error is not None:
+                    stats['llm_failed'] += 1
+                    failed[str(seed['id'])] = str(error)[:200]
+                else:
+                    if similar:
+                        SimilarMovies.objects.update_or_create(
+                            movie_id=seed['id'],
+                            defaults={
+                                'title': seed['title'],
+                                'normalized_title': SimilarMovies.normalize_title(seed['title']),
+                                'release_year': int(seed['release_date'][:4]) if seed.get('release_date') else None,
+                                'seed_rank': seed['rank'],
+                                'similar': similar,
+                            },
+                        )
+                        stats['succeeded'] += 1
+                        stats['resolved_movies'] += len(similar)
+                        done.add(seed['id'])
+                    else:
+                        stats['unresolved'] += 1
+                        failed[str(seed['id'])] = 'no suggestion could be resolved through TMDB'
+
+                if count % 25 == 0 or count == len(pending):
+                    self._save_checkpoint(options['checkpoint'], done, failed)
+                    self.stdout.write(f"  {count}/{len(pending)} seeds processed")
+
+        self._save_checkpoint(options['checkpoint'], done, failed)
+
+        elapsed = time.perf_counter() - start
+        processed = stats['succeeded'] + stats['llm_failed'] + stats['unresolved']
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} seeds in {elapsed:.1f} s ({processed / elapsed * 60 if elapsed else 0:.1f} seeds/min): "
+            f"{stats['succeeded']} stored, {stats['llm_failed']} Gemini failures, {stats['unresolved']} unresolved, "
+            f"{stats['resolved_movies'] / max(stats['succeeded'], 1):.1f} resolved movies per seed."
+        ))
+
+    def _collect_seeds(self, top):
+        """
+        Merges the TMDB lists round-robin, page by page, until `top` unique titles are found.
+        """
+        tmdb_service = get_tmdb_service()
+        seeds, seen = [], set()
+        exhausted = set()
+        page = 1
+        while len(seeds) < top and len(exhausted) < len(SEED_SOURCES) and page <= MAX_LIST_PAGES:
+            for source in SEED_SOURCES:
+                if source in exhausted:
+                    continue
+                data = getattr(tmdb_service, source)(page=page)
+                if not data or page >= data.get('total_pages', 0):
+                    exhausted.add(source)
+                for movie in (data or {}).get('results', []):
+                    if movie['id'] not in seen and len(seeds) < top:
+                        seen.add(movie['id'])
+                        seeds.append(dict(movie, rank=len(seeds)))
+            page += 1
+        if not seeds:
+            raise CommandError("Could not load any seed titles from TMDB.")
+        return seeds
+
+    def _generate(self, seed, per_seed):
+        """
+        Runs on a worker thread. Returns (similar movies, error, usage records)
+        without touching the database.
+        """
+        with ai_google.collecting_usage() as usage:
+            try:
+                return self._suggest(seed, per_seed), None, usage
+            except Exception as e:
+                return None, e, usage
+
+    def _suggest(self, seed, per_seed):
+        """
+        Asks Gemini for movies similar to one seed and resolves them through TMDB.
+        """
+        year = (seed.get('release_date') or '')[:4]
+        prompt = (
+            f"Suggest {per_seed} movies similar to '{seed['title']}' ({year}). "
+            "You must respond with only a JSON object."
+        )
+        ai_response_text = get_ai_service().get_conversational_response(
+            history=[], new_prompt=prompt, purpose='batch_similar', use_cache=self.use_cache,
+        )
+
+        match = re.search(r"\{.*\}", ai_response_text, re.DOTALL)
+        if not match:
+            raise ValueError(f"No JSON in Gemini response: {ai_response_text[:100]}")
+        suggestions = json.loads(match.group(0)).get('recommendations', [])
+
+        similar, seen = [], {seed['id']}
+        for suggestion in suggestions:
+            card = self._resolve(suggestion)
+            if card and card['id'] not in seen:
+                seen.add(card['id'])
+                similar.append(card)
+        return similar
+
+    def _resolve(self, suggestion):
+        """
+        Finds the TMDB movie for a suggested title and year. Gemini's own
+        tmdb_id is only used to break ties, since it is often wrong.
+        """
+        if not isinstance(suggestion, dict) or not suggestion.get('title'):
+            return None
+        return get_tmdb_service().find_movie(suggestion['title'], suggestion.get('year'), suggestion.get('tmdb_id'))
+
+    def _load_checkpoint(self, path):
+        if not os.path.exists(path):
+            return {'done': [], 'failed': {}}
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_checkpoint(self, path, done, failed):
+        # Write to a temporary file first so an interrupted run never leaves a truncated checkpoint.
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump({'done': sorted(done), 'failed': failed}, f)
+        os.replace(f"{path}.tmp", path)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from movies import counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the per-movie watchlist and favorite counters from the "
+        "Watchlist and Favorite tables and fixes any drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing any changes.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk update/insert.')
+
+    def handle(self, *args, **options):
+        stats = counters.reconcile_counters(dry_run=options['dry_run'], batch_size=options['batch_size'])
+        verb = "would be" if options['dry_run'] else "were"
+        self.stdout.write(
+            f"Checked {stats['checked']} counters: {stats['fixed']} {verb} fixed, {stats['created']} {verb} created."
+        )
+        if not options['dry_run'] and (stats['fixed'] or stats['created']):
+            self.stdout.write("Run materialize_leaderboards to refresh the all-time leaderboard.")
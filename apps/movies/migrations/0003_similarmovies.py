@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_tasteprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarMovies',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movie_id', models.IntegerField(unique=True)),
+                ('title', models.CharField(max_length=200)),
+                ('normalized_title', models.CharField(db_index=True, max_length=200)),
+                ('release_year', models.IntegerField(blank=True, null=True)),
+                ('seed_rank', models.IntegerField(default=0)),
+                ('similar', models.JSONField(default=list)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'similar movies',
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_watchlist_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Leaderboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('all_time', 'All time')], max_length=10, unique=True)),
+                ('entries', models.JSONField(default=list)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MovieCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movie_id', models.IntegerField(unique=True)),
+                ('title', models.CharField(max_length=200)),
+                ('poster_path', models.CharField(blank=True, max_length=200, null=True)),
+                ('release_year', models.IntegerField(blank=True, null=True)),
+                ('watchlist_count', models.IntegerField(default=0)),
+                ('favorite_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MovieDailyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movie_id', models.IntegerField()),
+                ('day', models.DateField()),
+                ('watchlist_adds', models.IntegerField(default=0)),
+                ('favorite_adds', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='movie_daily_count_day_idx')],
+                'unique_together': {('movie_id', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Favorite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movie_id', models.IntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('poster_path', models.CharField(blank=True, max_length=200, null=True)),
+                ('release_year', models.IntegerField(blank=True, null=True)),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-added_at', '-id'], name='favorite_user_added_idx')],
+                'unique_together': {('user', 'movie_id')},
+            },
+        ),
+    ]
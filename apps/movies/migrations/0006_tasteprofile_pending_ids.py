@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_favorites_counters_leaderboards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tasteprofile',
+            name='pending_ids',
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -1,5 +1,20 @@
+import re
+import datetime
 from django.db import models
 from django.contrib.auth.models import User
+from services import cache
+
+# How long precomputed similar-movie lists are cached, in seconds.
+SIMILAR_CACHE_TTL = 60 * 60
+
+
+def release_date_of_year(year):
+    """
+    Returns a stored release year as a date (January 1st), which the `date`
+    filter in components/movie_card.html can format, or None.
+    """
+    return datetime.date(year, 1, 1) if year else None
+
 
 class Watchlist(models.Model):
     """
@@ -15,7 +30,175 @@ class Watchlist(models.Model):
     class Meta:
         # Ensure a user can only have a specific movie in their watchlist once
         unique_together = ('user', 'movie_id')
-        ordering = ['-added_at']
+        # No default ordering: queries that need one ask for it, and the
+        # watchlist pages walk this index with keyset pagination.
+        indexes = [
+            models.Index(fields=['user', '-added_at', '-id'], name='watchlist_user_added_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.title} ({self.user.username}'s Watchlist)"
\ No newline at end of file
+        return f"{self.title} ({self.user.username}'s Watchlist)"
+
+class Favorite(models.Model):
+    """
+    A movie the user has marked as a favorite.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites')
+    movie_id = models.IntegerField()
+    title = models.CharField(max_length=200)
+    poster_path = models.CharField(max_length=200, null=True, blank=True)
+    release_year = models.IntegerField(null=True, blank=True)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'movie_id')
+        indexes = [
+            models.Index(fields=['user', '-added_at', '-id'], name='favorite_user_added_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.user.username}'s Favorite)"
+
+    @property
+    def card(self):
+        """
+        The fields components/movie_card.html reads, with `id` being the TMDB id.
+        """
+        return {
+            'id': self.movie_id,
+            'title': self.title,
+            'poster_path': self.poster_path,
+            'release_date': release_date_of_year(self.release_year),
+            'vote_average': None,
+        }
+
+
+class MovieCounter(models.Model):
+    """
+    Denormalized popularity counters per movie, kept up to date with atomic
+    F() increments whenever a watchlist or favorite entry is added or removed,
+    so "most watchlisted" never needs a GROUP BY over the Watchlist table.
+    Drift is fixed by the `reconcile_movie_counters` command.
+    """
+    movie_id = models.IntegerField(unique=True)
+    title = models.CharField(max_length=200)
+    poster_path = models.CharField(max_length=200, null=True, blank=True)
+    release_year = models.IntegerField(null=True, blank=True)
+    watchlist_count = models.IntegerField(default=0)
+    favorite_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.title}: {self.watchlist_count} watchlists, {self.favorite_count} favorites"
+
+
+class MovieDailyCount(models.Model):
+    """
+    Number of times a movie was added to a watchlist or favorites on one day,
+    the source of the daily and weekly leaderboards.
+    """
+    movie_id = models.IntegerField()
+    day = models.DateField()
+    watchlist_adds = models.IntegerField(default=0)
+    favorite_adds = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('movie_id', 'day')
+        indexes = [
+            models.Index(fields=['day'], name='movie_daily_count_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id} on {self.day}: +{self.watchlist_adds} watchlists, +{self.favorite_adds} favorites"
+
+
+class Leaderboard(models.Model):
+    """
+    A materialized top list of the most watchlisted/favorited movies for one
+    period, rebuilt periodically by `materialize_leaderboards` so the
+    dashboard reads it with a single lookup.
+    """
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    ALL_TIME = 'all_time'
+    PERIOD_CHOICES = [(DAILY, 'Daily'), (WEEKLY, 'Weekly'), (ALL_TIME, 'All time')]
+
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES, unique=True)
+    # Movie cards with their watchlist and favorite counts, best first.
+    entries = models.JSONField(default=list)
+    generated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.get_period_display()} leaderboard ({len(self.entries)} movies)"
+
+
+class TasteProfile(models.Model):
+    """
+    A user's watchlist folded into a sparse feature vector, plus the pool of
+    candidate movies gathered from TMDB recommendations for each watchlist item.
+    Kept up to date incrementally as items are added and removed.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='taste_profile')
+    # Sum of the normalized feature vectors of every watchlist item.
+    vector = models.JSONField(default=dict)
+    # TMDB ids of the watchlist items folded into the vector.
+    item_ids = models.JSONField(default=list)
+    # Candidate movies keyed by TMDB id: card fields, genre ids and the
+    # watchlist items that recommended them.
+    candidates = models.JSONField(default=dict)
+    # Watchlist items whose features could not be loaded yet; retried later.
+    pending_ids = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s Taste Profile ({len(self.item_ids)} items)"
+
+
+class SimilarMovies(models.Model):
+    """
+    Precomputed "movies like X" recommendations for a popular seed title,
+    generated offline by the `precompute_similar` management command so the
+    common case is answered without calling Gemini.
+    """
+    movie_id = models.IntegerField(unique=True)
+    title = models.CharField(max_length=200)
+    normalized_title = models.CharField(max_length=200, db_index=True)
+    release_year = models.IntegerField(null=True, blank=True)
+    # Position of the seed in the trending/popular/top-rated merge; lower is more popular.
+    seed_rank = models.IntegerField(default=0)
+    # Movie cards (id, title, poster_path, release_date, vote_average) resolved through TMDB.
+    similar = models.JSONField(default=list)
+    generated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'similar movies'
+
+    def __str__(self):
+        return f"Movies like {self.title} ({len(self.similar)})"
+
+    @staticmethod
+    def normalize_title(title: str) -> str:
+        """
+        Lowercases a title and strips punctuation so user-typed titles match.
+        """
+        return " ".join(re.sub(r"[^\w\s]", " ", title.lower()).split())
+
+    @classmethod
+    def find_by_title(cls, title: str):
+        """
+        Returns the precomputed entry for a title, preferring the most popular
+        seed when several movies share it, or None.
+        """
+        return cls.objects.filter(normalized_title=cls.normalize_title(title)).order_by('seed_rank').first()
+
+    @classmethod
+    def similar_for_title(cls, title: str):
+        """
+        Returns the precomputed similar movies for a title (see find_by_title),
+        cached and included in the warm-start snapshot, or None.
+        """
+        def load():
+            entry = cls.find_by_title(title)
+            return entry.similar if entry and entry.similar else None
+
+        return cache.get_or_set(f"similar:{cls.normalize_title(title)}", load, SIMILAR_CACHE_TTL)
@@ -0,0 +1,356 @@
+"""
+Local hybrid recommender for the dashboard.
+
+Every movie is represented as a sparse feature vector over its genres,
+keywords and top cast (a dict of feature -> weight, L2-normalized). A user's
+taste profile is the sum of the vectors of every watchlist item, so the summed
+item-item cosine similarity of a candidate against the whole watchlist is a
+single sparse dot product with the profile. Candidates come from TMDB's
+recommendations for each watchlist item (plus the precomputed SimilarMovies
+entry when there is one), and how many watchlist items agree on a candidate
+is blended in as a collaborative signal.
+
+Profiles are stored in the database and updated incrementally when items are
+added or removed, so ranking is pure local arithmetic and needs no Gemini call.
+Gemini can optionally rerank just the top few candidates. Building a profile
+from a whole watchlist takes one TMDB call per item, so it runs on the
+prefetch pool (or the `build_taste_profiles` command), never in a request.
+"""
+import json
+import logging
+import math
+import re
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from movies.models import SimilarMovies, TasteProfile, Watchlist
+from services import cache, prefetch
+from services.registry import get_ai_service, get_tmdb_service
+from services.tmdb import CARD_FIELDS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Relative weight of each feature family in a movie's vector.
+FEATURE_WEIGHTS = {"g": 1.0, "k": 0.6, "c": 0.8}
+
+# Blend of the final score: content similarity, watchlist agreement, rating prior.
+CONTENT_WEIGHT = 0.6
+AGREEMENT_WEIGHT = 0.35
+RATING_WEIGHT = 0.05
+
+# Weights below this are treated as zero after subtracting a removed item.
+EPSILON = 1e-6
+
+# How long a user's dashboard picks are cached, in seconds. Watchlist changes
+# invalidate them on every node right away.
+PICKS_CACHE_TTL = 60 * 10
+
+# Items whose features failed to load are retried at most this often.
+PENDING_RETRY_INTERVAL = timedelta(minutes=10)
+
+
+# --- Sparse Vector Helpers ---
+def feature_vector(genres: Iterable[int] = (), keywords: Iterable[int] = (), cast: Iterable[int] = ()) -> Dict[str, float]:
+    """
+    Builds an L2-normalized sparse vector from genre, keyword and cast ids.
+    """
+    vector = {}
+    for prefix, ids in (("g", genres), ("k", keywords), ("c", cast)):
+        for feature_id in ids:
+            vector[f"{prefix}{feature_id}"] = FEATURE_WEIGHTS[prefix]
+
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    if not norm:
+        return {}
+    return {feature: weight / norm for feature, weight in vector.items()}
+
+
+def dot(a: Dict[str, float], b: Dict[str, float]) -> float:
+    """
+    Sparse dot product; iterates over the smaller vector.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(feature, 0.0) for feature, weight in a.items())
+
+
+def _accumulate(target: Dict[str, float], vector: Dict[str, float], sign: int) -> None:
+    for feature, weight in vector.items():
+        value = target.get(feature, 0.0) + sign * weight
+        if abs(value) < EPSILON:
+            target.pop(feature, None)
+        else:
+            target[feature] = value
+
+
+def _movie_vector(features: Dict[str, Any]) -> Dict[str, float]:
+    return feature_vector(features.get("genres", []), features.get("keywords", []), features.get("cast", []))
+
+
+# --- Incremental Profile Updates ---
+def _fold_in(profile: TasteProfile, movie_id: int, features: Optional[Dict[str, Any]], precomputed: Iterable[Dict[str, Any]] = ()) -> None:
+    """
+    Adds one watchlist item to the profile vector and candidate pool.
+    """
+    if movie_id in profile.item_ids or not features:
+        return
+
+    _accumulate(profile.vector, _movie_vector(features), +1)
+    profile.item_ids.append(movie_id)
+
+    for movie in [*features.get("recommendations", []), *precomputed]:
+        candidate = profile.candidates.setdefault(str(movie["id"]), {
+            "card": {field: movie.get(field) for field in CARD_FIELDS},
+            "genre_ids": [],
+            "sources": [],
+        })
+        # Precomputed cards carry no genres; keep the ones TMDB gave us.
+        candidate["genre_ids"] = candidate["genre_ids"] or movie.get("genre_ids", [])
+        if movie_id not in candidate["sources"]:
+            candidate["sources"].append(movie_id)
+
+
+def _fold_out(profile: TasteProfile, movie_id: int, features: Optional[Dict[str, Any]]) -> None:
+    """
+    Removes one watchlist item from the profile vector and candidate pool.
+    """
+    if movie_id not in profile.item_ids:
+        return
+    profile.item_ids.remove(movie_id)
+
+    if features:
+        _accumulate(profile.vector, _movie_vector(features), -1)
+
+    for key in list(profile.candidates):
+        sources = profile.candidates[key]["sources"]
+        if movie_id in sources:
+            sources.remove(movie_id)
+        if not sources:
+            del profile.candidates[key]
+
+
+def _load_features(movie_ids: Iterable[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+    # Fetched (mostly from cache) before the profile row is locked.
+    tmdb_service = get_tmdb_service()
+    return {movie_id: tmdb_service.get_movie_features(movie_id) for movie_id in movie_ids}
+
+
+def rebuild_profile(user) -> TasteProfile:
+    """
+    Recomputes a user's profile from their whole watchlist. Items whose
+    features could not be loaded are recorded as pending.
+    """
+    movie_ids = list(Watchlist.objects.filter(user=user).values_list("movie_id", flat=True))
+    features = _load_features(movie_ids)
+    precomputed = dict(SimilarMovies.objects.filter(movie_id__in=movie_ids).values_list("movie_id", "similar"))
+
+    with transaction.atomic():
+        profile, _ = TasteProfile.objects.select_for_update().get_or_create(user=user)
+        profile.vector, profile.item_ids, profile.candidates = {}, [], {}
+        profile.pending_ids = [movie_id for movie_id in movie_ids if not features[movie_id]]
+        for movie_id in movie_ids:
+            _fold_in(profile, movie_id, features[movie_id], precomputed.get(movie_id, ()))
+        profile.save()
+    return profile
+
+
+def retry_pending(profile: TasteProfile) -> TasteProfile:
+    """
+    Folds in the pending items of a profile whose features load now. Items
+    that fail again stay pending for the next pass.
+    """
+    attempted = set(profile.pending_ids)
+    movie_ids = set(Watchlist.objects.filter(user_id=profile.user_id, movie_id__in=attempted).values_list("movie_id", flat=True))
+    features = _load_features(movie_ids)
+    precomputed = dict(SimilarMovies.objects.filter(movie_id__in=movie_ids).values_list("movie_id", "similar"))
+
+    with transaction.atomic():
+        profile = TasteProfile.objects.select_for_update().get(pk=profile.pk)
+        for movie_id in movie_ids:
+            _fold_in(profile, movie_id, features[movie_id], precomputed.get(movie_id, ()))
+        # Keep items that failed again and those added while loading.
+        profile.pending_ids = [
+            movie_id for movie_id in profile.pending_ids
+            if movie_id not in profile.item_ids and (movie_id not in attempted or movie_id in movie_ids)
+        ]
+        profile.save()
+    return profile
+
+
+def build_profile(user) -> TasteProfile:
+    """
+    Builds a user's missing profile, or retries the pending items of an
+    existing one, and drops the user's cached picks.
+    """
+    profile = TasteProfile.objects.filter(user=user).first()
+    profile = rebuild_profile(user) if profile is None else retry_pending(profile)
+    invalidate_picks(user)
+    return profile
+
+
+def schedule_profile_build(user) -> bool:
+    """
+    Queues build_profile() for the user on the prefetch pool. Returns False
+    if it is already queued or the pool is full or disabled; the
+    `build_taste_profiles` command catches up on those users.
+    """
+    def task():
+        try:
+            profile = TasteProfile.objects.filter(user=user).first()
+            if cache.is_peeking():
+                # The pool's "already done?" probe.
+                return profile if profile is not None and not profile.pending_ids else None
+            return build_profile(user)
+        finally:
+            # Pool threads are long-lived; don't leave a connection open per thread.
+            connection.close()
+
+    return prefetch.engine.submit(f"taste_profile:{user.pk}", task)
+
+
+def picks_cache_key(user_id: int) -> str:
+    """
+    Returns the cache key of a user's dashboard picks.
+    """
+    return f"recommender:picks:{user_id}"
+
+
+def invalidate_picks(user) -> None:
+    """
+    Drops the user's cached dashboard picks on every node. Call it after the
+    watchlist or profile changed.
+    """
+    cache.invalidate(picks_cache_key(user.pk))
+
+
+def on_watchlist_added(user, movie_id: int) -> None:
+    """
+    Folds a newly added watchlist item into the user's profile. Users without
+    a profile yet get one built lazily on their next recommendation request.
+    """
+    if TasteProfile.objects.filter(user=user).exists():
+        features = get_tmdb_service().get_movie_features(movie_id)
+        precomputed = SimilarMovies.objects.filter(movie_id=movie_id).values_list("similar", flat=True).first() or ()
+
+        with transaction.atomic():
+            profile = TasteProfile.objects.select_for_update().get(user=user)
+            _fold_in(profile, movie_id, features, precomputed)
+            if not features and movie_id not in profile.pending_ids:
+                profile.pending_ids.append(movie_id)
+            profile.save()
+    invalidate_picks(user)
+
+
+def on_watchlist_removed(user, movie_id: int) -> None:
+    """
+    Removes a watchlist item from the user's profile.
+    """
+    if TasteProfile.objects.filter(user=user).exists():
+        features = get_tmdb_service().get_movie_features(movie_id)
+
+        with transaction.atomic():
+            profile = TasteProfile.objects.select_for_update().get(user=user)
+            _fold_out(profile, movie_id, features)
+            if movie_id in profile.pending_ids:
+                profile.pending_ids.remove(movie_id)
+            profile.save()
+    invalidate_picks(user)
+
+
+# --- Ranking ---
+def _score(profile: TasteProfile, candidate: Dict[str, Any], vector: Dict[str, float]) -> float:
+    item_count = max(len(profile.item_ids), 1)
+    content = dot(profile.vector, vector) / item_count
+    agreement = len(candidate["sources"]) / item_count
+    rating = (candidate["card"].get("vote_average") or 0) / 10
+    return CONTENT_WEIGHT * content + AGREEMENT_WEIGHT * agreement + RATING_WEIGHT * rating
+
+
+def rank_candidates(profile: TasteProfile, limit: int) -> List[Dict[str, Any]]:
+    """
+    Ranks the profile's candidate pool and returns the top movie cards.
+
+    Candidates are first scored on their genres alone (always known from the
+    recommendation lists). The best few are then re-scored with their full
+    genre/keyword/cast vector when those features are already cached.
+    """
+    tmdb_service = get_tmdb_service()
+    # Pending items are on the watchlist too, just not folded in yet.
+    watched = set(profile.item_ids) | set(profile.pending_ids)
+
+    coarse = []
+    for key, candidate in profile.candidates.items():
+        if int(key) in watched:
+            continue
+        vector = feature_vector(candidate["genre_ids"])
+        coarse.append((_score(profile, candidate, vector), key, candidate))
+    coarse.sort(key=lambda item: item[0], reverse=True)
+
+    refined = []
+    for score, key, candidate in coarse[:limit * 4]:
+        features = tmdb_service.peek_movie_features(int(key))
+        if features:
+            score = _score(profile, candidate, _movie_vector(features))
+        refined.append((score, candidate["card"]))
+    refined.sort(key=lambda item: item[0], reverse=True)
+
+    return [card for _, card in refined]
+
+
+def _llm_rerank(user, cards: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Asks Gemini to reorder a short list of locally ranked candidates.
+    Falls back to the local order on any error or unparseable response.
+    """
+    seed_titles = list(Watchlist.objects.filter(user=user).order_by("-added_at").values_list("title", flat=True)[:10])
+    candidate_lines = "\n".join(f"- {card['title']} ({(card.get('release_date') or '')[:4]}), tmdb_id {card['id']}" for card in cards)
+    prompt = (
+        f"The user's watchlist includes: {', '.join(seed_titles)}.\n"
+        f"Rank these candidate movies from best to worst match:\n{candidate_lines}\n"
+        "You must respond with only a JSON object using the recommendations format, "
+        "containing only movies from this list."
+    )
+
+    ai_response_text = get_ai_service().get_conversational_response(history=[], new_prompt=prompt, purpose="rerank")
+    match = re.search(r"\{.*\}", ai_response_text, re.DOTALL)
+    try:
+        ranked_ids = [movie["tmdb_id"] for movie in json.loads(match.group(0))["recommendations"]]
+    except (AttributeError, KeyError, TypeError, json.JSONDecodeError):
+        return cards
+
+    by_id = {card["id"]: card for card in cards}
+    reranked = [by_id.pop(movie_id) for movie_id in ranked_ids if movie_id in by_id]
+    return reranked + list(by_id.values())
+
+
+def recommend_for_user(user, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Returns up to `limit` movie cards recommended from the user's whole
+    watchlist. A missing profile is built in the background and nothing is
+    returned until it is ready, so callers show their fallback meanwhile.
+    """
+    start = time.perf_counter()
+
+    profile = TasteProfile.objects.filter(user=user).first()
+    if profile is None:
+        if Watchlist.objects.filter(user=user).exists():
+            schedule_profile_build(user)
+        return []
+    if profile.pending_ids and profile.updated_at < timezone.now() - PENDING_RETRY_INTERVAL:
+        schedule_profile_build(user)
+
+    rerank_top = getattr(settings, "RECOMMENDER_LLM_RERANK_TOP", 0)
+    ranked = rank_candidates(profile, max(limit, rerank_top))
+
+    if rerank_top and ranked:
+        ranked = _llm_rerank(user, ranked[:rerank_top]) + ranked[rerank_top:]
+
+    logger.debug(f"Ranked {len(profile.candidates)} candidates for user {user.pk} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return ranked[:limit]
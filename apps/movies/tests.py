@@ -1,3 +1,356 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import time
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+
+from movies import counters
+from movies.models import Favorite, Leaderboard, MovieCounter, MovieDailyCount, SimilarMovies, Watchlist
+from services import cache, ratelimit, tmdb
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-l1'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-l2'},
+}
+
+
+def movie(movie_id, title, year=2020):
+    return {'id': movie_id, 'title': title, 'release_date': f'{year}-01-01', 'poster_path': None}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PrecomputeSimilarTests(TestCase):
+    SEEDS = [movie(1, 'Inception', 2010), movie(2, 'Parasite', 2019)]
+    CATALOG = {'Interstellar': movie(10, 'Interstellar', 2014), 'Memento': movie(11, 'Memento', 2000)}
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, 'checkpoint.json')
+        # The command lowers the process-wide TMDB priority; restore it afterwards.
+        self.addCleanup(ratelimit.set_default_priority, ratelimit._default_priority)
+
+        tmdb = mock.Mock()
+        for source in ('get_trending_movies', 'get_popular_movies', 'get_top_rated_movies'):
+            getattr(tmdb, source).return_value = {'results': self.SEEDS, 'total_pages': 1}
+        tmdb.find_movie.side_effect = lambda title, year=None, tmdb_id=None: self.CATALOG.get(title)
+        self.ai = mock.Mock()
+        self.suggest('Interstellar')
+
+        module = 'movies.management.commands.precompute_similar'
+        for name, service in (('get_tmdb_service', tmdb), ('get_ai_service', self.ai)):
+            patcher = mock.patch(f'{module}.{name}', return_value=service)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def suggest(self, *titles):
+        self.ai.get_conversational_response.return_value = json.dumps(
+            {'recommendations': [{'title': title} for title in titles]}
+        )
+
+    def run_command(self, *args):
+        call_command('precompute_similar', '--top', '2', '--checkpoint', self.checkpoint, *args, stdout=StringIO())
+
+    def test_fills_the_table_and_answers_lookups(self):
+        self.run_command()
+        self.assertEqual(SimilarMovies.objects.count(), 2)
+        self.assertEqual([card['id'] for card in SimilarMovies.similar_for_title('inception!')], [10])
+        self.ai.get_conversational_response.assert_called_with(
+            history=[], new_prompt=mock.ANY, purpose='batch_similar', use_cache=True,
+        )
+
+        # Stored seeds are skipped on the next run.
+        self.ai.get_conversational_response.reset_mock()
+        self.run_command()
+        self.ai.get_conversational_response.assert_not_called()
+
+    def test_refresh_regenerates_without_the_response_cache(self):
+        self.run_command()
+        self.suggest('Memento')
+        self.run_command('--refresh')
+
+        self.assertEqual(self.ai.get_conversational_response.call_count, 4)
+        self.assertFalse(self.ai.get_conversational_response.call_args.kwargs['use_cache'])
+        self.assertEqual(SimilarMovies.objects.get(movie_id=2).similar[0]['id'], 11)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MovieSubResourceTests(TestCase):
+    RESPONSES = {
+        'movie/7/credits': {'cast': [{'id': n, 'name': f'Actor {n}', 'character': 'Role', 'order': n} for n in range(15)]},
+        'movie/7/videos': {'results': [
+            {'key': 'teaser', 'name': 'Teaser', 'site': 'YouTube', 'type': 'Teaser', 'official': True},
+            {'key': 'abc', 'name': 'Trailer', 'site': 'YouTube', 'type': 'Trailer', 'official': True},
+        ]},
+        'movie/7/images': {'posters': [{'file_path': '/p.jpg'}], 'backdrops': []},
+    }
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        with mock.patch.object(tmdb, 'TMDB_API_KEY', 'test-key'):
+            self.tmdb = tmdb.TMDBService()
+        self.responses = dict(self.RESPONSES)
+        self.requests = []
+
+        def make_request(endpoint, params=None):
+            self.requests.append(endpoint)
+            return self.responses.get(endpoint)
+
+        for patcher in (
+            mock.patch.object(self.tmdb, '_make_request', side_effect=make_request),
+            mock.patch('apps.movies.views.get_tmdb_service', return_value=self.tmdb),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self, name):
+        return self.client.get(reverse(f'movies:{name}', args=[7]))
+
+    def test_sub_resources_are_trimmed_and_cached(self):
+        credits = self.get('credits').json()
+        self.assertEqual(len(credits['cast']), tmdb.TOP_CAST_SIZE)
+        self.assertNotIn('order', credits['cast'][0])
+        self.assertEqual(self.get('trailer').json(), {'trailer': {'key': 'abc', 'name': 'Trailer', 'site': 'YouTube'}})
+        self.get('credits')
+        self.get('trailer')
+        self.assertEqual(self.requests, ['movie/7/credits', 'movie/7/videos'])
+
+    def test_invalidating_one_sub_resource_keeps_the_others(self):
+        for name in ('credits', 'trailer', 'images'):
+            self.get(name)
+        self.responses['movie/7/credits'] = {'cast': [{'id': 99, 'name': 'Replacement'}]}
+
+        cache.invalidate('tmdb:movie:7:credits')
+        self.assertEqual(self.get('credits').json()['cast'][0]['name'], 'Replacement')
+        self.assertEqual(self.get('images').json()['posters'], [{'file_path': '/p.jpg'}])
+        self.get('trailer')
+        self.assertEqual(self.requests.count('movie/7/credits'), 2)
+        self.assertEqual(self.requests.count('movie/7/videos'), 1)
+        self.assertEqual(self.requests.count('movie/7/images'), 1)
+
+    def test_failed_loads_are_not_cached(self):
+        del self.responses['movie/7/videos']
+        self.assertEqual(self.get('trailer').status_code, 502)
+        self.assertIsNone(self.tmdb.get_movie_videos(7, fetch=False))
+
+        self.responses['movie/7/videos'] = {'results': []}
+        self.assertEqual(self.get('trailer').json(), {'trailer': None})
+        self.assertEqual(self.tmdb.get_movie_videos(7, fetch=False), {'trailer': None})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class WatchlistTransferTests(TestCase):
+    FIELDS = ('movie_id', 'title', 'release_year', 'poster_path')
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        self.owner = User.objects.create_user('owner')
+        Watchlist.objects.create(user=self.owner, movie_id=27205, title='Inception', release_year=2010, poster_path='/i.jpg')
+        Watchlist.objects.create(user=self.owner, movie_id=496243, title='Parasite, "기생충"', release_year=2019)
+        Watchlist.objects.create(user=self.owner, movie_id=13, title='Forrest Gump')
+        self.tmdb = mock.Mock()
+        patcher = mock.patch('apps.movies.views.get_tmdb_service', return_value=self.tmdb)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def watchlist(self, user):
+        return set(Watchlist.objects.filter(user=user).values_list(*self.FIELDS))
+
+    def export(self, export_format):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('movies:watchlist_export'), {'format': export_format})
+        return b''.join(response.streaming_content)
+
+    def upload(self, name, content):
+        return self.client.post(reverse('movies:watchlist_import'), {'file': SimpleUploadedFile(name, content)}).json()
+
+    def round_trip(self, export_format):
+        content = self.export(export_format)
+        reader = User.objects.create_user(f'reader-{export_format}')
+        self.client.force_login(reader)
+        summary = self.upload(f'watchlist.{export_format}', content)
+        self.assertEqual(summary['imported'], 3)
+        self.assertEqual(self.watchlist(reader), self.watchlist(self.owner))
+
+        # Importing the same file again adds nothing.
+        self.assertEqual(self.upload(f'watchlist.{export_format}', content)['already_in_watchlist'], 3)
+        self.tmdb.find_movie.assert_not_called()
+
+    def test_json_round_trip(self):
+        self.round_trip('json')
+
+    def test_csv_round_trip(self):
+        self.round_trip('csv')
+
+    def test_jsonl_round_trip(self):
+        self.round_trip('jsonl')
+
+    def test_searches_stop_at_the_time_budget(self):
+        def find_movie(title, year=None):
+            time.sleep(0.3)
+            return movie(int(title.split()[-1]), title)
+
+        self.tmdb.find_movie.side_effect = find_movie
+        self.client.force_login(self.owner)
+        rows = [{'title': f'Movie {n}'} for n in range(1, 11)]
+        with mock.patch('apps.movies.views.WATCHLIST_IMPORT_TIME_BUDGET', 0.2):
+            summary = self.upload('titles.json', json.dumps(rows).encode())
+
+        searched = self.tmdb.find_movie.call_count
+        self.assertEqual(summary['imported'], searched)
+        self.assertEqual(summary['unprocessed'], len(rows) - searched)
+        self.assertGreater(summary['unprocessed'], 0)
+        self.assertTrue(summary['truncated'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MovieCounterTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        self.users = [User.objects.create_user(f'user{n}') for n in range(3)]
+
+    def add(self, model, user, movie_id, **kwargs):
+        item = model.objects.create(user=user, movie_id=movie_id, title=f'Movie {movie_id}', release_year=2000 + movie_id)
+        counters.record_added(counters.WATCHLIST if model is Watchlist else counters.FAVORITE, [item], **kwargs)
+        return item
+
+    def test_additions_and_removals_update_the_counters(self):
+        for user in self.users:
+            self.add(Watchlist, user, 1)
+        self.add(Favorite, self.users[0], 1)
+        self.add(Watchlist, self.users[0], 2, trending=False)
+
+        counter = MovieCounter.objects.get(movie_id=1)
+        self.assertEqual((counter.watchlist_count, counter.favorite_count), (3, 1))
+        daily = MovieDailyCount.objects.get(movie_id=1, day=timezone.localdate())
+        self.assertEqual((daily.watchlist_adds, daily.favorite_adds), (3, 1))
+        # Imports count towards all-time only.
+        self.assertEqual(MovieCounter.objects.get(movie_id=2).watchlist_count, 1)
+        self.assertFalse(MovieDailyCount.objects.filter(movie_id=2).exists())
+
+        counters.record_removed(counters.FAVORITE, 1)
+        counters.record_removed(counters.FAVORITE, 1)
+        self.assertEqual(MovieCounter.objects.get(movie_id=1).favorite_count, 0)
+
+    def test_leaderboards_roll_up_daily_counts(self):
+        today = timezone.localdate()
+        for movie_id, days_ago, adds in ((1, 0, 2), (2, 3, 5), (3, 10, 9), (2, 0, 1)):
+            MovieCounter.objects.get_or_create(movie_id=movie_id, defaults={'title': f'Movie {movie_id}', 'release_year': 1999})
+            MovieDailyCount.objects.create(movie_id=movie_id, day=today - datetime.timedelta(days=days_ago), watchlist_adds=adds)
+        MovieCounter.objects.filter(movie_id=3).update(watchlist_count=9)
+
+        written = counters.materialize_leaderboards()
+        self.assertEqual(written, {Leaderboard.DAILY: 2, Leaderboard.WEEKLY: 2, Leaderboard.ALL_TIME: 1})
+
+        daily = counters.get_leaderboard(Leaderboard.DAILY)
+        self.assertEqual([(entry['id'], entry['watchlist_count']) for entry in daily], [(1, 2), (2, 1)])
+        weekly = counters.get_leaderboard(Leaderboard.WEEKLY)
+        self.assertEqual([(entry['id'], entry['watchlist_count']) for entry in weekly], [(2, 6), (1, 2)])
+        self.assertEqual([entry['id'] for entry in counters.get_leaderboard(Leaderboard.ALL_TIME)], [3])
+        self.assertEqual(weekly[0]['release_date'], datetime.date(1999, 1, 1))
+
+    def test_reconcile_command_fixes_drift(self):
+        self.add(Watchlist, self.users[0], 1)
+        Watchlist.objects.create(user=self.users[1], movie_id=1, title='Movie 1')
+        Favorite.objects.create(user=self.users[0], movie_id=2, title='Movie 2', release_year=2002)
+        MovieCounter.objects.create(movie_id=3, title='Movie 3', watchlist_count=4)
+
+        output = StringIO()
+        call_command('reconcile_movie_counters', '--dry-run', stdout=output)
+        self.assertIn('2 would be fixed, 1 would be created', output.getvalue())
+        self.assertEqual(MovieCounter.objects.get(movie_id=1).watchlist_count, 1)
+
+        call_command('reconcile_movie_counters', stdout=StringIO())
+        counts = {c.movie_id: (c.watchlist_count, c.favorite_count) for c in MovieCounter.objects.all()}
+        self.assertEqual(counts, {1: (2, 0), 2: (0, 1), 3: (0, 0)})
+        self.assertEqual(MovieCounter.objects.get(movie_id=2).release_year, 2002)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class LocalizedTextTests(TestCase):
+    CORE = {
+        'id': 7, 'title': 'The Raid', 'overview': 'A SWAT team is trapped.', 'tagline': 'Redemption',
+        'genres': [{'id': 28, 'name': 'Action'}],
+    }
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        with mock.patch.object(tmdb, 'TMDB_API_KEY', 'test-key'):
+            self.tmdb = tmdb.TMDBService()
+        self.responses = {
+            'movie/7': self.CORE,
+            'genre/movie/list': {'genres': [{'id': 28, 'name': 'Aksi'}]},
+        }
+        self.requests = []
+
+        def make_request(endpoint, params=None):
+            self.requests.append(endpoint)
+            return self.responses.get(endpoint)
+
+        for patcher in (
+            mock.patch.object(self.tmdb, '_make_request', side_effect=make_request),
+            mock.patch.object(tmdb.prefetch, 'prefetch_translations'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def translations(self, *entries):
+        self.responses['movie/7/translations'] = {'translations': [
+            {'iso_639_1': language, 'iso_3166_1': region, 'data': data} for language, region, data in entries
+        ]}
+
+    def test_movie_without_translation_keeps_the_default_text(self):
+        self.translations(('fr', 'FR', {'title': 'Le Raid'}))
+        self.assertEqual(self.tmdb.get_movie_text(7, 'id'), {})
+        # The empty overlay is cached too, so TMDB is asked only once.
+        self.assertEqual(self.tmdb.get_movie_text(7, 'id'), {})
+        self.assertEqual(self.requests.count('movie/7/translations'), 1)
+
+        core = self.tmdb.get_movie_core(7, language='id')
+        self.assertEqual((core['title'], core['overview']), ('The Raid', 'A SWAT team is trapped.'))
+        self.assertEqual(core['genres'], [{'id': 28, 'name': 'Aksi'}])
+
+    def test_missing_fields_fall_back_field_by_field(self):
+        self.translations(('id', 'ID', {'title': '', 'overview': 'Tim SWAT terjebak.', 'homepage': 'https://x'}))
+        self.tmdb.get_movie_text(7, 'id')
+        core = self.tmdb.get_movie_core(7, language='id')
+        self.assertEqual((core['title'], core['overview'], core['tagline']), ('The Raid', 'Tim SWAT terjebak.', 'Redemption'))
+        self.assertNotIn('homepage', core)
+
+    def test_exact_region_wins_over_another_region(self):
+        self.translations(('id', 'MY', {'title': 'Serbuan Maut (MY)'}), ('id', 'ID', {'title': 'Serbuan Maut'}))
+        self.assertEqual(self.tmdb.get_movie_text(7, 'id-ID'), {'title': 'Serbuan Maut'})
+        caches['default'].clear()
+        caches['shared'].clear()
+        self.translations(('id', 'MY', {'title': 'Serbuan Maut (MY)'}))
+        self.assertEqual(self.tmdb.get_movie_text(7, 'id'), {'title': 'Serbuan Maut (MY)'})
+
+    def test_uncached_texts_are_queued_and_the_default_is_served(self):
+        cards = [{'id': 7, 'title': 'The Raid'}, {'id': 8, 'title': 'Headshot'}]
+        cache.set('tmdb:movie:8:text:id-ID', {'title': 'Headshot (ID)'}, 60)
+        localized = self.tmdb.localize_cards(cards, 'id')
+        self.assertEqual([card['title'] for card in localized], ['The Raid', 'Headshot (ID)'])
+        tmdb.prefetch.prefetch_translations.assert_called_once_with([7], 'id-ID')
+        self.assertEqual(self.requests, [])
+        self.assertIs(self.tmdb.localize_cards(cards, 'en'), cards)
+
+    def test_failed_translation_call_is_not_cached(self):
+        self.assertIsNone(self.tmdb.get_movie_text(7, 'id'))
+        self.translations(('id', 'ID', {'title': 'Serbuan Maut'}))
+        self.assertEqual(self.tmdb.get_movie_text(7, 'id'), {'title': 'Serbuan Maut'})
@@ -16,7 +16,18 @@ urlpatterns = [
     # Example: /movies/27205/
     path('<int:movie_id>/', views.movie_detail_view, name='detail'),
 
+    # Detail sub-resources loaded after the page renders
+    path('<int:movie_id>/credits/', views.movie_credits_view, name='credits'),
+    path('<int:movie_id>/trailer/', views.movie_trailer_view, name='trailer'),
+    path('<int:movie_id>/images/', views.movie_images_view, name='images'),
+
     # Watchlist actions
     path('watchlist/add/', views.add_to_watchlist, name='watchlist_add'),
     path('watchlist/<int:movie_id>/remove/', views.remove_from_watchlist, name='watchlist_remove'),
+    path('watchlist/export/', views.export_watchlist, name='watchlist_export'),
+    path('watchlist/import/', views.import_watchlist, name='watchlist_import'),
+
+    # Favorites actions
+    path('favorites/add/', views.add_to_favorites, name='favorites_add'),
+    path('favorites/<int:movie_id>/remove/', views.remove_from_favorites, name='favorites_remove'),
 ]
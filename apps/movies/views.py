@@ -1,18 +1,49 @@
+import csv
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from django.db import transaction
 from django.shortcuts import render, redirect
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
-from services.tmdb import TMDBService
-from movies.models import Watchlist
+from services import prefetch, ratelimit
+from services.registry import get_tmdb_service
+from movies.models import Favorite, TasteProfile, Watchlist
+from movies import counters, recommender
+
+# Columns of the watchlist export, also accepted by the import.
+WATCHLIST_EXPORT_FIELDS = ('movie_id', 'title', 'release_year', 'poster_path', 'added_at')
+
+# Import rows are resolved and inserted this many at a time.
+WATCHLIST_IMPORT_BATCH_SIZE = 200
+WATCHLIST_IMPORT_RESOLVE_WORKERS = 4
+
+# Rows read per import request; the rest of a larger file is left for the
+# next upload (rows already in the watchlist are skipped, so re-importing
+# the same file continues where it stopped).
+WATCHLIST_IMPORT_MAX_ROWS = 2000
+
+# Title searches of one import request stop after this many seconds. Rows
+# they did not reach are reported as unprocessed and resolved by uploading
+# the same file again.
+WATCHLIST_IMPORT_TIME_BUDGET = 20
+
+# Returned by _resolve_import_row for a row whose search was skipped
+# because the time budget ran out.
+_OUT_OF_TIME = object()
 
-# Create your views here.
-tmdb_service = TMDBService()
 
 def discover_movies_view(request):
     """
     Displays a filterable list of movies from TMDB's /discover endpoint.
     Supports filtering by genre, year, and rating, with pagination.
     """
+    tmdb_service = get_tmdb_service()
     # Fetch filter options
     genres_data = tmdb_service.get_genres()
     all_genres = genres_data.get('genres', []) if genres_data else []
@@ -49,6 +80,16 @@ def discover_movies_view(request):
             'has_next': movies_data.get('page', 1) < movies_data.get('total_pages', 1),
         }
     }
+
+    # Users tend to page forward; warm the next page in the background
+    if context['pagination']['has_next']:
+        prefetch.prefetch_list_page(
+            'discover_movies',
+            genre=selected_genre,
+            year=selected_year,
+            rating=selected_rating,
+            page=context['pagination']['current_page'] + 1,
+        )
     
     return render(request, 'pages/movie_list.html', context)
 
@@ -57,6 +98,7 @@ def search_view(request):
     """
     Handles movie searches. Displays a search form and the results.
     """
+    tmdb_service = get_tmdb_service()
     query = request.GET.get('query')
     page_number = request.GET.get('page', 1)
     movies_data = None
@@ -75,6 +117,10 @@ def search_view(request):
             'has_next': movies_data.get('page', 1) < movies_data.get('total_pages', 1) if movies_data else False,
         } if movies_data else {}
     }
+
+    # Users tend to page forward; warm the next page in the background
+    if context['pagination'].get('has_next'):
+        prefetch.prefetch_list_page('search_movies', query=query, page=context['pagination']['current_page'] + 1)
     return render(request, 'pages/search.html', context)
 
 
@@ -82,6 +128,7 @@ def trending_movies_view(request):
     """
     Displays the top trending movies for the week.
     """
+    tmdb_service = get_tmdb_service()
     page_number = request.GET.get('page', 1)
     movies_data = tmdb_service.get_trending_movies(page=page_number)
 
@@ -95,41 +142,80 @@ def trending_movies_view(request):
             'has_next': movies_data.get('page', 1) < movies_data.get('total_pages', 1),
         } if movies_data else {}
     }
+
+    # Users tend to page forward; warm the next page in the background
+    if context['pagination'].get('has_next'):
+        prefetch.prefetch_list_page('get_trending_movies', page=context['pagination']['current_page'] + 1)
     return render(request, 'pages/trending.html', context)
 
 
 def movie_detail_view(request, movie_id: int):
     """
-    Displays the detailed information for a single movie and finds the official trailer.
+    Displays the detailed information for a single movie.
+    Only the core details are fetched here. Credits and the trailer are
+    rendered inline when already cached, otherwise the page loads them from
+    the lightweight JSON endpoints below after the core details are shown.
     """
-    movie_details = tmdb_service.get_movie_details(movie_id)
-    is_in_watchlist = False
+    tmdb_service = get_tmdb_service()
+    movie_details = tmdb_service.get_movie_core(movie_id, fetch=False)
+    prefetch.record_detail_view(cache_hit=movie_details is not None)
+    if movie_details is None:
+        movie_details = tmdb_service.get_movie_core(movie_id)
+    is_in_watchlist = is_favorite = False
     if request.user.is_authenticated:
         is_in_watchlist = Watchlist.objects.filter(user=request.user, movie_id=movie_id).exists()
+        is_favorite = Favorite.objects.filter(user=request.user, movie_id=movie_id).exists()
+
+    credits = tmdb_service.get_movie_credits(movie_id, fetch=False)
+    videos = tmdb_service.get_movie_videos(movie_id, fetch=False)
 
-    # Find the official trailer from the video results
-    trailer = None
-    if movie_details and 'videos' in movie_details and 'results' in movie_details['videos']:
-        for video in movie_details['videos']['results']:
-            if video['type'] == 'Trailer' and video['official']:
-                trailer = video
-                break # Stop after finding the first official trailer
-    
     context = {
         'page_title': movie_details.get('title', 'Movie Details') if movie_details else 'Movie not Found',
         'movie': movie_details,
         'is_in_watchlist': is_in_watchlist,
-        'trailer': trailer,
+        'is_favorite': is_favorite,
+        'cast': credits['cast'] if credits else None,
+        'trailer': videos['trailer'] if videos else None,
+        'trailer_loaded': videos is not None,
     }
     return render(request, 'pages/movie_detail.html', context)
 
 
-@require_POST
-@login_required
-def add_to_watchlist(request):
+def movie_credits_view(request, movie_id: int):
     """
-    Adds a movie to the logged-in user's watchlist.
-    Expects movie details to be submitted via a POST form.
+    Returns the top cast of a movie as JSON, for progressive loading.
+    """
+    credits = get_tmdb_service().get_movie_credits(movie_id)
+    if credits is None:
+        return JsonResponse({'error': 'Credits could not be loaded.'}, status=502)
+    return JsonResponse(credits)
+
+
+def movie_trailer_view(request, movie_id: int):
+    """
+    Returns the official trailer of a movie (or null) as JSON.
+    """
+    videos = get_tmdb_service().get_movie_videos(movie_id)
+    if videos is None:
+        return JsonResponse({'error': 'Videos could not be loaded.'}, status=502)
+    return JsonResponse(videos)
+
+
+def movie_images_view(request, movie_id: int):
+    """
+    Returns the posters and backdrops of a movie as JSON, fetched on demand.
+    """
+    images = get_tmdb_service().get_movie_images(movie_id)
+    if images is None:
+        return JsonResponse({'error': 'Images could not be loaded.'}, status=502)
+    return JsonResponse(images)
+
+
+def _add_to_list(request, model, kind: str):
+    """
+    Adds the movie submitted via a POST form to one of the user's lists and
+    bumps its popularity counters in the same transaction.
+    Returns the created item, or None if it was invalid or already there.
     """
     movie_id = request.POST.get('movie_id')
     title = request.POST.get('title')
@@ -140,8 +226,10 @@ def add_to_watchlist(request):
     if release_year_str and release_year_str.isdigit():
         release_year = int(release_year_str)
 
-    if movie_id and title:
-        Watchlist.objects.get_or_create(
+    if not (movie_id and movie_id.isdigit() and title):
+        return None
+    with transaction.atomic():
+        item, created = model.objects.get_or_create(
             user=request.user,
             movie_id=int(movie_id),
             defaults={
@@ -150,6 +238,33 @@ def add_to_watchlist(request):
                 'release_year': release_year,
             }
         )
+        if created:
+            counters.record_added(kind, [item])
+    return item if created else None
+
+
+def _remove_from_list(request, model, kind: str, movie_id: int) -> bool:
+    """
+    Removes a movie from one of the user's lists and decrements its counter
+    in the same transaction. Returns True if it was on the list.
+    """
+    with transaction.atomic():
+        deleted, _ = model.objects.filter(user=request.user, movie_id=movie_id).delete()
+        if deleted:
+            counters.record_removed(kind, movie_id)
+    return bool(deleted)
+
+
+@require_POST
+@login_required
+def add_to_watchlist(request):
+    """
+    Adds a movie to the logged-in user's watchlist.
+    Expects movie details to be submitted via a POST form.
+    """
+    item = _add_to_list(request, Watchlist, counters.WATCHLIST)
+    if item:
+        recommender.on_watchlist_added(request.user, item.movie_id)
     
     # Redirect back to the previous page, or home if referrer is not available
     return redirect(request.META.get('HTTP_REFERER', 'dashboard:home'))
@@ -161,6 +276,216 @@ def remove_from_watchlist(request, movie_id: int):
     """
     Removes a movie from the logged-in user's watchlist.
     """
-    Watchlist.objects.filter(user=request.user, movie_id=movie_id).delete()
+    if _remove_from_list(request, Watchlist, counters.WATCHLIST, movie_id):
+        recommender.on_watchlist_removed(request.user, movie_id)
     # Redirect back to the previous page, or home if referrer is not available
-    return redirect(request.META.get('HTTP_REFERER', 'dashboard:home'))
\ No newline at end of file
+    return redirect(request.META.get('HTTP_REFERER', 'dashboard:home'))
+
+
+@require_POST
+@login_required
+def add_to_favorites(request):
+    """
+    Adds a movie to the logged-in user's favorites.
+    Expects movie details to be submitted via a POST form.
+    """
+    _add_to_list(request, Favorite, counters.FAVORITE)
+    # Redirect back to the previous page, or home if referrer is not available
+    return redirect(request.META.get('HTTP_REFERER', 'dashboard:home'))
+
+
+@require_POST
+@login_required
+def remove_from_favorites(request, movie_id: int):
+    """
+    Removes a movie from the logged-in user's favorites.
+    """
+    _remove_from_list(request, Favorite, counters.FAVORITE, movie_id)
+    # Redirect back to the previous page, or home if referrer is not available
+    return redirect(request.META.get('HTTP_REFERER', 'dashboard:home'))
+
+
+class _Echo:
+    """
+    A file-like object whose write() returns the value, so csv.writer can
+    produce lines for a StreamingHttpResponse.
+    """
+    def write(self, value):
+        return value
+
+
+@require_GET
+@login_required
+def export_watchlist(request):
+    """
+    Streams the user's whole watchlist as CSV (default), JSON or JSON Lines
+    (?format=json / ?format=jsonl). Rows are read with .iterator(), so the
+    list is never loaded into memory at once.
+    """
+    export_format = request.GET.get('format', 'csv')
+    rows = (
+        Watchlist.objects.filter(user=request.user)
+        .order_by('-added_at', '-id')
+        .values_list(*WATCHLIST_EXPORT_FIELDS)
+        .iterator(chunk_size=2000)
+    )
+
+    def as_dict(row):
+        item = dict(zip(WATCHLIST_EXPORT_FIELDS, row))
+        item['added_at'] = item['added_at'].isoformat()
+        return item
+
+    if export_format == 'json':
+        def stream():
+            yield '['
+            for index, row in enumerate(rows):
+                yield (',' if index else '') + json.dumps(as_dict(row))
+            yield ']'
+        content_type, extension = 'application/json', 'json'
+    elif export_format == 'jsonl':
+        def stream():
+            for row in rows:
+                yield json.dumps(as_dict(row)) + '\n'
+        content_type, extension = 'application/x-ndjson', 'jsonl'
+    else:
+        def stream():
+            writer = csv.writer(_Echo())
+            yield writer.writerow(WATCHLIST_EXPORT_FIELDS)
+            for row in rows:
+                yield writer.writerow(as_dict(row).values())
+        content_type, extension = 'text/csv', 'csv'
+
+    response = StreamingHttpResponse(stream(), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="watchlist.{extension}"'
+    return response
+
+
+def _read_import_rows(upload):
+    """
+    Yields import rows one at a time from an uploaded CSV, JSON array (as
+    produced by the JSON export) or JSON Lines file. Rows are not validated.
+    """
+    text = io.TextIOWrapper(upload, encoding='utf-8-sig')
+    if upload.name.endswith(('.jsonl', '.ndjson')):
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+    elif upload.name.endswith('.json'):
+        rows = json.load(text)
+        if not isinstance(rows, list):
+            raise ValueError('expected a JSON array of movies')
+        yield from rows
+    else:
+        yield from csv.DictReader(text)
+
+
+def _resolve_import_row(row, deadline):
+    """
+    Returns the watchlist fields for an import row, resolving title-only rows
+    through a TMDB search, or None if the movie cannot be identified.
+    Searches are not started after `deadline` (time.monotonic()); such rows
+    return _OUT_OF_TIME.
+    """
+    title = (row.get('title') or '').strip()
+    year = str(row.get('release_year') or '').strip()
+    movie_id = str(row.get('movie_id') or '').strip()
+
+    if movie_id.isdigit() and title:
+        return {
+            'movie_id': int(movie_id),
+            'title': title[:200],
+            'poster_path': row.get('poster_path') or None,
+            'release_year': int(year) if year.isdigit() else None,
+        }
+    if not title:
+        return None
+    if time.monotonic() > deadline:
+        return _OUT_OF_TIME
+
+    # Imports run on resolver threads, where the request's context is not
+    # inherited; give way to page views on the TMDB rate limiter.
+    with ratelimit.priority(ratelimit.BACKGROUND):
+        movie = get_tmdb_service().find_movie(title, year or None)
+    if not movie:
+        return None
+    release_date = movie.get('release_date') or ''
+    return {
+        'movie_id': movie['id'],
+        'title': movie['title'][:200],
+        'poster_path': movie.get('poster_path'),
+        'release_year': int(release_date[:4]) if release_date[:4].isdigit() else None,
+    }
+
+
+@require_POST
+@login_required
+def import_watchlist(request):
+    """
+    Bulk-imports a CSV, JSON or JSON Lines file (any export format) into the
+    user's watchlist. Rows without a movie_id are resolved by title through
+    TMDB at background priority. The file is processed in batches: each batch
+    is resolved with a few concurrent searches and inserted with a single
+    bulk_create. At most WATCHLIST_IMPORT_MAX_ROWS rows are read and at most
+    WATCHLIST_IMPORT_TIME_BUDGET seconds spent on searches per request; the
+    summary reports what was left for another upload.
+    """
+    upload = request.FILES.get('file')
+    if not upload:
+        return JsonResponse({'error': 'A CSV, JSON or JSON Lines file is required.'}, status=400)
+
+    summary = {
+        'imported': 0, 'already_in_watchlist': 0, 'unresolved': 0, 'invalid': 0, 'unprocessed': 0,
+        'unresolved_titles': [], 'truncated': False,
+    }
+    rows = _read_import_rows(upload)
+    remaining = WATCHLIST_IMPORT_MAX_ROWS
+    deadline = time.monotonic() + WATCHLIST_IMPORT_TIME_BUDGET
+    try:
+        with ThreadPoolExecutor(max_workers=WATCHLIST_IMPORT_RESOLVE_WORKERS) as executor:
+            while remaining and time.monotonic() < deadline:
+                batch = list(islice(rows, min(WATCHLIST_IMPORT_BATCH_SIZE, remaining)))
+                if not batch:
+                    break
+                remaining -= len(batch)
+
+                # A JSON file may hold anything; only objects are movies.
+                valid = [row for row in batch if isinstance(row, dict)]
+                summary['invalid'] += len(batch) - len(valid)
+                batch = valid
+
+                resolved = {}
+                for row, fields in zip(batch, executor.map(_resolve_import_row, batch, [deadline] * len(batch))):
+                    if fields is _OUT_OF_TIME:
+                        summary['unprocessed'] += 1
+                    elif fields is None:
+                        summary['unresolved'] += 1
+                        if len(summary['unresolved_titles']) < 50:
+                            summary['unresolved_titles'].append(row.get('title') or '')
+                    else:
+                        resolved.setdefault(fields['movie_id'], fields)
+
+                with transaction.atomic():
+                    # Checked in the same transaction as the insert, so only rows
+                    # that are really inserted are counted.
+                    existing = set(
+                        Watchlist.objects.filter(user=request.user, movie_id__in=resolved)
+                        .values_list('movie_id', flat=True)
+                    )
+                    new_items = [
+                        Watchlist(user=request.user, **fields)
+                        for movie_id, fields in resolved.items() if movie_id not in existing
+                    ]
+                    Watchlist.objects.bulk_create(new_items, ignore_conflicts=True)
+                    counters.record_added(counters.WATCHLIST, new_items, trending=False)
+                summary['imported'] += len(new_items)
+                summary['already_in_watchlist'] += len(existing)
+            # True when rows were left for another upload, by the row cap or the time budget.
+            summary['truncated'] = bool(summary['unprocessed']) or next(rows, None) is not None
+    except (ValueError, csv.Error) as e:
+        summary['error'] = f'Could not read the file: {e}'
+
+    if summary['imported']:
+        # Rebuilt lazily from the whole watchlist on the next dashboard view.
+        TasteProfile.objects.filter(user=request.user).delete()
+        recommender.invalidate_picks(request.user)
+    return JsonResponse(summary, status=400 if 'error' in summary and not summary['imported'] else 200)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from services import profiling
+
+        # Template rendering shows up as spans in request profiles.
+        profiling.install_template_spans()
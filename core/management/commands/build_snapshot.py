@@ -0,0 +1,87 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.models import SimilarMovies
+from services import cache, ratelimit, snapshot
+from services.registry import get_tmdb_service
+
+# TMDB list endpoints whose first pages make up the hot working set.
+LIST_SOURCES = (
+    'get_trending_movies', 'get_popular_movies', 'get_top_rated_movies',
+    'get_now_playing_movies', 'get_upcoming_movies', 'discover_movies',
+)
+
+# What the detail page of a listed movie loads before the user scrolls.
+DETAIL_RESOURCES = ('get_movie_core', 'get_movie_credits', 'get_movie_videos')
+
+
+class Command(BaseCommand):
+    help = (
+        "Dumps the hot working set (genres, list pages, detail resources of the "
+        "listed movies, precomputed similar movies) into a memory-mappable "
+        "snapshot that new workers serve from until their own cache is warm."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=snapshot.MIRAI_SNAPSHOT_PATH, help='Snapshot file to write.')
+        parser.add_argument('--pages', type=int, default=3, help='List pages to include per list endpoint.')
+        parser.add_argument('--details', type=int, default=200, help='Number of listed movies whose details are included.')
+        parser.add_argument('--similar', type=int, default=2000, help='Number of precomputed similar-movie lists to include.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Maximum number of TMDB calls in flight.')
+        parser.add_argument(
+            '--ttl', type=int,
+            help="Seconds every entry stays valid after the build (default: each entry's own cache lifetime).",
+        )
+
+    def handle(self, *args, **options):
+        # A batch job: give way to interactive page requests on the TMDB rate limiter.
+        ratelimit.set_default_priority(ratelimit.BACKGROUND)
+        tmdb_service = get_tmdb_service()
+        start = time.perf_counter()
+
+        with cache.recording() as recorded, ThreadPoolExecutor(max_workers=max(options['concurrency'], 1)) as executor:
+            def run_all(calls):
+                # Worker threads need this context to record into the same snapshot.
+                futures = [executor.submit(contextvars.copy_context().run, call) for call in calls]
+                return [future.result() for future in futures]
+
+            tmdb_service.get_genres()
+            pages = run_all(
+                lambda name=name, page=page: getattr(tmdb_service, name)(page=page)
+                for name in LIST_SOURCES for page in range(1, options['pages'] + 1)
+            )
+
+            movie_ids = []
+            for data in pages:
+                for movie in (data or {}).get('results', []):
+                    if movie['id'] not in movie_ids:
+                        movie_ids.append(movie['id'])
+            movie_ids = movie_ids[:options['details']]
+            run_all(
+                lambda name=name, movie_id=movie_id: getattr(tmdb_service, name)(movie_id)
+                for movie_id in movie_ids for name in DETAIL_RESOURCES
+            )
+
+            titles = SimilarMovies.objects.order_by('seed_rank').values_list('title', flat=True)[:options['similar']]
+            for title in titles:
+                SimilarMovies.similar_for_title(title)
+
+        if not recorded:
+            raise CommandError("Nothing to snapshot: every upstream call failed.")
+
+        written = snapshot.write(
+            options['output'],
+            ((key, value, options['ttl'] or timeout) for key, (value, timeout) in recorded.items()),
+            cache_version=cache.CACHE_VERSION,
+        )
+        self.stdout.write(
+            f"{len(movie_ids)} movies from {len(pages)} list pages, {len(titles)} similar-movie lists."
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written['entries']} entries ({written['bytes'] / 1024:.0f} KiB) to "
+            f"{os.path.relpath(options['output'])} in {time.perf_counter() - start:.1f}s."
+        ))
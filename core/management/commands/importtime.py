@@ -0,0 +1,108 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Code run in a fresh interpreter: load the WSGI application the way a worker
+# does on boot, then force URL loading, which is what the first request does.
+COLD_START_SNIPPET = """
+import json, time
+start = time.perf_counter()
+from mirAI.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({"wall_ms": (time.perf_counter() - start) * 1000}))
+"""
+
+# Matches lines such as "import time:       210 |       3150 |   django.urls"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures worker cold-start time with `python -X importtime` and "
+        "reports the slowest imports."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Number of fresh interpreters to measure.')
+        parser.add_argument('--top', type=int, default=15, help='Number of slowest modules to list.')
+        parser.add_argument('--output', help='Append the result as one JSON line to this file to track it over time.')
+        parser.add_argument('--max-ms', type=float, help='Exit with an error if the median cold start is slower than this.')
+
+    def handle(self, *args, **options):
+        runs = [self._measure() for _ in range(max(options['runs'], 1))]
+
+        wall_ms = statistics.median(run['wall_ms'] for run in runs)
+        import_ms = statistics.median(run['import_ms'] for run in runs)
+
+        # Per-module cumulative times of the median run are the most representative.
+        median_run = sorted(runs, key=lambda run: run['wall_ms'])[len(runs) // 2]
+        slowest = sorted(median_run['modules'].items(), key=lambda item: item[1], reverse=True)
+
+        self.stdout.write(f"Cold start (median of {len(runs)} runs): {wall_ms:.1f} ms wall, {import_ms:.1f} ms in imports (incl. interpreter startup)")
+        self.stdout.write("Slowest top-level imports:")
+        for module, cumulative_ms in slowest[:options['top']]:
+            self.stdout.write(f"  {cumulative_ms:9.1f} ms  {module}")
+
+        heavy = [name for name in ('google.generativeai', 'grpc') if name in median_run['all_modules']]
+        if heavy:
+            self.stdout.write(self.style.WARNING(f"Heavy SDK modules imported at startup: {', '.join(heavy)}"))
+
+        if options['output']:
+            record = {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'runs': len(runs),
+                'wall_ms': round(wall_ms, 1),
+                'import_ms': round(import_ms, 1),
+                'top_modules': [[name, round(ms, 1)] for name, ms in slowest[:options['top']]],
+            }
+            with open(options['output'], 'a') as f:
+                f.write(json.dumps(record) + "\n")
+
+        if options['max_ms'] is not None and wall_ms > options['max_ms']:
+            raise CommandError(f"Cold start took {wall_ms:.1f} ms, above the {options['max_ms']:.1f} ms limit.")
+
+    def _measure(self):
+        """
+        Runs one cold start in a fresh interpreter and parses its importtime report.
+        """
+        env = os.environ.copy()
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'mirAI.settings')
+        # Make sure the benchmark never warms up the services on its own.
+        env.pop('MIRAI_WARM_UP', None)
+
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', COLD_START_SNIPPET],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Cold start failed:\n{result.stderr[-2000:]}")
+
+        top_level = {}
+        all_modules = set()
+        for line in result.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if not match:
+                continue
+            _, cumulative_us, indent, module = match.groups()
+            all_modules.add(module)
+            if not indent:
+                top_level[module] = int(cumulative_us) / 1000
+
+        wall_ms = json.loads(result.stdout.strip().splitlines()[-1])['wall_ms']
+        return {
+            'wall_ms': wall_ms,
+            'import_ms': sum(top_level.values()),
+            'modules': top_level,
+            'all_modules': all_modules,
+        }
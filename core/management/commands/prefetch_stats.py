@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from services import metrics
+
+
+class Command(BaseCommand):
+    help = "Shows the prefetch engine counters and the detail page cache hit rate across all workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Clear the counters after showing them.')
+
+    def handle(self, *args, **options):
+        detail = metrics.snapshot('detail.')
+        hits, misses = detail.get('detail.hit', 0), detail.get('detail.miss', 0)
+        views = hits + misses
+        hit_rate = f"{hits / views:.1%}" if views else "n/a"
+        self.stdout.write(f"Detail page cache hit rate: {hit_rate} ({hits} hits, {misses} misses)")
+
+        for name, value in metrics.snapshot('prefetch.').items():
+            self.stdout.write(f"  {name:<22} {value}")
+
+        if options['reset']:
+            metrics.reset('detail.')
+            metrics.reset('prefetch.')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from services import ratelimit
+
+
+class Command(BaseCommand):
+    help = "Shows queue wait statistics of the host-wide TMDB rate limiter per priority class."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Clear the statistics after showing them.')
+
+    def handle(self, *args, **options):
+        bucket = ratelimit.tmdb_bucket
+        self.stdout.write(f"TMDB rate limit: {bucket.rate:g} req/s, burst {bucket.burst:g} ({bucket.path})")
+
+        stats = bucket.stats()
+        if not stats:
+            self.stdout.write("No requests recorded yet.")
+        for level, row in sorted(stats.items()):
+            self.stdout.write(
+                f"  {level:<12} {row['requests']:>8} requests, {row['waited']:>6} waited, {row['dropped']:>4} dropped, "
+                f"avg wait {row['avg_wait_ms']:.1f} ms, max wait {row['max_wait_ms']:.1f} ms"
+            )
+
+        if options['reset']:
+            bucket.reset_stats()
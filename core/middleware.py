@@ -0,0 +1,154 @@
+import mimetypes
+import os
+import random
+import re
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.db import connection
+from django.http import FileResponse, HttpResponseNotModified
+from django.middleware.gzip import GZipMiddleware
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from core.storage import compressed_variant
+from services import profiling
+
+# --- Constants ---
+# Content-hashed names written by the manifest storage, e.g. styles.1a2b3c4d5e6f.css
+HASHED_NAME = re.compile(r"\.[0-9a-f]{12}\.[^/.]+$")
+
+# Hashed files never change, so they may be cached for a year without revalidation.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Unhashed names (e.g. a file linked without {% static %}) are revalidated hourly.
+STATIC_CACHE_CONTROL = "public, max-age=3600"
+
+# Dynamic responses worth compressing: pages and the JSON APIs.
+COMPRESSIBLE_CONTENT_TYPES = ('text/html', 'application/json')
+
+# Staff can profile any request with ?_profile=1 or this header.
+PROFILE_QUERY_PARAM = '_profile'
+PROFILE_HEADER = 'X-MirAI-Profile'
+
+
+class StaticAssetMiddleware:
+    """
+    Serves collected static files (STATIC_ROOT) straight from the app process,
+    before sessions or auth are touched. Picks the precompressed Brotli or
+    gzip variant written by CompressedManifestStaticFilesStorage when the
+    client accepts it, and marks content-hashed files as immutable. Not used
+    with DEBUG on, where the staticfiles app serves the source files instead.
+    """
+
+    def __init__(self, get_response):
+        if settings.DEBUG:
+            # Collected files would shadow the edited sources in development.
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.strip('/') + '/'
+        self.root = settings.STATIC_ROOT
+
+    def __call__(self, request):
+        if self.root and request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        """
+        Returns a response for a collected static file, or None if it does
+        not exist so the request falls through to the URL patterns.
+        """
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        content_type, _ = mimetypes.guess_type(path)
+        served_path, encoding = compressed_variant(path, request.headers.get('Accept-Encoding', ''))
+        stat = os.stat(served_path)
+        cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(name) else STATIC_CACHE_CONTROL
+
+        if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(served_path, 'rb'), content_type=content_type or 'application/octet-stream')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        response.headers['Cache-Control'] = cache_control
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware limited to HTML pages and JSON responses; images and
+    precompressed static files are passed through unchanged.
+    """
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in COMPRESSIBLE_CONTENT_TYPES:
+            return response
+        return super().process_response(request, response)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when a staff user asks for it (?_profile=1 or the
+    X-MirAI-Profile header) or, at random, PROFILE_SAMPLE_RATE of all
+    requests. Requested profiles are always stored; sampled ones only when
+    the request was slower than PROFILE_SLOW_MS. Stored profiles are listed
+    at /staff/profiles/; responses to staff users name the profile they
+    produced. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reason = self.profile_reason(request)
+        if reason is None:
+            return self.get_response(request)
+
+        profile = profiling.RequestProfile(reason)
+        profile.start()
+        try:
+            with connection.execute_wrapper(profile.sql_wrapper):
+                response = self.get_response(request)
+        finally:
+            profile.stop()
+
+        if reason == 'requested' or profile.duration_ms >= profiling.PROFILE_SLOW_MS:
+            meta = {
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'user': request.user.get_username() if request.user.is_authenticated else None,
+            }
+            try:
+                profile_id = profiling.store(profile, meta)
+            except OSError as e:
+                profiling.logger.warning(f"Could not store profile {profile.id}: {e}")
+            else:
+                # Profile ids are only useful (and only viewable) for staff.
+                if request.user.is_staff:
+                    response.headers[PROFILE_HEADER] = profile_id
+        return response
+
+    def profile_reason(self, request):
+        """
+        Returns why this request is profiled ('requested' or 'sampled'), or None.
+        """
+        asked = request.GET.get(PROFILE_QUERY_PARAM) == '1' or request.headers.get(PROFILE_HEADER) == '1'
+        if asked and request.user.is_staff:
+            return 'requested'
+        if profiling.PROFILE_SAMPLE_RATE and random.random() < profiling.PROFILE_SAMPLE_RATE:
+            return 'sampled'
+        return None
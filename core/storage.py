@@ -0,0 +1,88 @@
+import gzip
+import logging
+import os
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+# Brotli is optional: without it only gzip variants are built.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Text assets worth precompressing; images and fonts are already compressed.
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.xml', '.html')
+
+# Files smaller than this gain nothing from compression.
+MIN_COMPRESS_SIZE = 256
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage (content-hashed file names, so every asset can be cached
+    forever) that also writes `.gz` and, when the brotli package is installed,
+    `.br` variants of each hashed text asset during collectstatic.
+    core.middleware.StaticAssetMiddleware serves these variants.
+    """
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected yet (development, tests): use the plain name.
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+        for hashed_name in sorted(hashed_names):
+            if hashed_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self._write_compressed(hashed_name)
+
+    def _write_compressed(self, name: str) -> None:
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+
+        # mtime=0 keeps the gzip output identical across builds.
+        variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(content, quality=11)
+
+        for suffix, compressed in variants.items():
+            if len(compressed) >= len(content):
+                continue
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+        logger.debug(f"Precompressed {name} ({len(content)} bytes).")
+
+
+def compressed_variant(path: str, accept_encoding: str):
+    """
+    Returns (path, encoding) of the best precompressed variant of a file the
+    client accepts, or (path, None) to serve the file as is.
+    """
+    accepted = set()
+    for part in accept_encoding.lower().split(','):
+        encoding, _, params = part.partition(';')
+        # "br;q=0" means the client refuses it.
+        if not re.match(r"\s*q\s*=\s*0(\.0*)?\s*$", params):
+            accepted.add(encoding.strip())
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in accepted and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
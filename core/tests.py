@@ -1,3 +1,371 @@
-from django.test import TestCase
+import os
+import time
+import tempfile
+import threading
+import multiprocessing
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+# Only modules that do not load services.cache: the spawned cache nodes
+# import this file before _setup_node configures the cache.
+from core.middleware import (
+    IMMUTABLE_CACHE_CONTROL, PROFILE_HEADER, STATIC_CACHE_CONTROL, ProfilingMiddleware, StaticAssetMiddleware,
+)
+from core.storage import CompressedManifestStaticFilesStorage
+from services import ratelimit
+
+# Keys every worker of the hit-ratio test reads, and how often each reads them.
+KEYS = [f"test:key:{i}" for i in range(20)]
+ROUNDS = 10
+WORKERS = 4
+
+
+def _setup_node(location: str) -> None:
+    # Each child is a separate node: a fresh interpreter with its own L1,
+    # sharing only the L2 file with the other nodes.
+    os.environ.update(
+        DJANGO_SETTINGS_MODULE="mirAI.settings",
+        MIRAI_SHARED_CACHE_LOCATION=location,
+        MIRAI_CACHE_SYNC_INTERVAL="0",
+        MIRAI_SNAPSHOT_ENABLED="False",
+    )
+    import django
+    django.setup()
+
+
+def _read_keys(location: str, results) -> None:
+    _setup_node(location)
+    from services import cache
+
+    loads = 0
+
+    def loader(key):
+        nonlocal loads
+        loads += 1
+        return f"value of {key}"
+
+    for _ in range(ROUNDS):
+        for key in KEYS:
+            assert cache.get_or_set(key, lambda: loader(key), 60) == f"value of {key}"
+    results.put((loads, cache.stats()))
+
+
+def _serve_commands(location: str, conn) -> None:
+    # Runs cache operations sent by the test until it sends None.
+    _setup_node(location)
+    from services import cache
+
+    while True:
+        command = conn.recv()
+        if command is None:
+            break
+        name, args = command
+        conn.send(getattr(cache, name)(*args))
+
+
+class SharedCacheTests(SimpleTestCase):
+    """
+    Runs several processes against one shared cache file, as separate
+    workers or hosts would run against the shared tier.
+    """
+
+    def setUp(self):
+        self.context = multiprocessing.get_context("spawn")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, "shared.sqlite3")
+
+    def start_node(self):
+        conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=_serve_commands, args=(self.location, child_conn))
+        process.start()
+
+        def stop():
+            conn.send(None)
+            process.join(timeout=30)
+        self.addCleanup(stop)
+
+        def call(name, *args):
+            conn.send((name, args))
+            return conn.recv()
+        return call
+
+    def test_hit_ratio_across_processes(self):
+        results = self.context.Queue()
+        processes = [
+            self.context.Process(target=_read_keys, args=(self.location, results)) for _ in range(WORKERS)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join(timeout=30)
+            self.assertEqual(process.exitcode, 0)
+
+        # Racing workers may each load a key once before the first write
+        # lands, but never more than that.
+        total_loads = sum(loads for loads, _ in outcomes)
+        self.assertGreaterEqual(total_loads, len(KEYS))
+        self.assertLessEqual(total_loads, len(KEYS) * WORKERS)
+
+        lookups = sum(stats["lookups"] for _, stats in outcomes)
+        hits = lookups - sum(stats["misses"] for _, stats in outcomes)
+        self.assertGreaterEqual(hits / lookups, 0.9)
+
+    def test_invalidation_reaches_other_nodes(self):
+        node_a, node_b = self.start_node(), self.start_node()
+
+        node_a("set", "test:movie", "v1", 60)
+        self.assertEqual(node_b("get", "test:movie"), "v1")
+
+        # Node B now holds v1 in its L1; the invalidation must evict it there.
+        node_a("invalidate", "test:movie")
+        node_a("set", "test:movie", "v2", 60)
+        self.assertEqual(node_b("get", "test:movie"), "v2")
+
+        node_b("invalidate", "test:movie")
+        self.assertIsNone(node_a("get", "test:movie"))
+
+    def test_invalidation_after_event_log_reset(self):
+        node_a, node_b = self.start_node(), self.start_node()
+
+        for _ in range(3):
+            node_a("invalidate", "test:other")
+        node_a("set", "test:movie", "v1", 60)
+        self.assertEqual(node_b("get", "test:movie"), "v1")
+
+        # The log starts over, e.g. after the shared tier was flushed or all
+        # events expired during an idle hour; node B has already seen event 3.
+        for key in ("cache:events:head", "cache:events:1", "cache:events:2", "cache:events:3"):
+            node_a("delete", key)
+        node_a("invalidate", "test:movie")
+        node_a("set", "test:movie", "v2", 60)
+        self.assertEqual(node_b("get", "test:movie"), "v2")
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.bucket = ratelimit.TokenBucket("test", rate=10, burst=10, path=os.path.join(directory.name, "bucket.sqlite3"))
+
+    def test_penalty_beyond_the_deadline_drops_without_sleeping(self):
+        self.bucket.penalize(60)
+        start = time.monotonic()
+        with self.assertRaises(ratelimit.RateLimitTimeout):
+            self.bucket.acquire(ratelimit.INTERACTIVE)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(self.bucket.stats()[ratelimit.INTERACTIVE]["dropped"], 1)
+
+    def test_short_penalty_is_waited_out(self):
+        self.bucket.penalize(0.2)
+        waited = self.bucket.acquire(ratelimit.INTERACTIVE)
+        self.assertGreaterEqual(waited, 0.2)
+        stats = self.bucket.stats()[ratelimit.INTERACTIVE]
+        self.assertEqual((stats["waited"], stats["dropped"]), (1, 0))
+
+    def test_penalize_for_retry_after_header(self):
+        self.assertEqual(self.bucket.penalize_for("30"), 30.0)
+        with self.assertRaises(ratelimit.RateLimitTimeout):
+            self.bucket.acquire(ratelimit.INTERACTIVE)
+        self.assertTrue(self.bucket.under_pressure())
+
+
+class PrefetchEngineTests(SimpleTestCase):
+    def setUp(self):
+        from services import prefetch
+        self.prefetch = prefetch
+        for patcher in (
+            mock.patch.object(prefetch, "PREFETCH_ENABLED", True),
+            mock.patch.object(prefetch.metrics, "incr"),
+            mock.patch.object(ratelimit.tmdb_bucket, "under_pressure", return_value=False),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def counted(self, name):
+        return sum(1 for call in self.prefetch.metrics.incr.call_args_list if call.args[0] == name)
+
+    def test_duplicate_keys_are_deduped_while_queued_or_running(self):
+        engine = self.prefetch.PrefetchEngine(workers=1)
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def task():
+            calls.append(1)
+            if len(calls) == 2:
+                # The second call is the real fetch (the first is the cache probe).
+                started.set()
+                release.wait(5)
+            return None
+
+        self.assertTrue(engine.submit("movie:1", task))
+        self.assertTrue(started.wait(5))
+        self.assertFalse(engine.submit("movie:1", task))
+        self.assertTrue(engine.submit("movie:2", lambda: "cached"))
+        self.assertFalse(engine.submit("movie:2", lambda: "cached"))
+        release.set()
+        engine._queue.join()
+
+        self.assertEqual(self.counted("prefetch.deduped"), 2)
+        self.assertEqual(self.counted("prefetch.cached"), 1)
+        # Finished keys can be queued again.
+        self.assertTrue(engine.submit("movie:1", lambda: "cached"))
+        engine._queue.join()
+
+    def test_full_queue_drops_tasks(self):
+        engine = self.prefetch.PrefetchEngine(max_queue=1, workers=0)
+        self.assertTrue(engine.submit("a", lambda: None))
+        self.assertFalse(engine.submit("b", lambda: None))
+        self.assertEqual(self.counted("prefetch.dropped"), 1)
+
+    def test_stale_tasks_are_cancelled(self):
+        engine = self.prefetch.PrefetchEngine(workers=1, max_age=0)
+        task = mock.Mock(return_value=None)
+        engine.submit("stale", task)
+        engine._queue.join()
+        task.assert_not_called()
+        self.assertEqual(self.counted("prefetch.cancelled"), 1)
+
+    def test_movie_details_are_queued_once_per_resource(self):
+        engine = self.prefetch.PrefetchEngine(workers=0)
+        with mock.patch.object(self.prefetch, "engine", engine):
+            self.prefetch.prefetch_movie_details([7, 7, 8])
+        self.assertEqual(engine._queue.qsize(), 6)
+        self.assertEqual(self.counted("prefetch.deduped"), 3)
+
+
+class SnapshotTests(SimpleTestCase):
+    def setUp(self):
+        from services import snapshot
+        self.snapshot = snapshot
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "test.snapshot")
+
+    def open(self, **kwargs):
+        mapped = self.snapshot.Snapshot(self.path, **kwargs)
+        self.addCleanup(mapped.close)
+        return mapped
+
+    def test_write_and_read_back(self):
+        entries = [(f"test:key:{i}", {"id": i, "title": f"Movie {i}"}, 600) for i in range(50)]
+        entries.append(("test:expired", [1, 2], 10))
+        created_at = int(time.time()) - 60
+        written = self.snapshot.write(self.path, entries, created_at=created_at, cache_version=7)
+        self.assertEqual(written["entries"], 51)
+
+        mapped = self.open(cache_version=7)
+        self.assertEqual((mapped.count, mapped.cache_version, mapped.created_at), (51, 7, created_at))
+        value, remaining = mapped.lookup("test:key:42")
+        self.assertEqual(value, {"id": 42, "title": "Movie 42"})
+        self.assertAlmostEqual(remaining, 540, delta=5)
+        self.assertIsNone(mapped.lookup("test:expired"))
+        self.assertIsNone(mapped.lookup("test:missing"))
+        self.assertEqual(sorted(key for key, _, _ in mapped.items()), sorted(key for key, _, _ in entries))
+
+    def test_other_cache_version_is_rejected(self):
+        self.snapshot.write(self.path, [("test:key", "v1", 600)], cache_version=1)
+        with self.assertRaisesRegex(ValueError, "cache version 1, expected 2"):
+            self.open(cache_version=2)
+
+        # The process-wide snapshot checks against services.cache.CACHE_VERSION.
+        with mock.patch("services.cache.CACHE_VERSION", 2), mock.patch.object(self.snapshot, "SNAPSHOT_ENABLED", True), \
+                mock.patch.object(self.snapshot, "_snapshot", None), mock.patch.object(self.snapshot, "_loaded", False):
+            self.assertIsNone(self.snapshot.load(self.path))
+            self.assertIsNone(self.snapshot.lookup("test:key"))
+
+    def test_files_of_another_format_are_rejected(self):
+        with open(self.path, "wb") as f:
+            f.write(self.snapshot.MAGIC + bytes(40))
+        with self.assertRaisesRegex(ValueError, "format version 0"):
+            self.open()
+
+
+class StaticAssetTests(SimpleTestCase):
+    CSS = "body { color: #123456; }\n" * 40
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        os.makedirs(os.path.join(self.root, "css"))
+        with open(os.path.join(self.root, "css", "site.css"), "w") as f:
+            f.write(self.CSS)
+
+        self.storage = CompressedManifestStaticFilesStorage(location=self.root, base_url="/static/")
+        list(self.storage.post_process({"css/site.css": (self.storage, "css/site.css")}))
+        self.hashed = self.storage.stored_name("css/site.css")
+        # A stand-in Brotli variant, so the choice is tested without the brotli package.
+        with open(os.path.join(self.root, self.hashed + ".br"), "wb") as f:
+            f.write(b"brotli bytes")
+
+        settings_override = override_settings(STATIC_ROOT=self.root, DEBUG=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.middleware = StaticAssetMiddleware(lambda request: HttpResponse("app"))
+
+    def get(self, name, accept_encoding=""):
+        request = RequestFactory().get(f"/static/{name}", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return self.middleware(request)
+
+    def test_manifest_lookup(self):
+        self.assertRegex(self.hashed, r"^css/site\.[0-9a-f]{12}\.css$")
+        self.assertTrue(os.path.isfile(os.path.join(self.root, self.hashed + ".gz")))
+        self.assertEqual(CompressedManifestStaticFilesStorage(location=self.root).stored_name("css/site.css"), self.hashed)
+        # Files missing from the manifest keep their name instead of failing.
+        self.assertEqual(self.storage.stored_name("css/missing.css"), "css/missing.css")
+
+    def test_encoding_follows_accept_encoding(self):
+        for accept_encoding, encoding in (
+            ("gzip, deflate, br", "br"), ("gzip", "gzip"), ("br;q=0, gzip", "gzip"), ("", None), ("identity", None),
+        ):
+            response = self.get(self.hashed, accept_encoding)
+            self.assertEqual(response.headers.get("Content-Encoding"), encoding, accept_encoding)
+            self.assertIn("Accept-Encoding", response.headers["Vary"])
+            self.assertEqual(response.headers["Content-Type"], "text/css")
+            response.close()
+
+        response = self.get(self.hashed)
+        self.assertEqual(b"".join(response.streaming_content).decode(), self.CSS)
+        self.assertEqual(response.headers["Cache-Control"], IMMUTABLE_CACHE_CONTROL)
+
+    def test_unhashed_and_missing_files(self):
+        response = self.get("css/site.css", "gzip")
+        self.assertEqual(response.headers["Cache-Control"], STATIC_CACHE_CONTROL)
+        response.close()
+        self.assertEqual(self.get("css/missing.css").content, b"app")
+        self.assertEqual(self.get("../secret.txt").content, b"app")
+
+    @override_settings(DEBUG=True)
+    def test_not_used_with_debug(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            StaticAssetMiddleware(lambda request: HttpResponse("app"))
+
+
+class ProfilingMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        from services import profiling
+        for patcher in (
+            mock.patch.object(profiling, "PROFILE_SAMPLE_RATE", 1.0),
+            mock.patch.object(profiling, "PROFILE_SLOW_MS", 0),
+            mock.patch.object(profiling, "store", return_value="20261019-abc"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.store = profiling.store
+        self.middleware = ProfilingMiddleware(lambda request: HttpResponse("page"))
+
+    def get(self, user):
+        request = RequestFactory().get("/")
+        request.user = user
+        return self.middleware(request)
+
+    def test_sampled_profiles_are_named_to_staff_only(self):
+        self.assertNotIn(PROFILE_HEADER, self.get(mock.Mock(is_staff=False, is_authenticated=False)).headers)
+        self.assertNotIn(PROFILE_HEADER, self.get(mock.Mock(is_staff=False, is_authenticated=True)).headers)
+        self.assertEqual(self.get(mock.Mock(is_staff=True)).headers[PROFILE_HEADER], "20261019-abc")
+        self.assertEqual(self.store.call_count, 3)
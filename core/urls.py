@@ -5,4 +5,9 @@ urlpatterns = [
     path('signup/', views.SignUpView.as_view(), name='signup'),
     path('login/', views.UserLoginView.as_view(), name='login'),
     path('logout/', views.UserLogoutView.as_view(), name='logout'),
+
+    # Request profiles (staff only)
+    path('staff/profiles/', views.profile_list_view, name='profile_list'),
+    path('staff/profiles/<str:profile_id>/', views.profile_detail_view, name='profile_detail'),
+    path('staff/profiles/<str:profile_id>/folded/', views.profile_folded_view, name='profile_folded'),
 ]
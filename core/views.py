@@ -1,7 +1,10 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse_lazy
 from django.views import generic
 from django.contrib.auth import views as auth_views
+from services import profiling
 from .forms import SignUpForm
 
 class SignUpView(generic.CreateView):
@@ -17,3 +20,48 @@ class UserLoginView(auth_views.LoginView):
 class UserLogoutView(auth_views.LogoutView):
     # On successful logout, redirect to the dashboard home page.
     next_page = reverse_lazy('dashboard:home')
+
+
+@staff_member_required
+def profile_list_view(request):
+    """
+    Lists the request profiles in the ring buffer, newest first.
+    """
+    profiles = [record for record in map(profiling.load, profiling.list_ids()) if record]
+    return render(request, 'staff/profile_list.html', {
+        'title': 'Request profiles',
+        'profiles': profiles,
+        'slow_ms': profiling.PROFILE_SLOW_MS,
+        'sample_rate': profiling.PROFILE_SAMPLE_RATE,
+    })
+
+
+@staff_member_required
+def profile_detail_view(request, profile_id: str):
+    """
+    Shows one request profile: time per span category, the slowest spans
+    and the hottest sampled stacks.
+    """
+    record = profiling.load(profile_id)
+    if record is None:
+        raise Http404('Profile not found (it may have been pruned).')
+    hot_stacks = sorted(record['folded'].items(), key=lambda item: item[1], reverse=True)[:25]
+    return render(request, 'staff/profile_detail.html', {
+        'title': f"Profile {profile_id}",
+        'profile': record,
+        'hot_stacks': [(stack.split(';')[-6:], count) for stack, count in hot_stacks],
+    })
+
+
+@staff_member_required
+def profile_folded_view(request, profile_id: str):
+    """
+    Downloads the stack samples of a profile in folded format, for
+    flamegraph.pl or speedscope.app.
+    """
+    record = profiling.load(profile_id)
+    if record is None:
+        raise Http404('Profile not found (it may have been pruned).')
+    response = HttpResponse(profiling.folded_text(record), content_type='text/plain')
+    response['Content-Disposition'] = f'attachment; filename="{profile_id}.folded"'
+    return response
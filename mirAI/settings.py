@@ -6,6 +6,7 @@ Generated by 'django-admin startproject' using Django 5.2.8.
 
 import os
 import sys
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -54,10 +55,17 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Serves collected static files before any other middleware runs.
+    'core.middleware.StaticAssetMiddleware',
+    # Compresses HTML and JSON responses; must wrap everything that writes the body.
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Samples call stacks and timings of staff-requested or random requests.
+    'core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,9 +91,6 @@ TEMPLATES = [
 WSGI_APPLICATION = 'mirAI.wsgi.application'
 
 
-STATICFILES_DIRS = []
-
-
 # --- Database ---
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -97,6 +102,29 @@ DATABASES = {
 }
 
 
+# --- Caches ---
+# Two tiers used through services.cache: a small in-process L1 and an L2
+# shared by every process and host. The default L2 is a SQLite file, which
+# shares the cache between processes on one host (and stands in for the real
+# tier in tests); across hosts point it at Redis or memcached, e.g.
+# MIRAI_SHARED_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# MIRAI_SHARED_CACHE_LOCATION=redis://cache-host:6379/0
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mirai-l1',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('MIRAI_CACHE_L1_MAX_ENTRIES', '5000'))},
+    },
+    'shared': {
+        'BACKEND': os.getenv('MIRAI_SHARED_CACHE_BACKEND', 'services.sqlite_cache.SQLiteCache'),
+        'LOCATION': os.getenv(
+            'MIRAI_SHARED_CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'mirai_shared_cache.sqlite3')
+        ),
+    },
+}
+
+
 # --- Password Validation ---
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -112,6 +140,12 @@ AUTH_PASSWORD_VALIDATORS = [
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
 LANGUAGE_CODE = 'en-us'
+# Site languages, picked per request from the Accept-Language header by
+# LocaleMiddleware. TMDB content follows them (services.tmdb.SUPPORTED_LANGUAGES).
+LANGUAGES = [
+    ('en', 'English'),
+    ('id', 'Bahasa Indonesia'),
+]
 TIME_ZONE = 'UTC'
 USE_I18N = True
 USE_TZ = True
@@ -122,9 +156,20 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles') # For production 'collectstatic'
-STATICFILES_DIRS = [
-    os.path.join(BASE_DIR, 'static'),
-]
+# App static files (including the Tailwind build in mirAI/static) are found
+# by the app directories finder, so no extra directories are needed.
+STATICFILES_DIRS = []
+
+# collectstatic writes content-hashed copies plus .gz/.br variants (Brotli
+# needs the optional `brotli` package), served by core.middleware.StaticAssetMiddleware.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'core.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 # --- Default Primary Key Field Type ---
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -132,6 +177,12 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# --- Recommendations ---
+# Number of locally ranked dashboard picks to send to Gemini for reranking.
+# 0 keeps the dashboard fully local (no LLM call per view).
+RECOMMENDER_LLM_RERANK_TOP = int(os.getenv('RECOMMENDER_LLM_RERANK_TOP', '0'))
+
+
 # --- Tailwind CSS Configuration ---
 # The name of the app where your Tailwind CSS files are located.
 TAILWIND_APP_NAME = 'mirAI'
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mirAI.settings')
 
 application = get_wsgi_application()
+
+# Pre-fork servers (e.g. gunicorn --preload) import this module once in the
+# master process. Setting MIRAI_WARM_UP there loads the service SDKs and maps
+# the cache snapshot before forking so workers start with both; the services
+# themselves are still built lazily per worker (see services.registry.warm_up).
+if os.getenv('MIRAI_WARM_UP', 'False').lower() in ('true', '1', 't'):
+    from services import registry
+    registry.warm_up()
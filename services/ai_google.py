@@ -1,9 +1,15 @@
 import os
+import re
 import json
+import time
+import hashlib
 import logging
-import google.generativeai as genai
+import contextvars
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, List, Optional
+
+from services import cache, profiling
 
 # --- Setup ---
 # Load environment variables from .env file located at the project root.
@@ -17,6 +23,380 @@ logger = logging.getLogger(__name__)
 # Retrieve the Google AI API key from environment variables.
 GOOGLE_AI_API_KEY = os.getenv("GOOGLE_AI_API_KEY")
 
+MODEL_NAME = 'gemini-flash-latest'
+
+# Smaller, cheaper configuration for clarifying questions and general chat.
+LIGHT_MODEL_NAME = os.getenv("GOOGLE_AI_LIGHT_MODEL", "gemini-flash-lite-latest")
+LIGHT_MAX_OUTPUT_TOKENS = int(os.getenv("GOOGLE_AI_LIGHT_MAX_OUTPUT_TOKENS", "256"))
+
+# --- Routes ---
+# canned: greetings/thanks answered locally, no API call.
+# light:  clarifying questions and chat, on the light model.
+# full:   recommendation-ready turns, on the full model in JSON mode.
+ROUTE_CANNED = 'canned'
+ROUTE_LIGHT = 'light'
+ROUTE_FULL = 'full'
+
+# Approximate token budget for the chat history sent with each call. Older
+# turns beyond it are folded into a short summary.
+HISTORY_TOKEN_BUDGET = int(os.getenv("GOOGLE_AI_HISTORY_TOKEN_BUDGET", "2000"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("GOOGLE_AI_SUMMARY_TOKEN_BUDGET", "300"))
+
+# Identical non-chat calls (same purpose, model, history and prompt, e.g. a
+# rerank of the same candidates) are answered from the shared cache for this
+# long, in seconds. 0 disables it. Chat turns are never cached: every user
+# gets a freshly generated reply.
+AI_RESPONSE_CACHE_TTL = int(os.getenv("GOOGLE_AI_RESPONSE_CACHE_TTL", "3600"))
+
+# The full model answers in JSON mode with this schema: recommendations once
+# it has enough information, otherwise its question or reply in `response`.
+FULL_RESPONSE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'response': {
+            'type': 'string',
+            'description': "Your message to the user when asking a clarifying question or chatting; empty when recommending.",
+        },
+        'recommendations': {
+            'type': 'array',
+            'description': "The recommended movies, only once you have enough information; otherwise empty.",
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'title': {'type': 'string'},
+                    'year': {'type': 'integer'},
+                    'tmdb_id': {'type': 'integer'},
+                },
+                'required': ['title'],
+            },
+        },
+    },
+}
+
+# The turns standing in for history dropped by compaction.
+SUMMARY_PREFIX = "Summary of the earlier conversation."
+SUMMARY_ACK = "Understood, I will keep that in mind."
+
+# Gemini averages roughly four characters per token for English/Indonesian text.
+CHARS_PER_TOKEN = 4
+
+SYSTEM_INSTRUCTION = """You are MirAI, a conversational movie recommendation expert. Your goal is to help users find the perfect movie by having a natural conversation.
+
+RULES:
+1.  INFORMATION GATHERING: If the user's request is vague (e.g., "find me a movie", "rekomendasikan film"), your first priority is to ask clarifying questions. Ask about genre, actors, director, mood, or similar movies. Do NOT recommend movies until you have enough specific information (e.g., at least a genre and an actor, or a movie to compare to).
+2.  JSON TRIGGER: Once you believe you have gathered enough specific information to make good recommendations, your response MUST BE ONLY a valid JSON object and nothing else. This JSON object should contain a single key "recommendations". The value must be an array of 5 objects, where each object has the keys "title", "year", and "tmdb_id".
+3.  NORMAL CONVERSATION: For all other conversation (greetings, follow-up discussion after recommendations, or if the user is just chatting), just respond as a friendly, helpful, and conversational AI movie assistant in the user's language. Do not output JSON in this case.
+
+JSON FORMAT EXAMPLE:
+{
+  "recommendations": [
+    { "title": "Blade Runner 2049", "year": 2017, "tmdb_id": 335984 },
+    { "title": "Ex Machina", "year": 2014, "tmdb_id": 264660 }
+  ]
+}"""
+
+# Callables that receive a usage record (a dict) after every Gemini call.
+# The ai app registers one that stores the records in the database.
+USAGE_RECORDERS: List[Callable[[Dict[str, Any]], None]] = []
+
+# While set, usage records are collected here instead of being handed to the
+# recorders, so worker threads can leave the database writes to their caller.
+_collected_usage: contextvars.ContextVar[Optional[List[Dict[str, Any]]]] = contextvars.ContextVar(
+    "collected_usage", default=None
+)
+
+
+@contextmanager
+def collecting_usage():
+    """
+    Collects the usage records of the Gemini calls in the enclosed block
+    instead of recording them. Yields the list; pass each record to
+    record_usage() later.
+    """
+    records = []
+    token = _collected_usage.set(records)
+    try:
+        yield records
+    finally:
+        _collected_usage.reset(token)
+
+
+def record_usage(record: Dict[str, Any]) -> None:
+    """
+    Hands one usage record to every usage recorder.
+    """
+    for recorder in USAGE_RECORDERS:
+        try:
+            recorder(record)
+        except Exception as e:
+            logger.error(f"Failed to record Gemini usage: {e}")
+
+# --- SDK Loading ---
+def import_genai():
+    """
+    Imports the Gemini SDK on first use. The SDK pulls in gRPC and protobuf,
+    which makes it one of the slowest imports in the project, so it is kept
+    out of module import time (URL loading, management commands).
+    """
+    import google.generativeai as genai
+    return genai
+
+# --- Chat Context ---
+class ChatContext:
+    """
+    Keeps the chat history sent to the model within a token budget.
+
+    Recommendation turns are always reduced to a compact list of TMDB ids, the
+    newest turns are kept verbatim while they fit the budget, and everything
+    older is folded into a single short summary turn.
+    """
+
+    def __init__(self, token_budget: int = HISTORY_TOKEN_BUDGET, summary_budget: int = SUMMARY_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+
+    @staticmethod
+    def turn_text(turn: Dict[str, Any]) -> str:
+        """
+        Returns the concatenated text parts of a history turn.
+        """
+        parts = turn.get('parts', [])
+        return " ".join(part.get('text', '') if isinstance(part, dict) else str(part) for part in parts)
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        """
+        Estimates the token count of a piece of text locally, without an API call.
+        """
+        return -(-len(text) // CHARS_PER_TOKEN)
+
+    @staticmethod
+    def recommended_ids(text: str) -> Optional[List[int]]:
+        """
+        Returns the TMDB ids of a recommendations JSON turn, or None if the
+        text is not one. Accepts both the model's format (tmdb_id) and the
+        enriched TMDB objects the chat page echoes back (id).
+        """
+        match = re.search(r"```json\s*(\{.*?\})\s*```", text, re.DOTALL)
+        try:
+            parsed = json.loads(match.group(1) if match else text)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(parsed, dict) or not isinstance(parsed.get('recommendations'), list):
+            return None
+        ids = []
+        for movie in parsed['recommendations']:
+            if isinstance(movie, dict) and (movie.get('tmdb_id') or movie.get('id')):
+                ids.append(movie.get('tmdb_id') or movie.get('id'))
+        return ids
+
+    def compact_turn(self, turn: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Normalizes a turn to text parts and replaces raw recommendation JSON
+        with a compact id list.
+        """
+        text = self.turn_text(turn)
+        if turn.get('role') == 'model':
+            ids = self.recommended_ids(text)
+            if ids is not None:
+                text = f"[Recommended tmdb_ids: {', '.join(str(movie_id) for movie_id in ids)}]"
+        return {'role': turn['role'], 'parts': [{'text': text}]}
+
+    def _summarize(self, turns: List[Dict[str, Any]], max_tokens: int) -> Optional[str]:
+        user_requests = [self.turn_text(turn) for turn in turns if turn['role'] == 'user']
+        recommended = []
+        for turn in turns:
+            match = re.match(r"\[Recommended tmdb_ids: (.*)\]$", self.turn_text(turn))
+            if turn['role'] == 'model' and match:
+                recommended.append(match.group(1))
+
+        summary = SUMMARY_PREFIX
+        if recommended:
+            summary += " Already recommended tmdb_ids: " + ", ".join(recommended) + "."
+
+        # Fill the rest of the summary budget with the most recent requests, 120 chars each.
+        budget = min(self.summary_budget, max_tokens) * CHARS_PER_TOKEN - len(summary) - len(" The user asked: .")
+        snippets = []
+        for request in reversed(user_requests):
+            snippet = request[:120]
+            if len(snippet) > budget:
+                break
+            snippets.insert(0, snippet)
+            budget -= len(snippet)
+
+        if not snippets and not recommended:
+            return None
+        if snippets:
+            summary += " The user asked: " + " | ".join(snippets) + "."
+        if self.count_tokens(summary) > max_tokens:
+            summary = summary[:max_tokens * CHARS_PER_TOKEN - 3] + "..."
+        return summary if len(summary) > len(SUMMARY_PREFIX) + 3 else None
+
+    def compact(self, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Returns a copy of the history that fits the token budget.
+        """
+        turns = [
+            self.compact_turn(turn) for turn in history
+            if isinstance(turn, dict) and turn.get('role') in ('user', 'model')
+        ]
+
+        tokens = [self.count_tokens(self.turn_text(turn)) for turn in turns]
+        window_budget = self.token_budget
+        if sum(tokens) > self.token_budget:
+            # Leave room for the summary turns within the budget.
+            window_budget -= min(self.summary_budget, self.token_budget // 2)
+        kept, used = [], 0
+        for turn, turn_tokens in zip(reversed(turns), reversed(tokens)):
+            if used + turn_tokens > window_budget:
+                break
+            kept.insert(0, turn)
+            used += turn_tokens
+
+        # Start the kept window on a user turn so roles keep alternating.
+        while kept and kept[0]['role'] != 'user':
+            used -= self.count_tokens(self.turn_text(kept.pop(0)))
+
+        dropped = turns[:len(turns) - len(kept)]
+        if not dropped:
+            return kept
+        room = self.token_budget - used - self.count_tokens(SUMMARY_ACK)
+        summary = self._summarize(dropped, room) if room > 0 else None
+        if summary:
+            kept = [
+                {'role': 'user', 'parts': [{'text': summary}]},
+                {'role': 'model', 'parts': [{'text': SUMMARY_ACK}]},
+            ] + kept
+            used += self.count_tokens(summary) + self.count_tokens(SUMMARY_ACK)
+
+        logger.info(f"Compacted chat history from {len(turns)} to {len(kept)} turns (~{used} tokens kept).")
+        return kept
+
+# --- Turn Routing ---
+class TurnRouter:
+    """
+    Classifies each chat turn locally with keyword heuristics so only turns
+    that are ready for recommendations reach the full model.
+
+    Following the system instruction, a request is ready once the user has
+    named a movie to compare to or a person, or a genre plus at least one
+    more specific detail (a period or a mood), or explicitly asks to skip
+    the questions. Signals are collected from the user turns since the last
+    recommendation; only requests with none of them, or a bare genre, go to
+    the light model for a clarifying question.
+    """
+
+    TRIVIAL = re.compile(
+        r"^(hi|hii+|hello|hey|halo|hai|helo|pagi|siang|sore|malam|selamat (pagi|siang|sore|malam)|"
+        r"thanks|thank you|thx|terima kasih|makasih|bye|goodbye|dah|sampai jumpa)"
+        r"( there| mirai| ya| banget| kak)?[\s!.?]*$",
+        re.IGNORECASE,
+    )
+    # Only trivial on the first turn; later they answer what the model asked.
+    ACKNOWLEDGEMENT = re.compile(r"^(ok|oke|okay|sip|sure|yes|yep|ya|iya|boleh)( ya| kak| sure)?[\s!.?]*$", re.IGNORECASE)
+    THANKS = re.compile(r"thank|thx|terima kasih|makasih", re.IGNORECASE)
+    FAREWELL = re.compile(r"bye|dah|sampai jumpa", re.IGNORECASE)
+    INDONESIAN = re.compile(r"\b(halo|hai|helo|pagi|siang|sore|malam|selamat|terima kasih|makasih|oke|sip|dah|sampai jumpa|ya|kak)\b", re.IGNORECASE)
+
+    GENRE = re.compile(
+        r"\b(action|comedy|comedies|horror|thriller|drama|romance|romantic|sci-?fi|science fiction|fantasy|animation|animated|"
+        r"anime|documentary|mystery|crime|war|western|musical|family|adventure|superhero|"
+        r"aksi|komedi|horor|seram|romantis|fiksi ilmiah|animasi|dokumenter|misteri|kriminal|perang|keluarga|petualangan)\b",
+        re.IGNORECASE,
+    )
+    # "mirip" and friends also refer back to a movie named earlier, as in
+    # "Sudah nonton Parasite, mau yang mirip"; "seperti"/"kayak" need an
+    # object since they also mean "how" ("seperti apa").
+    SIMILAR_TO = re.compile(
+        r"\b((movies?|films?|something|anything|ones?) (like|similar)|similar to|more like|mirip|serupa|sejenis)\b"
+        r"|\b(seperti|kayak)\s+(?!apa\b|gimana\b|bagaimana\b)\w+",
+        re.IGNORECASE,
+    )
+    # Users type names in lowercase too, so after the loose "with"/"by" a name
+    # is two words that do not start like an ordinary phrase ("with my kids").
+    PERSON = re.compile(
+        r"\b(starring|actor|actress|directed by|director|dibintangi|aktor|aktris|sutradara|pemeran)\s+\w+"
+        r"|\b(with|by)\s+(?!(a|an|the|my|our|your|his|her|their|some|lots?|friends?|family|kids|"
+        r"good|great|nice|happy|sad|no|less|more|much|many)\b)[a-z]+\s+[a-z]+\b",
+        re.IGNORECASE,
+    )
+    PERIOD = re.compile(r"\b(19|20)\d{2}s?\b|\b\d0s\b|\b(classic|recent|new|old|klasik|terbaru|lama)\b", re.IGNORECASE)
+    MOOD = re.compile(
+        r"\b(funny|dark|scary|sad|uplifting|feel-?good|light|intense|mind-?bending|lucu|sedih|gelap|menegangkan|santai|ringan)\b",
+        re.IGNORECASE,
+    )
+    JUST_RECOMMEND = re.compile(
+        r"\b(just recommend|any(thing)? is fine|surprise me|terserah|langsung (saja|aja)|rekomendasikan saja)\b",
+        re.IGNORECASE,
+    )
+
+    CANNED_REPLIES = {
+        ('greeting', 'en'): "Hi! I'm MirAI. Tell me a genre, an actor, or a movie you loved, and I'll find something for you.",
+        ('greeting', 'id'): "Halo! Aku MirAI. Sebutkan genre, aktor, atau film yang kamu suka, nanti aku carikan rekomendasinya.",
+        ('thanks', 'en'): "You're welcome! Let me know whenever you want more movie ideas.",
+        ('thanks', 'id'): "Sama-sama! Kabari aku kalau mau rekomendasi film lagi.",
+        ('farewell', 'en'): "Enjoy the movie! See you next time.",
+        ('farewell', 'id'): "Selamat menonton! Sampai jumpa lagi.",
+    }
+
+    def route(self, history: List[Dict[str, Any]], prompt: str) -> tuple:
+        """
+        Returns (route, reason) for a new user prompt.
+        """
+        text = prompt.strip()
+        if self.TRIVIAL.match(text) and not self.awaiting_answer(history):
+            return ROUTE_CANNED, 'trivial'
+        if self.ACKNOWLEDGEMENT.match(text) and not history:
+            return ROUTE_CANNED, 'trivial'
+
+        # Collect the user's requests since the last recommendation.
+        requests = [text]
+        for turn in reversed(history):
+            if not isinstance(turn, dict):
+                continue
+            turn_text = ChatContext.turn_text(turn)
+            if turn.get('role') == 'model' and ChatContext.recommended_ids(turn_text) is not None:
+                break
+            if turn.get('role') == 'user':
+                requests.append(turn_text)
+        gathered = " ".join(requests)
+
+        if self.JUST_RECOMMEND.search(text):
+            return ROUTE_FULL, 'explicit'
+        if self.SIMILAR_TO.search(gathered):
+            return ROUTE_FULL, 'similar_to'
+        details = [
+            name for name, pattern in (('genre', self.GENRE), ('person', self.PERSON), ('period', self.PERIOD), ('mood', self.MOOD))
+            if pattern.search(gathered)
+        ]
+        if 'person' in details or len(details) > 1:
+            return ROUTE_FULL, '+'.join(details)
+        if details == ['genre']:
+            return ROUTE_LIGHT, 'genre_only'
+        return ROUTE_LIGHT, 'vague'
+
+    @staticmethod
+    def awaiting_answer(history: List[Dict[str, Any]]) -> bool:
+        """
+        Returns True when the last model turn asked the user a question.
+        """
+        if not history or not isinstance(history[-1], dict) or history[-1].get('role') != 'model':
+            return False
+        return '?' in ChatContext.turn_text(history[-1])
+
+    def canned_reply(self, prompt: str) -> str:
+        """
+        Returns a templated reply to a trivial turn, in the user's language.
+        """
+        language = 'id' if self.INDONESIAN.search(prompt) else 'en'
+        if self.THANKS.search(prompt):
+            kind = 'thanks'
+        elif self.FAREWELL.search(prompt):
+            kind = 'farewell'
+        else:
+            kind = 'greeting'
+        return self.CANNED_REPLIES[(kind, language)]
+
 # --- Service Class ---
 class AIGoogleService:
     """
@@ -33,46 +413,134 @@ class AIGoogleService:
             logger.error("GOOGLE_AI_API_KEY environment variable not set.")
             raise ValueError("GOOGLE_AI_API_KEY must be set in your environment.")
         
-        genai.configure(api_key=GOOGLE_AI_API_KEY)
-        
-        system_instruction = """You are MirAI, a conversational movie recommendation expert. Your goal is to help users find the perfect movie by having a natural conversation.
+        self.genai = import_genai()
+        self.genai.configure(api_key=GOOGLE_AI_API_KEY)
 
-RULES:
-1.  INFORMATION GATHERING: If the user's request is vague (e.g., "find me a movie", "rekomendasikan film"), your first priority is to ask clarifying questions. Ask about genre, actors, director, mood, or similar movies. Do NOT recommend movies until you have enough specific information (e.g., at least a genre and an actor, or a movie to compare to).
-2.  JSON TRIGGER: Once you believe you have gathered enough specific information to make good recommendations, your response MUST BE ONLY a valid JSON object and nothing else. This JSON object should contain a single key "recommendations". The value must be an array of 5 objects, where each object has the keys "title", "year", and "tmdb_id".
-3.  NORMAL CONVERSATION: For all other conversation (greetings, follow-up discussion after recommendations, or if the user is just chatting), just respond as a friendly, helpful, and conversational AI movie assistant in the user's language. Do not output JSON in this case.
+        self.context = ChatContext()
+        self.router = TurnRouter()
+        self.model = self._build_model()
+        self._light_model = None
 
-JSON FORMAT EXAMPLE:
-{
-  "recommendations": [
-    { "title": "Blade Runner 2049", "year": 2017, "tmdb_id": 335984 },
-    { "title": "Ex Machina", "year": 2014, "tmdb_id": 264660 }
-  ]
-}"""
+    @property
+    def light_model(self):
+        """
+        The light model for clarifying turns, built on first use.
+        """
+        if self._light_model is None:
+            self._light_model = self.genai.GenerativeModel(
+                model_name=LIGHT_MODEL_NAME,
+                system_instruction=SYSTEM_INSTRUCTION,
+                generation_config={'max_output_tokens': LIGHT_MAX_OUTPUT_TOKENS},
+            )
+        return self._light_model
 
-        self.model = genai.GenerativeModel(
-            model_name='gemini-flash-latest',
-            system_instruction=system_instruction
+    def _build_model(self):
+        """
+        Builds the full model in JSON mode (see FULL_RESPONSE_SCHEMA).
+        """
+        return self.genai.GenerativeModel(
+            model_name=MODEL_NAME,
+            system_instruction=SYSTEM_INSTRUCTION,
+            generation_config={'response_mime_type': 'application/json', 'response_schema': FULL_RESPONSE_SCHEMA},
         )
 
-    def get_conversational_response(self, history: list, new_prompt: str) -> str:
+    def _record_usage(self, purpose: str, model_name: str, response: Any, latency_ms: float, history: List[Dict[str, Any]], prompt: str) -> None:
+        """
+        Logs the token usage and latency of one call and hands it to the usage
+        recorders, or to the surrounding collecting_usage() block. Counts come
+        from the response's usage metadata; without it they are estimated
+        locally and the record is marked as estimated.
+        """
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None and getattr(usage, 'prompt_token_count', None):
+            counts = {
+                'input_tokens': usage.prompt_token_count,
+                'output_tokens': getattr(usage, 'candidates_token_count', 0) or 0,
+                'cached_tokens': getattr(usage, 'cached_content_token_count', 0) or 0,
+                'estimated': False,
+            }
+        else:
+            sent = [SYSTEM_INSTRUCTION, prompt, *(ChatContext.turn_text(turn) for turn in history)]
+            counts = {
+                'input_tokens': sum(ChatContext.count_tokens(text) for text in sent),
+                'output_tokens': ChatContext.count_tokens(getattr(response, 'text', '') or ''),
+                'cached_tokens': 0,
+                'estimated': True,
+            }
+        record = dict(
+            counts,
+            purpose=purpose,
+            model_name=model_name,
+            history_turns=len(history),
+            latency_ms=round(latency_ms, 1),
+        )
+        logger.info(
+            f"Gemini {purpose} call: {record['input_tokens']} in / {record['output_tokens']} out "
+            f"({record['cached_tokens']} cached{', estimated' if record['estimated'] else ''}) tokens in {record['latency_ms']} ms"
+        )
+        collected = _collected_usage.get()
+        if collected is not None:
+            collected.append(record)
+        else:
+            record_usage(record)
+
+    @staticmethod
+    def _response_cache_key(purpose: str, model_name: str, history: List[Dict[str, Any]], prompt: str) -> str:
+        payload = json.dumps([purpose, model_name, history, prompt], sort_keys=True, default=str)
+        return f"ai:response:{hashlib.sha1(payload.encode()).hexdigest()}"
+
+    @profiling.traced("gemini", label=lambda self, history, new_prompt, purpose='chat', **kwargs: purpose)
+    def get_conversational_response(self, history: list, new_prompt: str, purpose: str = 'chat', use_cache: bool = True) -> str:
         """
         Gets a conversational response from the AI, providing chat history for context.
+        Chat turns are routed first: trivial turns get a canned reply,
+        clarifying turns go to the light model and only recommendation-ready
+        turns (and every non-chat purpose) use the full model in JSON mode.
 
         Args:
-            history (list): A list of previous chat messages.
+            history (list): A list of previous chat messages. It is compacted
+                            to the history token budget before sending.
             new_prompt (str): The new message from the user.
+            purpose (str): A label for the usage records (e.g. 'chat', 'rerank').
+            use_cache (bool): Whether a cached response of a non-chat call may
+                              be returned. False still stores the fresh one.
 
         Returns:
             str: The AI's response, which could be plain text or a JSON string.
         """
+        start = time.perf_counter()
+        route, reason = self.router.route(history, new_prompt) if purpose == 'chat' else (ROUTE_FULL, purpose)
+
         try:
-            chat = self.model.start_chat(history=history)
+            if route == ROUTE_CANNED:
+                return self.router.canned_reply(new_prompt)
+
+            if route == ROUTE_LIGHT:
+                model, model_name = self.light_model, LIGHT_MODEL_NAME
+            else:
+                model, model_name = self.model, MODEL_NAME
+
+            compacted_history = self.context.compact(history)
+            cacheable = AI_RESPONSE_CACHE_TTL and purpose != 'chat'
+            cache_key = self._response_cache_key(purpose, model_name, compacted_history, new_prompt)
+            if cacheable and use_cache:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    reason += '+cached'
+                    return cached
+
+            call_start = time.perf_counter()
+            chat = model.start_chat(history=compacted_history)
             response = chat.send_message(new_prompt)
+            self._record_usage(purpose, model_name, response, (time.perf_counter() - call_start) * 1000, compacted_history, new_prompt)
+            if cacheable:
+                cache.set(cache_key, response.text, AI_RESPONSE_CACHE_TTL)
             return response.text
         except Exception as e:
             logger.error(f"An unexpected error occurred with Google AI API: {e}")
             return "Sorry, I'm having trouble connecting to my brain right now. Please try again in a moment."
+        finally:
+            logger.info(f"Routed {purpose} turn to '{route}' ({reason}) in {(time.perf_counter() - start) * 1000:.1f} ms")
 
 
 # --- Example Usage (for direct testing of this script) ---
@@ -0,0 +1,289 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from django.core.cache import caches
+
+from services import snapshot
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Two tiers (see settings.CACHES): 'default' is the in-process L1, 'shared'
+# the L2 every process and host reads and writes.
+L1_ALIAS = "default"
+L2_ALIAS = "shared"
+
+# Values are kept in L1 for at most this long (seconds), bounding how stale a
+# node can be for keys that are never explicitly invalidated.
+L1_MAX_TTL = int(os.getenv("MIRAI_CACHE_L1_MAX_TTL", "300"))
+
+# Part of every key in both tiers. Bump it when cached value shapes change,
+# so new code never reads entries written by old code from the shared tier.
+CACHE_VERSION = int(os.getenv("MIRAI_CACHE_VERSION", "1"))
+
+# How often (seconds) a process checks the shared tier for invalidation
+# events from other processes and hosts. 0 checks on every cache access.
+SYNC_INTERVAL = float(os.getenv("MIRAI_CACHE_SYNC_INTERVAL", "1"))
+
+# Invalidation events are kept this long; a process that has not synced for
+# longer clears its whole L1 instead. The head (the number of the latest
+# event) never expires.
+EVENT_TTL = 60 * 60
+
+# Events read per round trip while catching up.
+SYNC_BATCH = 20
+
+EVENT_HEAD_KEY = "cache:events:head"
+
+# While set, get_or_set never calls its loader, so any cached service call can
+# be probed ("is this already cached?") without knowing its cache key.
+_peek_only = contextvars.ContextVar("cache_peek_only", default=False)
+
+# While set, get_or_set also stores every value it returns here, keyed by
+# cache key with its timeout, which is how build_snapshot collects a working set.
+_recording: contextvars.ContextVar[Optional[Dict[str, Tuple[Any, int]]]] = contextvars.ContextVar(
+    "cache_recording", default=None
+)
+
+_stats = {"l1_hits": 0, "l2_hits": 0, "snapshot_hits": 0, "misses": 0}
+_sync_state = {"pid": None, "seq": 0, "next_sync": 0.0}
+_sync_lock = threading.Lock()
+
+
+def _l1():
+    return caches[L1_ALIAS]
+
+
+def _l2():
+    return caches[L2_ALIAS]
+
+
+def _event_key(seq: int) -> str:
+    return f"cache:events:{seq}"
+
+
+@contextmanager
+def peek_only():
+    """
+    Runs the enclosed service calls against the cache only. Misses return None.
+    """
+    token = _peek_only.set(True)
+    try:
+        yield
+    finally:
+        _peek_only.reset(token)
+
+
+def is_peeking() -> bool:
+    """
+    Returns True inside a peek_only() block.
+    """
+    return _peek_only.get()
+
+
+@contextmanager
+def recording():
+    """
+    Collects the values returned by get_or_set in the enclosed block.
+    Yields a dict of key -> (value, timeout).
+    """
+    recorded = {}
+    token = _recording.set(recorded)
+    try:
+        yield recorded
+    finally:
+        _recording.reset(token)
+
+
+# --- Invalidation Events ---
+
+def _sync() -> None:
+    """
+    Applies the invalidation events published since the last sync by evicting
+    their keys from this process's L1. Runs at most every SYNC_INTERVAL.
+    """
+    now = time.monotonic()
+    if now < _sync_state["next_sync"] and _sync_state["pid"] == os.getpid():
+        return
+    with _sync_lock:
+        if _sync_state["pid"] != os.getpid():
+            # A new (or forked) process starts from the current head; its
+            # inherited L1 entries may predate events it will never see.
+            _l1().clear()
+            _sync_state.update(pid=os.getpid(), seq=_l2().get(EVENT_HEAD_KEY, 0, version=CACHE_VERSION))
+        elif now < _sync_state["next_sync"]:
+            return
+        _sync_state["next_sync"] = now + SYNC_INTERVAL
+
+        while True:
+            keys = [_event_key(_sync_state["seq"] + offset) for offset in range(1, SYNC_BATCH + 1)]
+            found = _l2().get_many([EVENT_HEAD_KEY] + keys, version=CACHE_VERSION)
+            head = found.get(EVENT_HEAD_KEY, 0)
+            if head < _sync_state["seq"]:
+                # The log was reset (e.g. the shared tier was flushed or the
+                # head evicted), so its numbers no longer match ours.
+                logger.warning(f"Cache invalidation log reset from {_sync_state['seq']} to {head}; clearing L1.")
+                _l1().clear()
+                _sync_state["seq"] = head
+                return
+
+            for key in keys:
+                if key not in found:
+                    break
+                _l1().delete_many(found[key], version=CACHE_VERSION)
+                _sync_state["seq"] += 1
+            else:
+                continue
+
+            if head > _sync_state["seq"]:
+                # The next events expired before this process saw them (or a
+                # publisher has not written its slot yet); clearing is safe.
+                logger.warning(f"Missed cache invalidation events {_sync_state['seq'] + 1}-{head}; clearing L1.")
+                _l1().clear()
+                _sync_state["seq"] = head
+            return
+
+
+def invalidate(*keys: str) -> None:
+    """
+    Deletes keys from both tiers and publishes an invalidation event, so
+    every other process (on any host) evicts them from its L1 within
+    SYNC_INTERVAL.
+    """
+    if not keys:
+        return
+    _l1().delete_many(keys, version=CACHE_VERSION)
+    _l2().delete_many(keys, version=CACHE_VERSION)
+
+    # Claim the next event number; incr() is atomic in the shared tier, so
+    # the head only moves forward and concurrent publishers never share a slot.
+    _l2().add(EVENT_HEAD_KEY, 0, None, version=CACHE_VERSION)
+    try:
+        seq = _l2().incr(EVENT_HEAD_KEY, version=CACHE_VERSION)
+    except ValueError:
+        # The head was evicted between add() and incr(); start a new log.
+        _l2().add(EVENT_HEAD_KEY, 0, None, version=CACHE_VERSION)
+        seq = _l2().incr(EVENT_HEAD_KEY, version=CACHE_VERSION)
+    _l2().set(_event_key(seq), list(keys), EVENT_TTL, version=CACHE_VERSION)
+
+
+# --- Reads and Writes ---
+
+def _from_snapshot(key: str) -> Optional[Any]:
+    # A miss in both tiers falls back to the memory-mapped snapshot, so a
+    # fresh deployment starts warm; hits are copied into both tiers for
+    # their remaining lifetime.
+    entry = snapshot.lookup(key)
+    if entry is None:
+        return None
+    value, remaining = entry
+    set(key, value, remaining)
+    return value
+
+
+def get(key: str) -> Optional[Any]:
+    """
+    Returns a cached value without ever calling upstream, or None on a miss.
+    Reads L1, then the shared L2 (copying hits into L1), then the snapshot.
+    """
+    _sync()
+    value = _l1().get(key, version=CACHE_VERSION)
+    if value is not None:
+        _stats["l1_hits"] += 1
+        return value
+
+    value = _l2().get(key, version=CACHE_VERSION)
+    if value is not None:
+        _stats["l2_hits"] += 1
+        _l1().set(key, value, L1_MAX_TTL, version=CACHE_VERSION)
+        return value
+
+    value = _from_snapshot(key)
+    _stats["snapshot_hits" if value is not None else "misses"] += 1
+    return value
+
+
+def get_many(keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    Returns the cached values of several keys at once, leaving out misses.
+    """
+    _sync()
+    keys = list(keys)
+    values = _l1().get_many(keys, version=CACHE_VERSION)
+    _stats["l1_hits"] += len(values)
+
+    missing = [key for key in keys if key not in values]
+    if missing:
+        shared = _l2().get_many(missing, version=CACHE_VERSION)
+        _stats["l2_hits"] += len(shared)
+        if shared:
+            _l1().set_many(shared, L1_MAX_TTL, version=CACHE_VERSION)
+            values.update(shared)
+
+    for key in keys:
+        if key not in values:
+            value = _from_snapshot(key)
+            _stats["snapshot_hits" if value is not None else "misses"] += 1
+            if value is not None:
+                values[key] = value
+    return values
+
+
+def set(key: str, value: Any, timeout: int) -> None:
+    """
+    Stores a value in both tiers, e.g. one of several results produced by a
+    single load.
+    """
+    _l1().set(key, value, min(timeout, L1_MAX_TTL), version=CACHE_VERSION)
+    _l2().set(key, value, timeout, version=CACHE_VERSION)
+
+
+def get_or_set(key: str, loader: Callable[[], Optional[Any]], timeout: int) -> Optional[Any]:
+    """
+    Returns the cached value for a key, calling the loader on a miss.
+
+    Failed loads (None) are not cached, so a transient upstream error is
+    retried on the next call instead of being served until the TTL expires.
+    """
+    value = get(key)
+    if value is None and not _peek_only.get():
+        value = loader()
+        if value is not None:
+            set(key, value, timeout)
+
+    recorded = _recording.get()
+    if recorded is not None and value is not None:
+        recorded[key] = (value, timeout)
+    return value
+
+
+def delete(key: str) -> None:
+    """
+    Removes a key from the cache of this process and the shared tier. Use
+    invalidate() when other processes must drop their copy too.
+    """
+    _l1().delete(key, version=CACHE_VERSION)
+    _l2().delete(key, version=CACHE_VERSION)
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Returns this process's hit counts per tier and its overall hit ratio.
+    """
+    lookups = sum(_stats.values())
+    hits = lookups - _stats["misses"]
+    return dict(_stats, lookups=lookups, hit_ratio=round(hits / lookups, 4) if lookups else 0.0)
+
+
+def reset_stats() -> None:
+    """
+    Zeroes the hit counts of this process.
+    """
+    for name in _stats:
+        _stats[name] = 0
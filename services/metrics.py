@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import logging
+import tempfile
+import threading
+from typing import Dict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# SQLite file shared by every worker process on this host, so counters from
+# all workers (and management commands) add up in one place.
+MIRAI_METRICS_DB = os.getenv("MIRAI_METRICS_DB", os.path.join(tempfile.gettempdir(), "mirai_metrics.sqlite3"))
+
+_local = threading.local()
+
+
+def _connection() -> sqlite3.Connection:
+    # One connection per thread, re-opened after a fork.
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(MIRAI_METRICS_DB, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def incr(name: str, amount: int = 1) -> None:
+    """
+    Adds to a host-wide counter. Failures are logged, never raised, so
+    metrics can not break a request.
+    """
+    try:
+        _connection().execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+    except sqlite3.Error as e:
+        logger.warning(f"Could not update metric '{name}': {e}")
+
+
+def snapshot(prefix: str = "") -> Dict[str, int]:
+    """
+    Returns all counters whose name starts with `prefix`.
+    """
+    rows = _connection().execute(
+        "SELECT name, value FROM counters WHERE name LIKE ? ORDER BY name", (f"{prefix}%",)
+    ).fetchall()
+    return dict(rows)
+
+
+def reset(prefix: str = "") -> None:
+    """
+    Deletes all counters whose name starts with `prefix`.
+    """
+    _connection().execute("DELETE FROM counters WHERE name LIKE ?", (f"{prefix}%",))
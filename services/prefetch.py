@@ -0,0 +1,147 @@
+import os
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, Iterable
+
+from services import cache, metrics, ratelimit
+from services.registry import get_tmdb_service
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "True").lower() in ('true', '1', 't')
+PREFETCH_QUEUE_SIZE = int(os.getenv("PREFETCH_QUEUE_SIZE", "200"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+
+# Tasks older than this (seconds) are cancelled: the user has likely moved on.
+PREFETCH_MAX_AGE = 30.0
+
+
+class PrefetchEngine:
+    """
+    Warms the cache in the background for resources a user is likely to
+    request next (the next list page, details of movies just recommended).
+
+    Tasks are plain callables that go through the cached service methods.
+    The queue is bounded and deduplicated by key, tasks whose result is
+    already cached are skipped, and tasks are cancelled when they get stale
+    or when the TMDB rate limiter reports pressure, so prefetching never
+    competes with interactive requests.
+    """
+
+    def __init__(self, max_queue: int = PREFETCH_QUEUE_SIZE, workers: int = PREFETCH_WORKERS, max_age: float = PREFETCH_MAX_AGE):
+        self.max_queue = max_queue
+        self.workers = workers
+        self.max_age = max_age
+        self._queue = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_workers(self) -> None:
+        # Threads do not survive a fork, so each worker process starts its own.
+        if self._pid == os.getpid():
+            return
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._pending = set()
+        self._pid = os.getpid()
+        for index in range(self.workers):
+            threading.Thread(target=self._run, name=f"prefetch-{index}", daemon=True).start()
+
+    def submit(self, key: str, task: Callable[[], Any]) -> bool:
+        """
+        Queues a task unless one with the same key is already pending.
+        Returns False if the task was deduplicated or dropped.
+        """
+        if not PREFETCH_ENABLED:
+            return False
+
+        with self._lock:
+            self._ensure_workers()
+            if key in self._pending:
+                metrics.incr("prefetch.deduped")
+                return False
+            try:
+                self._queue.put_nowait((key, task, time.monotonic()))
+            except queue.Full:
+                metrics.incr("prefetch.dropped")
+                return False
+            self._pending.add(key)
+        metrics.incr("prefetch.submitted")
+        return True
+
+    def _run(self) -> None:
+        while True:
+            key, task, queued_at = self._queue.get()
+            try:
+                self._execute(task, queued_at)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._queue.task_done()
+
+    def _execute(self, task: Callable[[], Any], queued_at: float) -> None:
+        if time.monotonic() - queued_at > self.max_age or ratelimit.tmdb_bucket.under_pressure():
+            metrics.incr("prefetch.cancelled")
+            return
+
+        with cache.peek_only():
+            if task() is not None:
+                metrics.incr("prefetch.cached")
+                return
+
+        try:
+            with ratelimit.priority(ratelimit.BACKGROUND):
+                result = task()
+        except Exception as e:
+            logger.warning(f"Prefetch task failed: {e}")
+            result = None
+        metrics.incr("prefetch.completed" if result is not None else "prefetch.failed")
+
+
+# The engine shared by all views in this process.
+engine = PrefetchEngine()
+
+
+def prefetch_list_page(method_name: str, **kwargs) -> None:
+    """
+    Queues a TMDBService list call, e.g. prefetch_list_page('get_trending_movies', page=3).
+    """
+    key = f"{method_name}:{sorted(kwargs.items())}"
+    engine.submit(key, lambda: getattr(get_tmdb_service(), method_name)(**kwargs))
+
+
+def prefetch_movie_details(movie_ids: Iterable[int]) -> None:
+    """
+    Queues everything the detail page of each movie loads: core details,
+    credits and the trailer.
+    """
+    for movie_id in movie_ids:
+        for name in ("get_movie_core", "get_movie_credits", "get_movie_videos"):
+            engine.submit(
+                f"{name}:{movie_id}",
+                lambda name=name, movie_id=movie_id: getattr(get_tmdb_service(), name)(movie_id),
+            )
+
+
+def prefetch_translations(movie_ids: Iterable[int], language: str) -> None:
+    """
+    Queues the localized texts of movies shown in a language whose texts
+    are not cached yet. One task per movie fills every supported language.
+    """
+    for movie_id in movie_ids:
+        engine.submit(
+            f"get_movie_text:{movie_id}",
+            lambda movie_id=movie_id: get_tmdb_service().get_movie_text(movie_id, language),
+        )
+
+
+def record_detail_view(cache_hit: bool) -> None:
+    """
+    Counts a detail page view as a cache hit or miss, to measure the hit
+    rate prefetching achieves.
+    """
+    metrics.incr("detail.hit" if cache_hit else "detail.miss")
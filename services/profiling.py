@@ -0,0 +1,231 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import tempfile
+import threading
+import functools
+import contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Fraction of all requests profiled at random (0 disables random sampling).
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Randomly sampled requests are only kept when they took at least this long.
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+# How often the request thread's call stack is sampled, in milliseconds.
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# The ring buffer keeps this many profiles; the oldest are deleted first.
+PROFILE_MAX_ENTRIES = int(os.getenv("PROFILE_MAX_ENTRIES", "200"))
+MIRAI_PROFILE_DIR = os.getenv("MIRAI_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "mirai_profiles"))
+
+# Individual spans kept per profile (the slowest ones), besides per-category totals.
+MAX_SPANS_KEPT = 50
+# Stacks deeper than this are cut at the root end.
+MAX_STACK_DEPTH = 128
+
+_active: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    """
+    Profile of one request: stack samples taken by a background thread
+    (folded into "frame;frame;frame" -> count, the input format of
+    flamegraph.pl and speedscope) plus timed spans around upstream calls,
+    ORM queries and template rendering.
+    """
+
+    def __init__(self, reason: str, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.reason = reason
+        self.interval = interval_ms / 1000
+        self.started = time.perf_counter()
+        self.duration_ms = 0.0
+        self.stacks: Counter = Counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.id}", daemon=True)
+
+    def start(self) -> None:
+        self._token = _active.set(self)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+        self._stopped.set()
+        self._sampler.join()
+        _active.reset(self._token)
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.stacks[_fold(frame)] += 1
+
+    def add_span(self, category: str, label: str, start: float, duration_ms: float) -> None:
+        self.spans.append({
+            "category": category,
+            "label": label[:300],
+            "offset_ms": round((start - self.started) * 1000, 2),
+            "duration_ms": round(duration_ms, 2),
+        })
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        """
+        A connection.execute_wrapper() hook that records every query as a span.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add_span("sql", sql, start, (time.perf_counter() - start) * 1000)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the count and total time of the spans per category.
+        """
+        totals = defaultdict(lambda: {"count": 0, "total_ms": 0.0})
+        for span in self.spans:
+            totals[span["category"]]["count"] += 1
+            totals[span["category"]]["total_ms"] += span["duration_ms"]
+        return {category: dict(values, total_ms=round(values["total_ms"], 2)) for category, values in totals.items()}
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+# --- Spans ---
+
+@contextmanager
+def span(category: str, label: str):
+    """
+    Times the enclosed block as a span of the current request's profile.
+    Costs a single context variable lookup when nothing is being profiled.
+    """
+    profile = _active.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_span(category, label, start, (time.perf_counter() - start) * 1000)
+
+
+def traced(category: str, label: Optional[Callable[..., str]] = None):
+    """
+    Decorates a method so every call is recorded as a span. `label` builds
+    the span label from the call arguments; by default it is the first
+    argument after self.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active.get() is None:
+                return func(*args, **kwargs)
+            text = label(*args, **kwargs) if label else str(args[1] if len(args) > 1 else func.__name__)
+            with span(category, text):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def install_template_spans() -> None:
+    """
+    Records every Template.render call (including each {% include %}, such
+    as movie_card.html in list loops) as a span. Called once at startup.
+    """
+    from django.template.base import Template
+
+    if getattr(Template.render, "_profiled", False):
+        return
+    original = Template.render
+
+    @functools.wraps(original)
+    def render(self, context):
+        if _active.get() is None:
+            return original(self, context)
+        with span("template", self.name or "<string>"):
+            return original(self, context)
+
+    render._profiled = True
+    Template.render = render
+
+
+# --- Ring Buffer ---
+
+def store(profile: RequestProfile, meta: Dict[str, Any], directory: str = MIRAI_PROFILE_DIR, max_entries: int = PROFILE_MAX_ENTRIES) -> str:
+    """
+    Writes a finished profile to the on-disk ring buffer, deleting the oldest
+    profiles beyond `max_entries`. Returns the profile id.
+    """
+    os.makedirs(directory, exist_ok=True)
+    slowest = sorted(profile.spans, key=lambda s: s["duration_ms"], reverse=True)[:MAX_SPANS_KEPT]
+    record = dict(
+        meta,
+        id=profile.id,
+        reason=profile.reason,
+        created_at=time.time(),
+        duration_ms=round(profile.duration_ms, 2),
+        interval_ms=profile.interval * 1000,
+        samples=sum(profile.stacks.values()),
+        summary=profile.summary(),
+        spans=sorted(slowest, key=lambda s: s["offset_ms"]),
+        folded=dict(profile.stacks.most_common()),
+    )
+    path = os.path.join(directory, f"{profile.id}.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(record, f)
+    os.replace(f"{path}.tmp", path)
+
+    for name in list_ids(directory)[max_entries:]:
+        try:
+            os.remove(os.path.join(directory, f"{name}.json"))
+        except FileNotFoundError:
+            pass  # Another worker pruned it first.
+    return profile.id
+
+
+def list_ids(directory: str = MIRAI_PROFILE_DIR) -> List[str]:
+    """
+    Returns the ids of the stored profiles, newest first.
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted((name[:-5] for name in os.listdir(directory) if name.endswith(".json")), reverse=True)
+
+
+def load(profile_id: str, directory: str = MIRAI_PROFILE_DIR) -> Optional[Dict[str, Any]]:
+    """
+    Returns a stored profile, or None if it was pruned or the id is invalid.
+    """
+    if os.path.basename(profile_id) != profile_id:
+        return None
+    try:
+        with open(os.path.join(directory, f"{profile_id}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def folded_text(record: Dict[str, Any]) -> str:
+    """
+    Returns the stack samples of a stored profile in folded format,
+    one "frame;frame;frame count" line per stack.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in record.get("folded", {}).items())
@@ -0,0 +1,301 @@
+import os
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# --- Priority Classes ---
+# Interactive requests serve a page a user is waiting on; background requests
+# come from warm-ups, prefetching and batch jobs.
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# --- Constants ---
+# TMDB allows roughly 40-50 requests per second per IP; stay a little below.
+TMDB_RATE_LIMIT = float(os.getenv("TMDB_RATE_LIMIT", "35"))
+TMDB_RATE_BURST = float(os.getenv("TMDB_RATE_BURST", str(TMDB_RATE_LIMIT)))
+
+# SQLite file shared by every worker process on this host.
+TMDB_RATE_LIMIT_DB = os.getenv("TMDB_RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "mirai_tmdb_ratelimit.sqlite3"))
+
+# Background requests only take a token while the bucket is at least this
+# full, which keeps headroom for interactive requests.
+BACKGROUND_RESERVE = 0.5
+
+# While an interactive request is waiting, background requests stand back
+# for this long (seconds).
+INTERACTIVE_DEMAND_WINDOW = 1.0
+
+# How long each priority class may wait for a token, in seconds. Requests
+# still without a token after that are dropped, so an upstream that asked us
+# to back off (429 Retry-After) is not hit again early.
+MAX_WAIT = {INTERACTIVE: 5.0, BACKGROUND: 60.0}
+
+# Waits above this are logged as warnings.
+SLOW_WAIT_WARNING = 1.0
+
+_priority: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("tmdb_priority", default=None)
+_default_priority = INTERACTIVE
+
+
+class RateLimitTimeout(Exception):
+    """
+    Raised when a request waited longer than its priority class allows.
+    """
+
+
+def current_priority() -> str:
+    """
+    Returns the priority class of the code currently running.
+    """
+    return _priority.get() or _default_priority
+
+
+def set_default_priority(priority: str) -> None:
+    """
+    Sets the priority used when none is set for the current context, e.g.
+    BACKGROUND for a whole management command including its worker threads.
+    """
+    global _default_priority
+    _default_priority = priority
+
+
+@contextmanager
+def priority(level: str):
+    """
+    Runs the enclosed requests with the given priority class.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """
+    A token bucket shared by all processes on a host through a SQLite file.
+
+    Each acquire runs in a short BEGIN IMMEDIATE transaction, which SQLite
+    serializes across processes, so the refill/take step is atomic without a
+    separate lock server. The same file keeps queue wait statistics per
+    priority class.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, path: str = TMDB_RATE_LIMIT_DB):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, re-opened after a fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL, updated REAL, interactive_demand_until REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS wait_stats ("
+                "name TEXT, priority TEXT, requests INTEGER, waited INTEGER, dropped INTEGER, "
+                "total_wait REAL, max_wait REAL, PRIMARY KEY (name, priority))"
+            )
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _try_take(self, level: str, waiting: bool) -> float:
+        """
+        Takes a token if the priority class may have one now.
+        Returns 0 on success, otherwise the suggested seconds to wait.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated, interactive_demand_until FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            tokens, updated, demand_until = row if row else (self.burst, now, 0.0)
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            if level == INTERACTIVE:
+                needed = 1.0
+                if waiting:
+                    demand_until = max(demand_until, now + INTERACTIVE_DEMAND_WINDOW)
+            else:
+                needed = 1.0 + self.burst * BACKGROUND_RESERVE
+                if now < demand_until:
+                    needed = max(needed, tokens + (demand_until - now) * self.rate + 1.0)
+
+            if tokens >= needed:
+                tokens -= 1.0
+                wait = 0.0
+            else:
+                wait = max((needed - tokens) / self.rate, 0.001)
+
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated, interactive_demand_until) VALUES (?, ?, ?, ?)",
+                (self.name, tokens, now, demand_until),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def _record_wait(self, level: str, waited: float, slept: bool, dropped: bool) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT INTO wait_stats (name, priority, requests, waited, dropped, total_wait, max_wait) "
+            "VALUES (?, ?, 1, ?, ?, ?, ?) "
+            "ON CONFLICT (name, priority) DO UPDATE SET "
+            "requests = requests + 1, waited = waited + excluded.waited, dropped = dropped + excluded.dropped, "
+            "total_wait = total_wait + excluded.total_wait, max_wait = MAX(max_wait, excluded.max_wait)",
+            (self.name, level, int(slept), int(dropped), waited, waited),
+        )
+
+    def acquire(self, level: Optional[str] = None) -> float:
+        """
+        Blocks until a token is available for the priority class and returns
+        the time spent waiting, in seconds. Fails open (no wait) when the
+        bucket file cannot be used, so a broken limiter never breaks a page.
+
+        Raises:
+            RateLimitTimeout: If no token can become available within MAX_WAIT.
+        """
+        level = level or current_priority()
+        start = time.monotonic()
+        max_wait = MAX_WAIT.get(level, MAX_WAIT[BACKGROUND])
+        deadline = start + max_wait
+
+        try:
+            wait = self._try_take(level, waiting=False)
+            slept = False
+            while wait:
+                if time.monotonic() + wait > deadline:
+                    # The token would come too late (e.g. after a long
+                    # Retry-After penalty): drop now instead of sleeping first.
+                    waited = time.monotonic() - start
+                    self._record_wait(level, waited, slept=slept, dropped=True)
+                    raise RateLimitTimeout(
+                        f"No '{self.name}' token for {level} request within {max_wait:.0f}s (next in {wait:.2f}s)"
+                    )
+                time.sleep(wait)
+                slept = True
+                wait = self._try_take(level, waiting=True)
+
+            waited = time.monotonic() - start
+            if waited > SLOW_WAIT_WARNING:
+                logger.warning(f"Rate limiter '{self.name}': {level} request waited {waited:.2f}s for a token")
+            self._record_wait(level, waited, slept=slept, dropped=False)
+        except sqlite3.Error as e:
+            waited = time.monotonic() - start
+            logger.error(f"Rate limiter '{self.name}' unavailable, proceeding without a token: {e}")
+        return waited
+
+    def under_pressure(self) -> bool:
+        """
+        Returns True when a background request would have to wait right now:
+        the bucket is below its background reserve or interactive requests
+        are queueing. Read-only, so it is cheap to call before optional work.
+        An unusable bucket file counts as pressure.
+        """
+        try:
+            row = self._connection().execute(
+                "SELECT tokens, updated, interactive_demand_until FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Rate limiter '{self.name}' unavailable: {e}")
+            return True
+        if not row:
+            return False
+        tokens, updated, demand_until = row
+        now = time.time()
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        return now < demand_until or tokens < 1.0 + self.burst * BACKGROUND_RESERVE
+
+    def penalize(self, retry_after: float) -> None:
+        """
+        Drains the bucket after an upstream 429 so every process backs off for
+        roughly `retry_after` seconds.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated, interactive_demand_until) "
+                "VALUES (?, ?, ?, COALESCE((SELECT interactive_demand_until FROM buckets WHERE name = ?), 0))",
+                (self.name, -retry_after * self.rate, time.time(), self.name),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def penalize_for(self, retry_after: Optional[str]) -> float:
+        """
+        Penalizes the bucket for a Retry-After header value, either seconds or
+        an HTTP date. Returns the back-off applied, in seconds.
+        """
+        delay = parse_retry_after(retry_after)
+        self.penalize(delay)
+        return delay
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns queue wait statistics per priority class, across all processes.
+        """
+        rows = self._connection().execute(
+            "SELECT priority, requests, waited, dropped, total_wait, max_wait FROM wait_stats WHERE name = ?",
+            (self.name,),
+        ).fetchall()
+        return {
+            level: {
+                "requests": requests,
+                "waited": waited,
+                "dropped": dropped,
+                "avg_wait_ms": round(total_wait / requests * 1000, 2) if requests else 0.0,
+                "max_wait_ms": round(max_wait * 1000, 2),
+            }
+            for level, requests, waited, dropped, total_wait, max_wait in rows
+        }
+
+    def reset_stats(self) -> None:
+        """
+        Clears the wait statistics of this bucket.
+        """
+        self._connection().execute("DELETE FROM wait_stats WHERE name = ?", (self.name,))
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """
+    Returns the seconds a Retry-After header asks to wait. Both forms are
+    accepted: delay-seconds ("120") and an HTTP date. Missing or invalid
+    values give `default`.
+    """
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+# The bucket shared by every TMDBService on this host.
+tmdb_bucket = TokenBucket("tmdb", rate=TMDB_RATE_LIMIT, burst=TMDB_RATE_BURST)
@@ -0,0 +1,108 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# --- Registry State ---
+# One instance per service name, per process. Factories are plain callables so
+# the heavy service modules are only imported when a service is first used.
+_factories: Dict[str, Callable[[], Any]] = {}
+_instances: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def register(name: str, factory: Callable[[], Any]) -> None:
+    """
+    Registers a factory for a named service. Replacing a factory also drops
+    any instance that was already built from the old one.
+    """
+    with _lock:
+        _factories[name] = factory
+        _instances.pop(name, None)
+
+
+def get(name: str) -> Any:
+    """
+    Returns the shared instance for a service, building it on first use.
+
+    Raises:
+        KeyError: If no factory was registered under this name.
+    """
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+
+    with _lock:
+        # Another thread may have built it while we waited for the lock.
+        instance = _instances.get(name)
+        if instance is None:
+            instance = _factories[name]()
+            _instances[name] = instance
+            logger.info(f"Initialized service '{name}'.")
+        return instance
+
+
+def reset(names: Optional[Iterable[str]] = None) -> None:
+    """
+    Drops built instances so the next call to get() creates fresh ones.
+    Call this in a post-fork hook so network clients are never shared
+    between worker processes.
+    """
+    with _lock:
+        for name in list(names if names is not None else _instances):
+            _instances.pop(name, None)
+
+
+def warm_up(instantiate: bool = False) -> None:
+    """
+    Pre-loads the service modules (and their SDKs) in the current process.
+
+    Pre-fork servers should call this in the master before forking so every
+    worker inherits the already imported modules. Instantiating is optional:
+    the Gemini client holds gRPC channels that are not fork-safe, so by default
+    instances are still built lazily inside each worker. The warm-start
+    snapshot is mapped here too, so forked workers share its pages.
+    """
+    from services import ai_google, snapshot, tmdb  # noqa: F401
+
+    ai_google.import_genai()
+    snapshot.load()
+
+    if instantiate:
+        for name in list(_factories):
+            try:
+                get(name)
+            except Exception as e:
+                # A missing API key should not stop the server from booting.
+                logger.error(f"Could not warm up service '{name}': {e}")
+
+
+# --- Built-in Services ---
+def _build_tmdb_service():
+    from services.tmdb import TMDBService
+    return TMDBService()
+
+
+def _build_ai_service():
+    from services.ai_google import AIGoogleService
+    return AIGoogleService()
+
+
+register("tmdb", _build_tmdb_service)
+register("ai_google", _build_ai_service)
+
+
+def get_tmdb_service():
+    """
+    Returns the process-wide TMDBService instance.
+    """
+    return get("tmdb")
+
+
+def get_ai_service():
+    """
+    Returns the process-wide AIGoogleService instance.
+    """
+    return get("ai_google")
@@ -0,0 +1,216 @@
+import os
+import mmap
+import json
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Where the snapshot is written by `manage.py build_snapshot` and read by workers.
+MIRAI_SNAPSHOT_PATH = os.getenv(
+    "MIRAI_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mirai.snapshot"),
+)
+SNAPSHOT_ENABLED = os.getenv("MIRAI_SNAPSHOT_ENABLED", "True").lower() in ('true', '1', 't')
+
+# --- File Format ---
+# All integers are little-endian. A file is a header, an index of fixed-size
+# records sorted by key hash (binary-searched in place), and the entries:
+#
+#   header: magic, format version, cache version, entry count, created_at (unix seconds)
+#   record: key hash, entry offset, entry length, expires_at, key length
+#   entry:  key (utf-8) followed by the zlib-compressed compact JSON value
+#
+# Readers reject files with another magic or version, so the format can change
+# without old workers misreading new files. The cache version
+# (services.cache.CACHE_VERSION) is checked the same way: bumping it to retire
+# every cached value must retire the snapshot's values too.
+MAGIC = b"MIRAISNP"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sHIIQ")
+RECORD = struct.Struct("<QQIIH")
+
+
+def _key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+def _current_cache_version() -> int:
+    # Imported here: services.cache reads through this module.
+    from services.cache import CACHE_VERSION
+    return CACHE_VERSION
+
+
+def write(
+    path: str, entries: Iterable[Tuple[str, Any, int]], created_at: Optional[int] = None, cache_version: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Writes (key, value, ttl) entries to a snapshot file for a cache version
+    (the current one by default). Each entry stays valid for `ttl` seconds
+    after `created_at`. The file is written next to its destination and moved
+    into place, so readers never see a partial file.
+    Returns the number of entries and the file size in bytes.
+    """
+    created_at = int(created_at or time.time())
+    cache_version = _current_cache_version() if cache_version is None else cache_version
+    blobs = []
+    for key, value, ttl in entries:
+        key_bytes = key.encode()
+        payload = zlib.compress(json.dumps(value, separators=(",", ":")).encode(), 6)
+        blobs.append((_key_hash(key), key_bytes, payload, created_at + int(ttl)))
+    blobs.sort(key=lambda blob: blob[0])
+
+    offset = HEADER.size + RECORD.size * len(blobs)
+    records, data = [], []
+    for key_hash, key_bytes, payload, expires_at in blobs:
+        length = len(key_bytes) + len(payload)
+        records.append(RECORD.pack(key_hash, offset, length, expires_at, len(key_bytes)))
+        data.append(key_bytes + payload)
+        offset += length
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, cache_version, len(blobs), created_at))
+        f.writelines(records)
+        f.writelines(data)
+    os.replace(tmp_path, path)
+    return {"entries": len(blobs), "bytes": offset}
+
+
+class Snapshot:
+    """
+    A read-only, memory-mapped snapshot file.
+
+    Nothing is parsed up front: lookups binary-search the index inside the
+    mapping and decode only the entry they need. Mapped before the server
+    forks, the file's pages are shared by every worker through the OS page
+    cache instead of being copied into each process.
+    """
+
+    def __init__(self, path: str, cache_version: Optional[int] = None):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._check_header(cache_version)
+        except ValueError:
+            self._map.close()
+            raise
+        self._hashes = _IndexHashes(self._map, self.count)
+
+    def _check_header(self, cache_version: Optional[int]) -> None:
+        if len(self._map) < HEADER.size:
+            raise ValueError("file is too short")
+        magic, version, self.cache_version, self.count, self.created_at = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("not a MirAI snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"format version {version}, expected {FORMAT_VERSION}")
+        expected = _current_cache_version() if cache_version is None else cache_version
+        if self.cache_version != expected:
+            raise ValueError(f"built for cache version {self.cache_version}, expected {expected}")
+        if len(self._map) < HEADER.size + RECORD.size * self.count:
+            raise ValueError("index is truncated")
+
+    def _record(self, index: int) -> Tuple[int, int, int, int, int]:
+        return RECORD.unpack_from(self._map, HEADER.size + RECORD.size * index)
+
+    def lookup(self, key: str, now: Optional[float] = None) -> Optional[Tuple[Any, int]]:
+        """
+        Returns (value, seconds of validity left) for a key, or None if the
+        key is missing or its entry has expired.
+        """
+        key_hash, key_bytes = _key_hash(key), key.encode()
+        index = bisect_left(self._hashes, key_hash)
+        now = now or time.time()
+        while index < self.count:
+            record_hash, offset, length, expires_at, key_length = self._record(index)
+            if record_hash != key_hash:
+                return None
+            if self._map[offset:offset + key_length] == key_bytes:
+                if expires_at <= now:
+                    return None
+                value = json.loads(zlib.decompress(self._map[offset + key_length:offset + length]))
+                return value, int(expires_at - now)
+            index += 1
+        return None
+
+    def items(self) -> Iterable[Tuple[str, Any, int]]:
+        """
+        Yields every (key, value, expires_at) entry, in index order.
+        """
+        for index in range(self.count):
+            _, offset, length, expires_at, key_length = self._record(index)
+            key = self._map[offset:offset + key_length].decode()
+            yield key, json.loads(zlib.decompress(self._map[offset + key_length:offset + length])), expires_at
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class _IndexHashes:
+    """
+    A read-only sequence view of the key hashes in a snapshot index, so
+    bisect can search the mapping without copying the index.
+    """
+
+    def __init__(self, buffer: mmap.mmap, count: int):
+        self._buffer = buffer
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> int:
+        return struct.unpack_from("<Q", self._buffer, HEADER.size + RECORD.size * index)[0]
+
+
+# --- Process-wide Snapshot ---
+_snapshot: Optional[Snapshot] = None
+_loaded = False
+_lock = threading.Lock()
+
+
+def load(path: str = MIRAI_SNAPSHOT_PATH) -> Optional[Snapshot]:
+    """
+    Maps the snapshot file for this process (and, when called before a fork,
+    for its children). A missing or unreadable file just disables the
+    snapshot. Calling it again re-maps the file, e.g. after a rebuild.
+    """
+    global _snapshot, _loaded
+    with _lock:
+        previous, _snapshot, _loaded = _snapshot, None, True
+        if SNAPSHOT_ENABLED and os.path.exists(path):
+            try:
+                _snapshot = Snapshot(path)
+                logger.info(f"Mapped snapshot {path} ({_snapshot.count} entries).")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring snapshot {path}: {e}")
+        if previous is not None:
+            previous.close()
+    return _snapshot
+
+
+def lookup(key: str) -> Optional[Tuple[Any, int]]:
+    """
+    Returns (value, seconds of validity left) for a key from the mapped
+    snapshot, mapping it on first use. None if there is no usable entry.
+    """
+    if not _loaded:
+        load()
+    snapshot = _snapshot
+    if snapshot is None:
+        return None
+    try:
+        return snapshot.lookup(key)
+    except (ValueError, zlib.error) as e:
+        logger.warning(f"Could not read '{key}' from the snapshot: {e}")
+        return None
@@ -1,8 +1,11 @@
 import os
+import hashlib
 import requests
 import logging
 from dotenv import load_dotenv
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+
+from services import cache, prefetch, profiling, ratelimit
 
 # --- Setup ---
 # Load environment variables from .env file.
@@ -17,6 +20,52 @@ logger = logging.getLogger(__name__)
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 TMDB_BASE_URL = os.getenv("TMDB_API_URL", "https://api.themoviedb.org/3")
 
+# Fields needed to render a movie card (see templates/components/movie_card.html).
+CARD_FIELDS = ("id", "title", "poster_path", "release_date", "vote_average")
+
+# How long the compact per-movie ranking features are cached, in seconds.
+FEATURES_CACHE_TTL = 60 * 60 * 24
+
+# Cache lifetimes of the movie detail sub-resources, in seconds. Core details
+# (ratings, runtime) change more often than cast lists or artwork.
+MOVIE_CORE_CACHE_TTL = 60 * 60 * 6
+MOVIE_CREDITS_CACHE_TTL = 60 * 60 * 24 * 7
+MOVIE_VIDEOS_CACHE_TTL = 60 * 60 * 24
+MOVIE_IMAGES_CACHE_TTL = 60 * 60 * 24 * 7
+
+# Cache lifetimes of list pages (trending, popular, discover, search) and of
+# the genre list, in seconds.
+LIST_CACHE_TTL = 60 * 10
+GENRES_CACHE_TTL = 60 * 60 * 24
+
+# Number of cast members kept in the cached credits.
+TOP_CAST_SIZE = 10
+
+# --- Languages ---
+# TMDB language codes of the site languages (settings.LANGUAGES). Everything
+# is fetched and cached once in the default language; other languages only
+# add small per-movie text overlays (see get_movie_text).
+DEFAULT_LANGUAGE = "en-US"
+SUPPORTED_LANGUAGES = {"en": "en-US", "id": "id-ID"}
+
+# Fields that differ per language; everything else (ids, ratings, posters,
+# credits, dates) is language-neutral.
+LOCALIZED_FIELDS = ("title", "overview", "tagline")
+
+# How long per-language movie texts are cached, in seconds.
+MOVIE_TEXT_CACHE_TTL = 60 * 60 * 24 * 7
+
+
+def resolve_language(language: Optional[str] = None) -> str:
+    """
+    Returns the TMDB language code for a language ('id', 'id-ID', 'en-us'),
+    defaulting to the language active for the current request.
+    """
+    if language is None:
+        from django.utils import translation
+        language = translation.get_language() or DEFAULT_LANGUAGE
+    return SUPPORTED_LANGUAGES.get(language.split("-")[0].lower(), DEFAULT_LANGUAGE)
+
 # --- Service Class ---
 class TMDBService:
     """
@@ -34,6 +83,7 @@ class TMDBService:
         self.api_key = TMDB_API_KEY
         self.base_url = TMDB_BASE_URL
 
+    @profiling.traced("tmdb")
     def _make_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
         """
         A private helper method to make requests to the TMDB API.
@@ -47,6 +97,10 @@ class TMDBService:
                                       or None if an error occurs.
         """
         url = f"{self.base_url}/{endpoint}"
+
+        # Cache probes (services.cache.peek_only) must never reach the API.
+        if cache.is_peeking():
+            return None
         
         # Prepare parameters, ensuring the API key is always included
         request_params = {"api_key": self.api_key}
@@ -54,10 +108,19 @@ class TMDBService:
             request_params.update(params)
 
         try:
+            # Wait for a token from the host-wide TMDB rate limiter. Background
+            # requests give way to interactive ones; any request that waits too
+            # long is dropped.
+            ratelimit.tmdb_bucket.acquire()
             response = requests.get(url, params=request_params, timeout=10)
+            if response.status_code == 429:
+                # Make every worker back off, not just this one.
+                ratelimit.tmdb_bucket.penalize_for(response.headers.get("Retry-After"))
             # Raises an HTTPError for bad responses (4xx or 5xx)
             response.raise_for_status()  
             return response.json()
+        except ratelimit.RateLimitTimeout as e:
+            logger.warning(f"Skipped request for {url}: {e}")
         except requests.exceptions.HTTPError as e:
             logger.error(f"HTTP Error for {url}: {e.response.status_code} - {e.response.text}")
         except requests.exceptions.RequestException as e:
@@ -69,50 +132,90 @@ class TMDBService:
             
         return None
 
-    def search_movies(self, query: str, page: int = 1) -> Optional[Dict[str, Any]]:
+    def _cached_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None, ttl: int = LIST_CACHE_TTL) -> Optional[Dict[str, Any]]:
+        """
+        Same as _make_request, but the response is cached for `ttl` seconds.
+        """
+        query = "&".join(f"{key}={value}" for key, value in sorted((params or {}).items()))
+        key = f"tmdb:{endpoint}?{query}"
+        if len(key) > 200:
+            # Long search queries would exceed cache key limits (e.g. memcached's 250).
+            key = f"tmdb:{endpoint}#{hashlib.sha1(query.encode()).hexdigest()}"
+        return cache.get_or_set(key, lambda: self._make_request(endpoint, params), ttl)
+
+    def _cached_list(self, endpoint: str, params: Optional[Dict[str, Any]] = None, language: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns a cached list page (fetched once, in the default language)
+        with its movie titles and overviews in the requested language.
+        """
+        data = self._cached_request(endpoint, params)
+        if not data or resolve_language(language) == DEFAULT_LANGUAGE:
+            return data
+        return dict(data, results=self.localize_cards(data.get("results", []), language))
+
+    def search_movies(self, query: str, page: int = 1, language: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Searches for movies on TMDB based on a query string.
         Corresponds to: GET /search/movie
         """
         params = {"query": query, "page": page, "include_adult": "false"}
-        return self._make_request("search/movie", params)
+        return self._cached_list("search/movie", params, language)
+
+    def find_movie(self, title: str, year: Optional[Any] = None, preferred_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Resolves a title (and optionally its release year) to the card fields
+        of the best matching TMDB movie, or None if the search finds nothing.
+        A result with `preferred_id` or the right year wins over the top hit.
+        """
+        # Searched directly, so matching and the stored title stay in the default language.
+        params = {"query": title, "page": 1, "include_adult": "false"}
+        results = (self._cached_request("search/movie", params) or {}).get("results", [])
+        if not results:
+            return None
+        year = str(year or "")
+        for movie in results:
+            if movie["id"] == preferred_id or (year and (movie.get("release_date") or "").startswith(year)):
+                break
+        else:
+            movie = results[0]
+        return {field: movie.get(field) for field in CARD_FIELDS}
 
-    def get_trending_movies(self, time_window: str = 'week', page: int = 1) -> Optional[Dict[str, Any]]:
+    def get_trending_movies(self, time_window: str = 'week', page: int = 1, language: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Gets the trending movies on TMDB for a given time window ('day' or 'week').
         Corresponds to: GET /trending/movie/{time_window}
         """
         if time_window not in ['day', 'week']:
             raise ValueError("time_window must be either 'day' or 'week'")
-        return self._make_request(f"trending/movie/{time_window}", {"page": page})
+        return self._cached_list(f"trending/movie/{time_window}", {"page": page}, language)
 
-    def get_popular_movies(self, page: int = 1) -> Optional[Dict[str, Any]]:
+    def get_popular_movies(self, page: int = 1, language: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Gets a list of the current popular movies on TMDB.
         Corresponds to: GET /movie/popular
         """
-        return self._make_request("movie/popular", {"page": page})
+        return self._cached_list("movie/popular", {"page": page}, language)
 
-    def get_top_rated_movies(self, page: int = 1) -> Optional[Dict[str, Any]]:
+    def get_top_rated_movies(self, page: int = 1, language: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Gets a list of the top-rated movies on TMDB.
         Corresponds to: GET /movie/top_rated
         """
-        return self._make_request("movie/top_rated", {"page": page})
+        return self._cached_list("movie/top_rated", {"page": page}, language)
 
-    def get_now_playing_movies(self, page: int = 1) -> Optional[Dict[str, Any]]:
+    def get_now_playing_movies(self, page: int = 1, language: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Gets a list of movies that are currently playing in theaters.
         Corresponds to: GET /movie/now_playing
         """
-        return self._make_request("movie/now_playing", {"page": page})
+        return self._cached_list("movie/now_playing", {"page": page}, language)
 
-    def get_upcoming_movies(self, page: int = 1) -> Optional[Dict[str, Any]]:
+    def get_upcoming_movies(self, page: int = 1, language: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Gets a list of upcoming movies in theaters.
         Corresponds to: GET /movie/upcoming
         """
-        return self._make_request("movie/upcoming", {"page": page})
+        return self._cached_list("movie/upcoming", {"page": page}, language)
 
     def get_movie_details(self, movie_id: int, append_to_response: str = "videos,credits,images") -> Optional[Dict[str, Any]]:
         """
@@ -123,7 +226,169 @@ class TMDBService:
         params = {"append_to_response": append_to_response}
         return self._make_request(f"movie/{movie_id}", params)
 
-    def discover_movies(self, genre: Optional[str] = None, year: Optional[int] = None, rating: Optional[float] = None, page: int = 1) -> Optional[Dict[str, Any]]:
+    def _movie_resource(self, movie_id: int, name: str, loader, ttl: int, fetch: bool) -> Optional[Dict[str, Any]]:
+        """
+        Returns one cached sub-resource of a movie. With fetch=False only the
+        cache is consulted and None is returned on a miss.
+        """
+        key = f"tmdb:movie:{movie_id}:{name}"
+        if not fetch:
+            return cache.get(key)
+        return cache.get_or_set(key, loader, ttl)
+
+    def get_movie_core(self, movie_id: int, fetch: bool = True, language: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Gets the primary information for a movie without any appended resources.
+        The details are cached once; in another language the localized text
+        and genre names are merged in at read time.
+        Corresponds to: GET /movie/{movie_id}
+        """
+        core = self._movie_resource(
+            movie_id, "core", lambda: self._make_request(f"movie/{movie_id}"), MOVIE_CORE_CACHE_TTL, fetch
+        )
+        language = resolve_language(language)
+        if not core or language == DEFAULT_LANGUAGE:
+            return core
+
+        core = self.localize_cards([core], language)[0]
+        genres = {genre["id"]: genre["name"] for genre in (self.get_genres(language) or {}).get("genres", [])}
+        core["genres"] = [dict(genre, name=genres.get(genre["id"], genre["name"])) for genre in core.get("genres", [])]
+        return core
+
+    def get_movie_text(self, movie_id: int, language: str) -> Optional[Dict[str, str]]:
+        """
+        Gets the localized title, overview and tagline of a movie. One
+        translations call caches the texts of every supported language, so
+        a movie costs one extra request however many languages are served.
+        Fields without a translation are left out (the default text is used).
+        Corresponds to: GET /movie/{movie_id}/translations
+        """
+        language = resolve_language(language)
+
+        def load():
+            data = self._make_request(f"movie/{movie_id}/translations")
+            if data is None:
+                return None
+            texts = {code: {} for code in SUPPORTED_LANGUAGES.values() if code != DEFAULT_LANGUAGE}
+            for translation in data.get("translations", []):
+                code = f"{translation.get('iso_639_1')}-{translation.get('iso_3166_1')}"
+                fallback = SUPPORTED_LANGUAGES.get(translation.get("iso_639_1"))
+                for target in (code, fallback):
+                    # An exact region match wins over another region of the language.
+                    if target in texts and (target == code or not texts[target]):
+                        texts[target] = {
+                            field: value for field, value in (translation.get("data") or {}).items()
+                            if field in LOCALIZED_FIELDS and value
+                        }
+            for code, text in texts.items():
+                if code != language:
+                    cache.set(f"tmdb:movie:{movie_id}:text:{code}", text, MOVIE_TEXT_CACHE_TTL)
+            return texts.get(language, {})
+
+        return cache.get_or_set(f"tmdb:movie:{movie_id}:text:{language}", load, MOVIE_TEXT_CACHE_TTL)
+
+    def localize_cards(self, movies: List[Dict[str, Any]], language: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Returns copies of movie dicts (list results, cards, core details) with
+        their text in the given language, from cached per-movie texts only.
+        Movies without cached texts keep the default text and their
+        translations are queued for a background fill, so the next view is
+        localized without this one waiting on TMDB.
+        """
+        language = resolve_language(language)
+        if language == DEFAULT_LANGUAGE or not movies:
+            return movies
+
+        keys = {movie["id"]: f"tmdb:movie:{movie['id']}:text:{language}" for movie in movies}
+        texts = cache.get_many(keys.values())
+        localized, missing = [], []
+        for movie in movies:
+            text = texts.get(keys[movie["id"]])
+            if text is None:
+                missing.append(movie["id"])
+                text = {}
+            localized.append(dict(movie, **text))
+        if missing:
+            prefetch.prefetch_translations(missing, language)
+        return localized
+
+    def get_movie_credits(self, movie_id: int, fetch: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Gets the top-billed cast of a movie, trimmed to what the detail page shows.
+        Corresponds to: GET /movie/{movie_id}/credits
+        """
+        def load():
+            credits = self._make_request(f"movie/{movie_id}/credits")
+            if credits is None:
+                return None
+            cast = [
+                {field: person.get(field) for field in ("id", "name", "character", "profile_path")}
+                for person in credits.get("cast", [])[:TOP_CAST_SIZE]
+            ]
+            return {"cast": cast}
+
+        return self._movie_resource(movie_id, "credits", load, MOVIE_CREDITS_CACHE_TTL, fetch)
+
+    def get_movie_videos(self, movie_id: int, fetch: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Gets a movie's official trailer, picked once when the cache is filled.
+        Returns {"trailer": {...}} or {"trailer": None} if there is none.
+        Corresponds to: GET /movie/{movie_id}/videos
+        """
+        def load():
+            videos = self._make_request(f"movie/{movie_id}/videos")
+            if videos is None:
+                return None
+            trailer = next(
+                (video for video in videos.get("results", []) if video.get("type") == "Trailer" and video.get("official")),
+                None,
+            )
+            if trailer:
+                trailer = {field: trailer.get(field) for field in ("key", "name", "site")}
+            return {"trailer": trailer}
+
+        return self._movie_resource(movie_id, "videos", load, MOVIE_VIDEOS_CACHE_TTL, fetch)
+
+    def get_movie_images(self, movie_id: int, fetch: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Gets the posters and backdrops of a movie. Only fetched on demand.
+        Corresponds to: GET /movie/{movie_id}/images
+        """
+        return self._movie_resource(
+            movie_id, "images", lambda: self._make_request(f"movie/{movie_id}/images"), MOVIE_IMAGES_CACHE_TTL, fetch
+        )
+
+    def get_movie_features(self, movie_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Gets a compact, cached summary of a movie used for local ranking:
+        its card fields, genre/keyword/cast ids and TMDB's own recommendations.
+        Everything comes from a single details call.
+        Corresponds to: GET /movie/{movie_id}?append_to_response=keywords,credits,recommendations
+        """
+        def load():
+            details = self.get_movie_details(movie_id, append_to_response="keywords,credits,recommendations")
+            if not details:
+                return None
+            features = {field: details.get(field) for field in CARD_FIELDS}
+            features["genres"] = [genre["id"] for genre in details.get("genres", [])]
+            features["keywords"] = [keyword["id"] for keyword in details.get("keywords", {}).get("keywords", [])][:20]
+            features["cast"] = [person["id"] for person in details.get("credits", {}).get("cast", [])][:10]
+            features["recommendations"] = [
+                dict({field: movie.get(field) for field in CARD_FIELDS}, genre_ids=movie.get("genre_ids", []))
+                for movie in details.get("recommendations", {}).get("results", [])
+            ]
+            return features
+
+        return cache.get_or_set(f"tmdb:features:{movie_id}", load, FEATURES_CACHE_TTL)
+
+    def peek_movie_features(self, movie_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached ranking features for a movie, or None if they have
+        not been fetched yet. Never calls the API.
+        """
+        return cache.get(f"tmdb:features:{movie_id}")
+
+    def discover_movies(self, genre: Optional[str] = None, year: Optional[int] = None, rating: Optional[float] = None, page: int = 1, language: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Discovers movies based on filters like genre, year, and rating.
         Corresponds to: GET /discover/movie
@@ -136,14 +401,17 @@ class TMDBService:
         if rating:
             params["vote_average.gte"] = rating
         
-        return self._make_request("discover/movie", params)
+        return self._cached_list("discover/movie", params, language)
 
-    def get_genres(self) -> Optional[Dict[str, Any]]:
+    def get_genres(self, language: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
-        Gets the official list of movie genres from TMDB.
+        Gets the official list of movie genres from TMDB, with names in the
+        given language (one small cached list per language).
         Corresponds to: GET /genre/movie/list
         """
-        return self._make_request("genre/movie/list")
+        language = resolve_language(language)
+        params = {"language": language} if language != DEFAULT_LANGUAGE else None
+        return self._cached_request("genre/movie/list", params, ttl=GENRES_CACHE_TTL)
 
 # --- Example Usage (for testing) ---
 # if __name__ == '__main__':